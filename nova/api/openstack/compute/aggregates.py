@@ -202,6 +202,26 @@ class AggregateController(wsgi.Controller):
 
         return self._marshall_aggregate(req, aggregate)
 
+    @wsgi.Controller.api_version("2.43")
+    @wsgi.response(202)
+    @extensions.expected_errors((400, 404))
+    @wsgi.action('cache_images')
+    @validation.schema(aggregates.cache_images)
+    def _cache_images(self, req, id, body):
+        """Downloads images into the image cache of the hosts of the
+        specified aggregate.
+        """
+        context = _get_context(req)
+        context.can(aggr_policies.POLICY_ROOT % 'cache_images')
+
+        image_ids = [image['id'] for image in body['cache_images']['images']]
+        try:
+            self.api.cache_images(context, id, image_ids)
+        except exception.AggregateNotFound as e:
+            raise exc.HTTPNotFound(explanation=e.format_message())
+        except exception.ImageNotFound as e:
+            raise exc.HTTPBadRequest(explanation=e.format_message())
+
     def _marshall_aggregate(self, req, aggregate):
         _aggregate = {}
         for key, value in self._build_aggregate_items(req, aggregate):
@@ -129,3 +129,32 @@ set_metadata = {
     'required': ['set_metadata'],
     'additionalProperties': False,
 }
+
+
+cache_images = {
+    'type': 'object',
+    'properties': {
+        'cache_images': {
+            'type': 'object',
+            'properties': {
+                'images': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'id': parameter_types.image_id,
+                        },
+                        'required': ['id'],
+                        'additionalProperties': False,
+                    },
+                    'minItems': 1,
+                    'uniqueItems': True,
+                },
+            },
+            'required': ['images'],
+            'additionalProperties': False,
+        },
+    },
+    'required': ['cache_images'],
+    'additionalProperties': False,
+}
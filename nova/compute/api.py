@@ -4467,6 +4467,8 @@ class AggregateAPI(base.Base):
     """Sub-set of the Compute Manager API for managing host aggregates."""
     def __init__(self, **kwargs):
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
+        self.compute_task_api = conductor.ComputeTaskAPI()
+        self.image_api = image.API()
         self.scheduler_client = scheduler_client.SchedulerClient()
         super(AggregateAPI, self).__init__(**kwargs)
 
@@ -4486,6 +4488,21 @@ class AggregateAPI(base.Base):
         """Get an aggregate by id."""
         return objects.Aggregate.get_by_id(context, aggregate_id)
 
+    def cache_images(self, context, aggregate_id, image_ids):
+        """Download images into the image cache of the hosts of an
+        aggregate.
+
+        The images are downloaded asynchronously by the conductor, one host
+        after the other by default.
+
+        :raises: AggregateNotFound, ImageNotFound
+        """
+        aggregate = objects.Aggregate.get_by_id(context, aggregate_id)
+        # Fail early on images the hosts would not find.
+        for image_id in image_ids:
+            self.image_api.get(context, image_id)
+        self.compute_task_api.cache_images(context, aggregate, image_ids)
+
     def get_aggregate_list(self, context):
         """Get all the aggregates."""
         return objects.AggregateList.get_all(context)
@@ -58,6 +58,7 @@ from nova.cloudpipe import pipelib
 from nova import compute
 from nova.compute import build_results
 from nova.compute import claims
+from nova.compute import periodic
 from nova.compute import power_state
 from nova.compute import resource_tracker
 from nova.compute import rpcapi as compute_rpcapi
@@ -198,6 +199,9 @@ def wrap_instance_fault(function):
 
     @functools.wraps(function)
     def decorated_function(self, context, *args, **kwargs):
+        # The instance is changing, the periodic tasks must list it again,
+        # including when they listed it while the operation was running.
+        self._instance_cache.invalidate()
         try:
             return function(self, context, *args, **kwargs)
         except exception.InstanceNotFound:
@@ -212,6 +216,8 @@ def wrap_instance_fault(function):
             with excutils.save_and_reraise_exception():
                 compute_utils.add_instance_fault_from_exc(context,
                         kwargs['instance'], e, sys.exc_info())
+        finally:
+            self._instance_cache.invalidate()
 
     return decorated_function
 
@@ -473,20 +479,33 @@ class ComputeVirtAPI(virtapi.VirtAPI):
                 # but don't stick around if not.
                 deadline = 0
         yield
-        with eventlet.timeout.Timeout(deadline):
-            for event_name, event in events.items():
-                actual_event = event.wait()
-                if actual_event.status == 'completed':
-                    continue
-                decision = error_callback(event_name, instance)
-                if decision is False:
-                    break
+
+        def _wait_for_events():
+            with eventlet.timeout.Timeout(deadline):
+                for event_name, event in events.items():
+                    actual_event = event.wait()
+                    if actual_event.status == 'completed':
+                        continue
+                    decision = error_callback(event_name, instance)
+                    if decision is False:
+                        break
+
+        # Only the builds record the wait, as a stage of their timeline.
+        if (CONF.build_timeline and
+                instance.vm_state == vm_states.BUILDING and
+                instance.task_state == task_states.SPAWNING):
+            with compute_utils.timeline_event(
+                    instance._context, 'compute_wait_for_instance_event',
+                    instance):
+                _wait_for_events()
+        else:
+            _wait_for_events()
 
 
 class ComputeManager(manager.Manager):
     """Manages the running instances from creation to destruction."""
 
-    target = messaging.Target(version='4.13')
+    target = messaging.Target(version='4.14')
 
     # How long to wait in seconds before re-issuing a shutdown
     # signal to an instance during power off.  The overall
@@ -516,6 +535,7 @@ class ComputeManager(manager.Manager):
         self._sync_power_pool = eventlet.GreenPool(
             size=CONF.sync_power_state_pool_size)
         self._syncs_in_progress = {}
+        self._last_power_state_sweep = 0
         self.send_instance_updates = (
             CONF.filter_scheduler.track_instance_changes)
         if CONF.max_concurrent_builds != 0:
@@ -528,6 +548,12 @@ class ComputeManager(manager.Manager):
                 CONF.max_concurrent_live_migrations)
         else:
             self._live_migration_semaphore = compute_utils.UnlimitedSemaphore()
+        self._image_stage = compute_utils.BuildStage(
+            'image download', CONF.max_concurrent_image_downloads)
+        self._network_stage = compute_utils.BuildStage(
+            'network allocation', CONF.max_concurrent_network_allocations)
+        self._spawn_stage = compute_utils.BuildStage(
+            'spawn', CONF.max_concurrent_spawns)
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -538,12 +564,26 @@ class ComputeManager(manager.Manager):
         self.driver = driver.load_compute_driver(self.virtapi, compute_driver)
         self.use_legacy_block_device_info = \
                             self.driver.need_legacy_block_device_info
+        self._instance_cache = periodic.HostInstanceCache(self.host)
+        self._periodic_scheduler = None
+        if CONF.periodic_task_workers:
+            self._periodic_scheduler = periodic.PeriodicTaskScheduler(
+                self, CONF.periodic_task_workers)
 
     def reset(self):
         LOG.info(_LI('Reloading compute RPC API'))
         compute_rpcapi.LAST_VERSION = None
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
 
+    def periodic_tasks(self, context, raise_on_error=False):
+        """Tasks to be run at a periodic interval."""
+        self._instance_cache.invalidate()
+        # Errors are only raised when the tasks run one after the other.
+        if self._periodic_scheduler and not raise_on_error:
+            return self._periodic_scheduler.run_periodic_tasks(context)
+        return super(ComputeManager, self).periodic_tasks(
+            context, raise_on_error=raise_on_error)
+
     def _get_resource_tracker(self):
         if not self._resource_tracker:
             rt = resource_tracker.ResourceTracker(self.host, self.driver)
@@ -741,6 +781,46 @@ class ComputeManager(manager.Manager):
                        ram=-mem_mb)
         return quotas
 
+    def _init_instances(self, context, instances):
+        """Initialize the instances of the host during service init.
+
+        Up to CONF.init_host_workers instances are initialized at the same
+        time, and the progress is logged about every tenth of the instances.
+        """
+        total = len(instances)
+        if not total:
+            return
+        timer = timeutils.StopWatch()
+        timer.start()
+        step = max(1, total // 10)
+        done = [0]
+
+        def init_instance(instance):
+            try:
+                self._init_instance(context, instance)
+            finally:
+                done[0] += 1
+                if done[0] % step == 0 or done[0] == total:
+                    LOG.info(_LI('Initialized %(done)d of %(total)d '
+                                 'instances in %(elapsed).2f seconds'),
+                             {'done': done[0], 'total': total,
+                              'elapsed': timer.elapsed()})
+
+        workers = min(CONF.init_host_workers, total)
+        if workers == 1:
+            for instance in instances:
+                init_instance(instance)
+            return
+
+        pool = eventlet.GreenPool(workers)
+        threads = [pool.spawn(init_instance, instance)
+                   for instance in instances]
+        pool.waitall()
+        # Like the serial initialization, fail on the first error, but only
+        # once the other instances have been initialized.
+        for thread in threads:
+            thread.wait()
+
     def _init_instance(self, context, instance):
         '''Initialize this instance during service init.'''
 
@@ -1144,8 +1224,7 @@ class ComputeManager(manager.Manager):
         try:
             # checking that instance was not already evacuated to other host
             self._destroy_evacuated_instances(context)
-            for instance in instances:
-                self._init_instance(context, instance)
+            self._init_instances(context, instances)
         finally:
             if CONF.defer_iptables_apply:
                 self.driver.filter_defer_apply_off()
@@ -1355,9 +1434,22 @@ class ComputeManager(manager.Manager):
         building_insts = objects.InstanceList.get_by_filters(context,
                            filters, expected_attrs=[], use_slave=True)
 
+        timed_out = []
         for instance in building_insts:
             if timeutils.is_older_than(instance.created_at, timeout):
-                self._set_instance_obj_error_state(context, instance)
+                instance.vm_state = vm_states.ERROR
+                timed_out.append(instance)
+        if not timed_out:
+            return
+
+        # Save all of the timed out instances in a single transaction rather
+        # than one per instance.
+        not_saved = building_insts.save()
+        for instance in timed_out:
+            if instance.uuid in not_saved:
+                LOG.debug('Instance has been destroyed from under us while '
+                          'trying to set it to ERROR', instance=instance)
+            else:
                 LOG.warning(_LW("Instance build timed out. Set to error "
                                 "state."), instance=instance)
 
@@ -1387,13 +1479,17 @@ class ComputeManager(manager.Manager):
         bind_host_id = self.driver.network_binding_host_id(context, instance)
         for attempt in range(1, attempts + 1):
             try:
-                nwinfo = self.network_api.allocate_for_instance(
-                        context, instance, vpn=is_vpn,
-                        requested_networks=requested_networks,
-                        macs=macs,
-                        security_groups=security_groups,
-                        dhcp_options=dhcp_options,
-                        bind_host_id=bind_host_id)
+                # Each attempt records its own event, which it finishes.
+                allocate_event = compute_utils.timeline_event(
+                    context, 'compute_allocate_network', instance)
+                with allocate_event, self._network_stage.start(instance):
+                    nwinfo = self.network_api.allocate_for_instance(
+                            context, instance, vpn=is_vpn,
+                            requested_networks=requested_networks,
+                            macs=macs,
+                            security_groups=security_groups,
+                            dhcp_options=dhcp_options,
+                            bind_host_id=bind_host_id)
                 LOG.debug('Instance network_info: |%s|', nwinfo,
                           instance=instance)
                 instance.system_metadata['network_allocated'] = 'True'
@@ -1702,6 +1798,7 @@ class ComputeManager(manager.Manager):
             # locked because we could wait in line to build this instance
             # for a while and we want to make sure that nothing else tries
             # to do anything with this instance while we wait.
+            self._cache_build_image(context, instance, block_device_mapping)
             with self._build_semaphore:
                 self._do_build_and_run_instance(*args, **kwargs)
 
@@ -1714,6 +1811,37 @@ class ComputeManager(manager.Manager):
                       requested_networks, security_groups,
                       block_device_mapping, node, limits)
 
+    def _cache_build_image(self, context, instance, block_device_mapping):
+        """Download the image of an instance to build into the image cache.
+
+        This is done before the build counts against max_concurrent_builds,
+        so that slow image downloads do not hold up the builds of instances
+        whose image is already cached. Any failure is left for the spawn of
+        the instance to handle.
+        """
+        if not CONF.max_concurrent_image_downloads or not instance.image_ref:
+            return
+        root_bdm = block_device.get_root_bdm(block_device_mapping or [])
+        if root_bdm is not None and root_bdm.destination_type == 'volume':
+            return
+        cache_event = compute_utils.timeline_event(
+            context, 'compute_cache_image', instance)
+        try:
+            with cache_event, self._image_stage.start(instance):
+                with timeutils.StopWatch() as timer:
+                    downloaded = self.driver.cache_image(context,
+                                                         instance.image_ref)
+            if downloaded:
+                LOG.info(_LI('Took %0.2f seconds to download the image of '
+                             'the instance.'), timer.elapsed(),
+                         instance=instance)
+        except NotImplementedError:
+            pass
+        except Exception:
+            LOG.warning(_LW('Failed to download the image of the instance '
+                            'before the build, it will be downloaded while '
+                            'spawning it.'), exc_info=True, instance=instance)
+
     def _check_device_tagging(self, requested_networks, block_device_mapping):
         tagging_requested = False
         if requested_networks:
@@ -1918,7 +2046,11 @@ class ComputeManager(manager.Manager):
                     network_info = resources['network_info']
                     LOG.debug('Start spawning the instance on the hypervisor.',
                               instance=instance)
-                    with timeutils.StopWatch() as timer:
+                    spawn_event = compute_utils.timeline_event(
+                        context, 'compute_spawn', instance)
+                    spawn_stage = self._spawn_stage.start(instance)
+                    timer = timeutils.StopWatch()
+                    with spawn_event, spawn_stage, timer:
                         self.driver.spawn(context, instance, image_meta,
                                           injected_files, admin_password,
                                           network_info=network_info,
@@ -2089,8 +2221,10 @@ class ComputeManager(manager.Manager):
             instance.task_state = task_states.BLOCK_DEVICE_MAPPING
             instance.save()
 
-            block_device_info = self._prep_block_device(context, instance,
-                    block_device_mapping)
+            with compute_utils.timeline_event(
+                    context, 'compute_prep_block_device', instance):
+                block_device_info = self._prep_block_device(context,
+                        instance, block_device_mapping)
             resources['block_device_info'] = block_device_info
         except (exception.InstanceNotFound,
                 exception.UnexpectedDeletingTaskStateError):
@@ -4178,6 +4312,55 @@ class ComputeManager(manager.Manager):
         """Returns the result of calling "uptime" on the target host."""
         return self.driver.get_host_uptime()
 
+    @wrap_exception()
+    def cache_images(self, context, image_ids):
+        """Download images into the image cache of the driver.
+
+        The images go through the image download stage of the builds, so
+        that they count against max_concurrent_image_downloads.
+
+        :returns: A dict of the result for each image ID, which is
+                  'downloaded', 'cached' if the image was already in the
+                  cache, 'unsupported' if the driver has no image cache,
+                  'unauthorized' if the token of the request does not allow
+                  downloading the image anymore, or 'error'.
+        """
+        results = {}
+
+        def cache_image(image_id):
+            try:
+                with self._image_stage.start(None):
+                    with timeutils.StopWatch() as timer:
+                        downloaded = self.driver.cache_image(context,
+                                                             image_id)
+            except NotImplementedError:
+                results[image_id] = 'unsupported'
+                return
+            except exception.ImageNotAuthorized:
+                LOG.warning(_LW('Not authorized to download image %s into '
+                                'the image cache, the token of the request '
+                                'may have expired'), image_id)
+                results[image_id] = 'unauthorized'
+                return
+            except Exception:
+                LOG.warning(_LW('Failed to download image %s into the image '
+                                'cache'), image_id, exc_info=True)
+                results[image_id] = 'error'
+                return
+            if downloaded:
+                LOG.info(_LI('Took %(elapsed)0.2f seconds to download image '
+                             '%(image_id)s into the image cache'),
+                         {'elapsed': timer.elapsed(), 'image_id': image_id})
+                results[image_id] = 'downloaded'
+            else:
+                results[image_id] = 'cached'
+
+        pool = eventlet.GreenPool()
+        for image_id in image_ids:
+            pool.spawn_n(cache_image, image_id)
+        pool.waitall()
+        return results
+
     @wrap_exception()
     @wrap_instance_fault
     def get_diagnostics(self, context, instance):
@@ -5784,6 +5967,10 @@ class ComputeManager(manager.Manager):
         if not heal_interval:
             return
 
+        if CONF.heal_instance_info_cache_batch_size > 1:
+            self._heal_instance_info_cache_batch(context)
+            return
+
         instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
         instance = None
 
@@ -5866,6 +6053,71 @@ class ComputeManager(manager.Manager):
             LOG.debug("Didn't find any instances for network info cache "
                       "update.")
 
+    def _heal_instance_info_cache_batch(self, context):
+        """Update the info_cache of the next batch of instances at once.
+
+        This is the same as _heal_instance_info_cache, except that the
+        network information of CONF.heal_instance_info_cache_batch_size
+        instances is refreshed on each call with bulk network API queries.
+        """
+        batch_size = CONF.heal_instance_info_cache_batch_size
+        instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
+
+        LOG.debug('Starting heal instance info cache')
+
+        if not instance_uuids:
+            LOG.debug('Rebuilding the list of instances to heal')
+            db_instances = objects.InstanceList.get_by_host(
+                context, self.host, expected_attrs=[], use_slave=True)
+            # Instances which are building will get added to the list next
+            # time we build it.
+            instance_uuids = [inst.uuid for inst in db_instances
+                              if inst.vm_state != vm_states.BUILDING and
+                              inst.task_state != task_states.DELETING]
+            self._instance_uuids_to_heal = instance_uuids
+
+        batch = instance_uuids[:batch_size]
+        del instance_uuids[:batch_size]
+        instances = []
+        if batch:
+            # Instances which are gone or have been migrated to another host
+            # are filtered out.
+            filters = {'uuid': batch, 'host': self.host, 'deleted': False}
+            instances = [inst for inst in objects.InstanceList.get_by_filters(
+                             context, filters,
+                             expected_attrs=['system_metadata', 'info_cache',
+                                             'flavor'],
+                             use_slave=True)
+                         if inst.task_state != task_states.DELETING]
+        if not instances:
+            LOG.debug("Didn't find any instances for network info cache "
+                      "update.")
+            return
+
+        try:
+            errors = self.network_api.refresh_instances_nw_info(context,
+                                                                instances)
+        except Exception:
+            LOG.error(_LE('An error occurred while refreshing the network '
+                          'cache of %d instances.'), len(instances),
+                      exc_info=True)
+            return
+
+        for instance in instances:
+            error = errors.get(instance.uuid)
+            if error is None:
+                LOG.debug('Updated the network info_cache for instance',
+                          instance=instance)
+            elif isinstance(error, exception.InstanceNotFound):
+                LOG.debug('Instance no longer exists. Unable to refresh',
+                          instance=instance)
+            elif isinstance(error, exception.InstanceInfoCacheNotFound):
+                LOG.debug('InstanceInfoCache no longer exists. '
+                          'Unable to refresh', instance=instance)
+            else:
+                LOG.error(_LE('An error occurred while refreshing the network '
+                              'cache: %s'), error, instance=instance)
+
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
         if CONF.reboot_timeout > 0:
@@ -5874,8 +6126,8 @@ class ComputeManager(manager.Manager):
                         task_states.REBOOT_STARTED,
                         task_states.REBOOT_PENDING],
                        'host': self.host}
-            rebooting = objects.InstanceList.get_by_filters(
-                context, filters, expected_attrs=[], use_slave=True)
+            rebooting = self._instance_cache.get_by_filters(
+                context, filters, expected_attrs=[])
 
             to_poll = []
             for instance in rebooting:
@@ -5890,9 +6142,8 @@ class ComputeManager(manager.Manager):
         if CONF.rescue_timeout > 0:
             filters = {'vm_state': vm_states.RESCUED,
                        'host': self.host}
-            rescued_instances = objects.InstanceList.get_by_filters(
-                context, filters, expected_attrs=["system_metadata"],
-                use_slave=True)
+            rescued_instances = self._instance_cache.get_by_filters(
+                context, filters, expected_attrs=["system_metadata"])
 
             to_unrescue = []
             for instance in rescued_instances:
@@ -6222,11 +6473,22 @@ class ComputeManager(manager.Manager):
         virtual machines known by the hypervisor and if the number matches the
         number of virtual machines known by the database, we proceed in a lazy
         loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        same power state as is in the database. The power states of all the
+        instances are queried at once from the drivers supporting it.
         """
-        db_instances = objects.InstanceList.get_by_host(context, self.host,
-                                                        expected_attrs=[],
-                                                        use_slave=True)
+        if not self._is_power_state_sweep_due():
+            LOG.debug('Skipping the power state sync of all the instances '
+                      'as it is done on lifecycle events of the driver')
+            return
+        self._last_power_state_sweep = time.time()
+
+        db_instances = self._instance_cache.get_by_host(context,
+                                                        expected_attrs=[])
+        try:
+            vm_power_states = self.driver.get_power_states(
+                [db_instance.uuid for db_instance in db_instances])
+        except NotImplementedError:
+            vm_power_states = {}
 
         num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
@@ -6245,7 +6507,9 @@ class ComputeManager(manager.Manager):
             #                They are set (in stop_instance) and read, in sync.
             @utils.synchronized(db_instance.uuid)
             def query_driver_power_state_and_sync():
-                self._query_driver_power_state_and_sync(context, db_instance)
+                self._query_driver_power_state_and_sync(
+                    context, db_instance,
+                    vm_power_states.get(db_instance.uuid))
 
             try:
                 query_driver_power_state_and_sync()
@@ -6267,36 +6531,66 @@ class ComputeManager(manager.Manager):
                 self._syncs_in_progress[uuid] = True
                 self._sync_power_pool.spawn_n(_sync, db_instance)
 
-    def _query_driver_power_state_and_sync(self, context, db_instance):
+    def _is_power_state_sweep_due(self):
+        """Whether _sync_power_states must sync all the instances.
+
+        When the lifecycle events of the driver are handled, the power state
+        changes are synced as they happen and the sync of all the instances is
+        only a safety net, run every CONF.sync_power_state_event_interval.
+        """
+        interval = CONF.sync_power_state_event_interval
+        if (interval <= 0 or
+                not CONF.workarounds.handle_virt_lifecycle_events or
+                not self.driver.capabilities.get('emits_lifecycle_events')):
+            return True
+        return time.time() - self._last_power_state_sweep >= interval
+
+    def _query_driver_power_state_and_sync(self, context, db_instance,
+                                           vm_power_state=None):
+        """Sync the power state of an instance with the hypervisor.
+
+        :param vm_power_state: The power state returned by the bulk query of
+                               the hypervisor made by _sync_power_states, or
+                               None to query the power state of the instance.
+        """
         if db_instance.task_state is not None:
             LOG.info(_LI("During sync_power_state the instance has a "
                          "pending task (%(task)s). Skip."),
                      {'task': db_instance.task_state}, instance=db_instance)
             return
-        # No pending tasks. Now try to figure out the real vm_power_state.
-        try:
-            vm_instance = self.driver.get_info(db_instance)
-            vm_power_state = vm_instance.state
-        except exception.InstanceNotFound:
-            vm_power_state = power_state.NOSTATE
-        # Note(maoy): the above get_info call might take a long time,
-        # for example, because of a broken libvirt driver.
+        kwargs = {'use_slave': True}
+        if vm_power_state is not None:
+            kwargs['recheck'] = True
+        else:
+            # No pending tasks. Now try to figure out the real
+            # vm_power_state.
+            try:
+                vm_instance = self.driver.get_info(db_instance)
+                vm_power_state = vm_instance.state
+            except exception.InstanceNotFound:
+                vm_power_state = power_state.NOSTATE
+            # Note(maoy): the above get_info call might take a long time,
+            # for example, because of a broken libvirt driver.
         try:
             self._sync_instance_power_state(context,
                                             db_instance,
                                             vm_power_state,
-                                            use_slave=True)
+                                            **kwargs)
         except exception.InstanceNotFound:
             # NOTE(hanlind): If the instance gets deleted during sync,
             # silently ignore.
             pass
 
     def _sync_instance_power_state(self, context, db_instance, vm_power_state,
-                                   use_slave=False):
+                                   use_slave=False, recheck=False):
         """Align instance power state between the database and hypervisor.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
+
+        :param recheck: Whether vm_power_state may be outdated, in which case
+                        the hypervisor is queried again if it does not match
+                        the database.
         """
 
         # We re-query the DB to get the latest instance info to minimize
@@ -6332,6 +6626,11 @@ class ComputeManager(manager.Manager):
                      instance=db_instance)
             return
 
+        if recheck and vm_power_state != db_power_state:
+            # The instance may have changed since the power states of all
+            # the instances were queried, check it again before acting on it.
+            vm_power_state = self._get_power_state(context, db_instance)
+
         orig_db_power_state = db_power_state
         if vm_power_state != db_power_state:
             LOG.info(_LI('During _sync_instance_power_state the DB '
@@ -6470,6 +6769,8 @@ class ComputeManager(manager.Manager):
         # expired, since it's a rare case, so marked as todo.
         quotas = objects.Quotas.from_reservations(context, None)
 
+        # Do not use the instance cache, it may still hold an instance
+        # restored since the start of the periodic tasks.
         filters = {'vm_state': vm_states.SOFT_DELETED,
                    'task_state': None,
                    'host': self.host}
@@ -6530,8 +6831,18 @@ class ComputeManager(manager.Manager):
                                                             use_slave=True,
                                                             startup=startup)
         nodenames = set(self.driver.get_available_nodes())
-        for nodename in nodenames:
-            self.update_available_resource_for_node(context, nodename)
+        workers = min(CONF.update_resources_workers, len(nodenames))
+        if workers > 1:
+            # The node locks of the resource tracker keep a single writer
+            # per compute node.
+            pool = eventlet.GreenPool(workers)
+            for nodename in nodenames:
+                pool.spawn_n(self.update_available_resource_for_node,
+                             context, nodename)
+            pool.waitall()
+        else:
+            for nodename in nodenames:
+                self.update_available_resource_for_node(context, nodename)
 
         # Delete orphan compute node not reported by driver but still in db
         for cn in compute_nodes_in_db:
@@ -6821,8 +7132,8 @@ class ComputeManager(manager.Manager):
         filters = {'deleted': False,
                    'soft_deleted': True,
                    'host': nodes}
-        filtered_instances = objects.InstanceList.get_by_filters(context,
-                                 filters, expected_attrs=[], use_slave=True)
+        filtered_instances = self._instance_cache.get_by_filters(
+            context, filters, expected_attrs=[])
 
         self.driver.manage_image_cache(context, filtered_instances)
 
@@ -6856,13 +7167,22 @@ class ComputeManager(manager.Manager):
                        'max': CONF.maximum_instance_delete_attempts},
                       instance=instance)
             if attempts < CONF.maximum_instance_delete_attempts:
-                success = self.driver.delete_instance_files(instance)
+                # The instances are saved together below, so a failure must
+                # not lose the updates of the instances already cleaned.
+                try:
+                    success = self.driver.delete_instance_files(instance)
+                except Exception:
+                    LOG.exception(_LE('Failed to delete the files of the '
+                                      'instance'), instance=instance)
+                    success = False
 
                 instance.system_metadata['clean_attempts'] = str(attempts + 1)
                 if success:
                     instance.cleaned = True
-                with utils.temporary_mutation(context, read_deleted='yes'):
-                    instance.save()
+
+        if instances:
+            with utils.temporary_mutation(context, read_deleted='yes'):
+                instances.save()
 
     @periodic_task.periodic_task(spacing=CONF.instance_delete_interval)
     def _cleanup_incomplete_migrations(self, context):
@@ -0,0 +1,284 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Helpers for the periodic tasks of the compute service.
+
+oslo.service runs the periodic tasks of a manager one after the other, so a
+single slow task delays all the others. The PeriodicTaskScheduler runs the
+due tasks of a manager in a bounded pool of greenthreads instead, see
+[DEFAULT]/periodic_task_workers.
+
+Several periodic tasks list the instances of the host. The HostInstanceCache
+lets them share a single listing per run of the periodic tasks, see
+[DEFAULT]/periodic_task_instance_cache.
+"""
+
+import random
+import time
+
+import eventlet
+import eventlet.semaphore
+from oslo_log import log as logging
+from oslo_service import periodic_task
+
+from nova.compute import vm_states
+import nova.conf
+from nova.i18n import _LE
+from nova.i18n import _LW
+from nova import objects
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# Seconds to wait before starting the due tasks which did not fit in the pool.
+_RETRY_INTERVAL = 1.0
+
+# The instance filters the HostInstanceCache can apply itself.
+_CACHED_FILTERS = frozenset(['host', 'vm_state', 'task_state', 'deleted',
+                             'soft_deleted'])
+
+
+class TaskStats(object):
+    """Runs of a periodic task."""
+
+    __slots__ = ('runs', 'skips', 'timeouts', 'failures', 'last_duration',
+                 'max_duration', 'total_duration')
+
+    def __init__(self):
+        self.runs = 0
+        self.skips = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    def __repr__(self):
+        return ('%d runs, %d skips, %d timeouts, %d failures, last %.3fs, '
+                'max %.3fs, total %.3fs' %
+                (self.runs, self.skips, self.timeouts, self.failures,
+                 self.last_duration, self.max_duration, self.total_duration))
+
+
+class PeriodicTaskScheduler(object):
+    """Runs the periodic tasks of a manager in a pool of greenthreads.
+
+    The schedule of the tasks is kept in the _periodic_last_run dict of the
+    manager, like oslo.service does, so that the manager can switch back to
+    running its tasks one after the other.
+    """
+
+    def __init__(self, manager, workers):
+        self._manager = manager
+        self._pool = eventlet.GreenPool(workers)
+        self._jitter = CONF.periodic_task_jitter
+        self._deadlines = CONF.periodic_task_deadlines or {}
+        self._priorities = CONF.periodic_task_priorities or []
+        self._running = set()
+        self._delays = {}
+        self.stats = {}
+
+    def _get_stats(self, task_name):
+        try:
+            return self.stats[task_name]
+        except KeyError:
+            self.stats[task_name] = TaskStats()
+            return self.stats[task_name]
+
+    def _full_name(self, task_name):
+        return '%s.%s' % (self._manager.__class__.__name__, task_name)
+
+    def _priority(self, task_name):
+        try:
+            return self._priorities.index(task_name)
+        except ValueError:
+            return len(self._priorities)
+
+    def _delay(self, task_name, spacing):
+        if task_name not in self._delays:
+            self._delays[task_name] = random.uniform(0, self._jitter * spacing)
+        return self._delays[task_name]
+
+    def run_periodic_tasks(self, context):
+        """Start the due periodic tasks of the manager.
+
+        :param context: The context to run the tasks with.
+        :returns: The number of seconds until a task is due.
+        """
+        manager = self._manager
+        now = time.time()
+        idle_for = periodic_task.DEFAULT_INTERVAL
+        due = []
+        for task_name, task in manager._periodic_tasks:
+            if (task._periodic_external_ok and
+                    not CONF.run_external_periodic_tasks):
+                continue
+            spacing = manager._periodic_spacing[task_name]
+            last_run = manager._periodic_last_run[task_name]
+            idle_for = min(idle_for, spacing)
+            if last_run is not None:
+                delta = last_run + spacing + self._delay(task_name,
+                                                         spacing) - now
+                if delta > 0:
+                    idle_for = min(idle_for, delta)
+                    continue
+            if task_name in self._running:
+                # The previous run is still in progress, skip this one.
+                LOG.debug('Skipping periodic task %(task)s because its '
+                          'previous run is still in progress',
+                          {'task': self._full_name(task_name)})
+                self._get_stats(task_name).skips += 1
+                manager._periodic_last_run[task_name] = now
+                self._delays.pop(task_name, None)
+                continue
+            lateness = now - last_run if last_run is not None else spacing
+            due.append((self._priority(task_name), -lateness, task_name,
+                        task))
+
+        for _priority, _lateness, task_name, task in sorted(due):
+            if not self._pool.free():
+                # Retry the remaining due tasks once a worker is available.
+                idle_for = min(idle_for, _RETRY_INTERVAL)
+                break
+            LOG.debug('Running periodic task %(task)s',
+                      {'task': self._full_name(task_name)})
+            manager._periodic_last_run[task_name] = now
+            self._delays.pop(task_name, None)
+            self._running.add(task_name)
+            self._pool.spawn_n(self._run_task, context, task_name, task)
+        return idle_for
+
+    def _run_task(self, context, task_name, task):
+        stats = self._get_stats(task_name)
+        deadline = self._deadlines.get(task_name)
+        timeout = eventlet.Timeout(deadline) if deadline else None
+        start = time.time()
+        try:
+            task(self._manager, context)
+        except eventlet.Timeout as exc:
+            if exc is not timeout:
+                raise
+            stats.timeouts += 1
+            LOG.warning(_LW('Periodic task %(task)s was interrupted after '
+                            '%(deadline)s seconds'),
+                        {'task': self._full_name(task_name),
+                         'deadline': deadline})
+        except Exception:
+            stats.failures += 1
+            LOG.exception(_LE('Error during %(task)s'),
+                          {'task': self._full_name(task_name)})
+        finally:
+            if timeout is not None:
+                timeout.cancel()
+            self._running.discard(task_name)
+            duration = time.time() - start
+            stats.runs += 1
+            stats.last_duration = duration
+            stats.max_duration = max(stats.max_duration, duration)
+            stats.total_duration += duration
+            LOG.debug('Periodic task %(task)s finished in %(duration).3f '
+                      'seconds: %(stats)r',
+                      {'task': self._full_name(task_name),
+                       'duration': duration, 'stats': stats})
+
+
+class HostInstanceCache(object):
+    """Listing of the instances of a host shared by the periodic tasks.
+
+    The instances are listed at most once between two calls to invalidate(),
+    which the compute manager makes before each run of its periodic tasks
+    and after each operation on one of its instances. Each caller gets its
+    own copy of the instances, which it can modify and save. The listing
+    loads the optional fields requested by all the callers so far, so that
+    they are not loaded instance by instance. When
+    [DEFAULT]/periodic_task_instance_cache is not set, every call lists the
+    instances from the database.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self._instances = None
+        self._expected_attrs = set()
+        self._generation = 0
+        self._lock = eventlet.semaphore.Semaphore()
+
+    def invalidate(self):
+        """Drop the listing, the next call lists the instances again."""
+        self._generation += 1
+        self._instances = None
+
+    def _get_instances(self, context, expected_attrs):
+        with self._lock:
+            missing = set(expected_attrs or []) - self._expected_attrs
+            if self._instances is None or missing:
+                self._expected_attrs |= missing
+                generation = self._generation
+                instances = objects.InstanceList.get_by_host(
+                    context, self.host,
+                    expected_attrs=sorted(self._expected_attrs),
+                    use_slave=True)
+                # Do not keep a listing which was invalidated while loading.
+                if generation == self._generation:
+                    self._instances = instances
+            else:
+                instances = self._instances
+        return objects.InstanceList(
+            objects=[instance.obj_clone() for instance in instances])
+
+    def get_by_host(self, context, expected_attrs=None):
+        """Returns the instances of the host.
+
+        :param context: The context to list the instances with.
+        :param expected_attrs: The optional fields to load with the
+                               instances.
+        """
+        if not CONF.periodic_task_instance_cache:
+            return objects.InstanceList.get_by_host(
+                context, self.host, expected_attrs=expected_attrs,
+                use_slave=True)
+        return self._get_instances(context, expected_attrs)
+
+    def get_by_filters(self, context, filters, expected_attrs=None):
+        """Returns the instances of the host matching filters.
+
+        The filters are applied like InstanceList.get_by_filters does.
+        Filters on other hosts, on deleted instances or on other fields
+        than the ones in _CACHED_FILTERS are queried from the database.
+        """
+        hosts = filters.get('host')
+        if not isinstance(hosts, (list, tuple, set)):
+            hosts = [hosts]
+        if (not CONF.periodic_task_instance_cache or
+                set(hosts) != set([self.host]) or
+                filters.get('deleted') or
+                not _CACHED_FILTERS.issuperset(filters)):
+            return objects.InstanceList.get_by_filters(
+                context, filters, expected_attrs=expected_attrs,
+                use_slave=True)
+        return objects.InstanceList(
+            objects=[instance for instance in
+                     self._get_instances(context, expected_attrs)
+                     if self._match(instance, filters)])
+
+    @staticmethod
+    def _match(instance, filters):
+        if ('deleted' in filters and not filters.get('soft_deleted') and
+                instance.vm_state == vm_states.SOFT_DELETED):
+            return False
+        for key in ('vm_state', 'task_state'):
+            if key in filters:
+                values = filters[key]
+                if not isinstance(values, (list, tuple, set)):
+                    values = [values]
+                if instance[key] not in values:
+                    return False
+        return True
@@ -20,9 +20,16 @@ model.
 """
 import collections
 import copy
+import functools
+import inspect
+import threading
+import time
 
+import eventlet
+from oslo_concurrency import lockutils
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_utils import excutils
 
 from nova.compute import claims
 from nova.compute import monitors
@@ -31,7 +38,7 @@ from nova.compute import task_states
 from nova.compute import vm_states
 import nova.conf
 from nova import exception
-from nova.i18n import _, _LI, _LW
+from nova.i18n import _, _LE, _LI, _LW
 from nova import objects
 from nova.objects import base as obj_base
 from nova.objects import migration as migration_obj
@@ -39,7 +46,6 @@ from nova.pci import manager as pci_manager
 from nova.pci import request as pci_request
 from nova import rpc
 from nova.scheduler import client as scheduler_client
-from nova import utils
 from nova.virt import hardware
 
 CONF = nova.conf.CONF
@@ -47,6 +53,15 @@ CONF = nova.conf.CONF
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
+# Compute node fields maintained by the resource tracker rather than reported
+# by the virt driver.
+_TRACKED_USAGE_FIELDS = ('vcpus_used', 'memory_mb_used', 'local_gb_used',
+                         'numa_topology')
+# Compute node fields compared after a full audit to report the difference
+# with the incrementally tracked usage.
+_AUDITED_FIELDS = ('vcpus_used', 'memory_mb_used', 'local_gb_used',
+                   'running_vms')
+
 
 def _instance_in_resize_state(instance):
     """Returns True if the instance is in one of the resizing states.
@@ -68,6 +83,46 @@ def _instance_in_resize_state(instance):
     return False
 
 
+def _node_synchronized(f):
+    """Serializes the calls to a ResourceTracker method on a compute node.
+
+    The node is the nodename argument of the method, or the node of its
+    resources argument. The lock only covers the changes made to the usage
+    tracked in memory: the compute node record is saved and reported to the
+    scheduler once the lock is released, so that a claim does not wait for
+    the database and placement API calls made by other claims or by the
+    periodic audit of the node.
+    """
+    @functools.wraps(f)
+    def inner(self, *args, **kwargs):
+        callargs = inspect.getcallargs(f, self, *args, **kwargs)
+        if 'resources' in callargs:
+            nodename = callargs['resources']['hypervisor_hostname']
+        else:
+            nodename = callargs['nodename']
+        try:
+            with lockutils.lock('%s-%s' % (COMPUTE_RESOURCE_SEMAPHORE,
+                                           nodename)):
+                self._deferred_nodes.add(nodename)
+                try:
+                    result = f(self, *args, **kwargs)
+                finally:
+                    self._deferred_nodes.discard(nodename)
+                    self._usage_generation[nodename] += 1
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # Do not replace the error of the method, a claim failure
+                # for instance, with a failure to report the node.
+                try:
+                    self._report_update(nodename)
+                except Exception:
+                    LOG.exception(_LE("Failed to report the update of "
+                                      "compute node %s"), nodename)
+        self._report_update(nodename)
+        return result
+    return inner
+
+
 def _is_trackable_migration(migration):
     # Only look at resize/migrate migration and evacuation records
     # NOTE(danms): RT should probably examine live migration
@@ -88,9 +143,19 @@ class ResourceTracker(object):
         self.pci_tracker = None
         # Dict of objects.ComputeNode objects, keyed by nodename
         self.compute_nodes = {}
-        self.stats = stats.Stats()
+        self.stats = collections.defaultdict(stats.Stats)
         self.tracked_instances = {}
         self.tracked_migrations = {}
+        # Time of the last full audit of each node, see
+        # CONF.resource_audit_interval.
+        self.last_audit = {}
+        # Number of locked calls made on each node, see _node_synchronized.
+        self._usage_generation = collections.defaultdict(int)
+        # Nodes whose lock is held, and the compute node updates to report
+        # once it is released.
+        self._deferred_nodes = set()
+        self._pending_updates = {}
+        self._report_locks = collections.defaultdict(threading.Lock)
         monitor_handler = monitors.MonitorHandler(self)
         self.monitors = monitor_handler.monitors
         self.old_resources = collections.defaultdict(objects.ComputeNode)
@@ -99,7 +164,7 @@ class ResourceTracker(object):
         self.cpu_allocation_ratio = CONF.cpu_allocation_ratio
         self.disk_allocation_ratio = CONF.disk_allocation_ratio
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_node_synchronized
     def instance_claim(self, context, instance, nodename, limits=None):
         """Indicate that some resources are needed for an upcoming compute
         instance build operation.
@@ -160,8 +225,8 @@ class ResourceTracker(object):
 
         # self._set_instance_host_and_node() will save instance to the DB
         # so set instance.numa_topology first.  We need to make sure
-        # that numa_topology is saved while under COMPUTE_RESOURCE_SEMAPHORE
-        # so that the resource audit knows about any cpus we've pinned.
+        # that numa_topology is saved while under the node lock so that the
+        # resource audit knows about any cpus we've pinned.
         instance_numa_topology = claim.claimed_numa_topology
         instance.numa_topology = instance_numa_topology
         self._set_instance_host_and_node(instance, nodename)
@@ -181,7 +246,7 @@ class ResourceTracker(object):
 
         return claim
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_node_synchronized
     def rebuild_claim(self, context, instance, nodename, limits=None,
                       image_meta=None, migration=None):
         """Create a claim for a rebuild operation."""
@@ -190,7 +255,7 @@ class ResourceTracker(object):
                                 move_type='evacuation', limits=limits,
                                 image_meta=image_meta, migration=migration)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_node_synchronized
     def resize_claim(self, context, instance, instance_type, nodename,
                      image_meta=None, limits=None):
         """Create a claim for a resize or cold-migration move."""
@@ -304,7 +369,7 @@ class ResourceTracker(object):
     def _create_migration(self, context, instance, new_instance_type,
                           nodename, move_type=None):
         """Create a migration record for the upcoming resize.  This should
-        be done while the COMPUTE_RESOURCES_SEMAPHORE is held so the resource
+        be done while the node lock is held so the resource
         claim will not be lost if the audit process starts.
         """
         migration = objects.Migration(context=context.elevated())
@@ -331,7 +396,7 @@ class ResourceTracker(object):
         If a migration record was created already before the request made
         it to this compute host, only set up the migration so it's included in
         resource tracking. This should be done while the
-        COMPUTE_RESOURCES_SEMAPHORE is held.
+        node lock is held.
         """
         migration.dest_compute = self.host
         migration.dest_node = nodename
@@ -341,7 +406,7 @@ class ResourceTracker(object):
 
     def _set_instance_host_and_node(self, instance, nodename):
         """Tag the instance as belonging to this host.  This should be done
-        while the COMPUTE_RESOURCES_SEMAPHORE is held so the resource claim
+        while the node lock is held so the resource claim
         will not be lost if the audit process starts.
         """
         instance.host = self.host
@@ -352,14 +417,14 @@ class ResourceTracker(object):
     def _unset_instance_host_and_node(self, instance):
         """Untag the instance so it no longer belongs to the host.
 
-        This should be done while the COMPUTE_RESOURCES_SEMAPHORE is held so
+        This should be done while the node lock is held so
         the resource claim will not be lost if the audit process starts.
         """
         instance.host = None
         instance.node = None
         instance.save()
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_node_synchronized
     def abort_instance_claim(self, context, instance, nodename):
         """Remove usage from the given instance."""
         self._update_usage_from_instance(context, instance, nodename,
@@ -382,7 +447,7 @@ class ResourceTracker(object):
                 dev_pools_obj = self.pci_tracker.stats.to_device_pools_obj()
                 self.compute_nodes[nodename].pci_device_pools = dev_pools_obj
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_node_synchronized
     def drop_move_claim(self, context, instance, nodename,
                         instance_type=None, prefix='new_'):
         # Remove usage for an incoming/outgoing migration on the destination
@@ -417,7 +482,7 @@ class ResourceTracker(object):
             ctxt = context.elevated()
             self._update(ctxt, self.compute_nodes[nodename])
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_node_synchronized
     def update_usage(self, context, instance, nodename):
         """Update the resource usage and stats after a change in an
         instance
@@ -502,9 +567,10 @@ class ResourceTracker(object):
     def _copy_resources(self, compute_node, resources):
         """Copy resource values to supplied compute_node."""
         # purge old stats and init with anything passed in by the driver
-        self.stats.clear()
-        self.stats.digest_stats(resources.get('stats'))
-        compute_node.stats = copy.deepcopy(self.stats)
+        node_stats = self.stats[resources['hypervisor_hostname']]
+        node_stats.clear()
+        node_stats.digest_stats(resources.get('stats'))
+        compute_node.stats = copy.deepcopy(node_stats)
 
         # update the allocation ratios for the related ComputeNode object
         compute_node.ram_allocation_ratio = self.ram_allocation_ratio
@@ -556,7 +622,21 @@ class ResourceTracker(object):
                   "%(host)s (node: %(node)s)",
                  {'node': nodename,
                   'host': self.host})
-        resources = self.driver.get_available_resource(nodename)
+        # Only the driver call is bounded: interrupting the audit itself
+        # would leave the usage of the node half rebuilt.
+        seconds = CONF.update_resources_node_timeout
+        timeout = eventlet.timeout.Timeout(seconds or None)
+        try:
+            resources = self.driver.get_available_resource(nodename)
+        except eventlet.timeout.Timeout as exc:
+            if exc is not timeout:
+                raise
+            LOG.error(_LE("Getting the resources of node %(node)s timed out "
+                          "after %(seconds)d seconds."),
+                      {'node': nodename, 'seconds': seconds})
+            return
+        finally:
+            timeout.cancel()
         # NOTE(jaypipes): The resources['hypervisor_hostname'] field now
         # contains a non-None value, even for non-Ironic nova-compute hosts. It
         # is this value that will be populated in the compute_nodes table.
@@ -591,34 +671,69 @@ class ResourceTracker(object):
                               'another host\'s instance!',
                           {'uuid': migration.instance_uuid})
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    def _is_audit_due(self, nodename):
+        """Whether the usage of a node must be audited from scratch."""
+        interval = CONF.resource_audit_interval
+        if not interval or nodename not in self.last_audit:
+            return True
+        return time.time() - self.last_audit[nodename] >= interval
+
     def _update_available_resource(self, context, resources):
+        nodename = resources['hypervisor_hostname']
+        if not self._is_audit_due(nodename) and not self.disabled(nodename):
+            self._refresh_compute_node(context, resources)
+            return
+
+        # Load the instances and migrations of a known node before taking its
+        # lock, so that claims do not wait for these queries. They are loaded
+        # again with the lock held if the node was changed in the meantime.
+        generation = self._usage_generation[nodename]
+        usage = None
+        if not self.disabled(nodename):
+            usage = self._get_node_usage(context, nodename)
+        self._audit_compute_node(context, resources, generation, usage)
+
+    def _get_node_usage(self, context, nodename):
+        """Returns the instances and in-progress migrations of a node."""
+        instances = objects.InstanceList.get_by_host_and_node(
+            context, self.host, nodename,
+            expected_attrs=['system_metadata',
+                            'numa_topology',
+                            'flavor', 'migration_context'])
+        migrations = objects.MigrationList.get_in_progress_by_host_and_node(
+                context, self.host, nodename)
+        return instances, migrations
+
+    @_node_synchronized
+    def _audit_compute_node(self, context, resources, generation, usage):
+        """Recompute the usage of a node from its instances and migrations.
+
+        :param generation: The number of locked calls made on the node when
+                           usage was loaded.
+        :param usage: The instances and migrations of the node, as returned by
+                      _get_node_usage(), or None to load them.
+        """
+        nodename = resources['hypervisor_hostname']
+        tracked_usage = None
+        if CONF.resource_audit_interval and nodename in self.compute_nodes:
+            tracked_usage = self._get_tracked_usage(nodename)
 
         # initialize the compute node object, creating it
         # if it does not already exist.
         self._init_compute_node(context, resources)
 
-        nodename = resources['hypervisor_hostname']
-
         # if we could not init the compute node the tracker will be
         # disabled and we should quit now
         if self.disabled(nodename):
             return
 
-        # Grab all instances assigned to this node:
-        instances = objects.InstanceList.get_by_host_and_node(
-            context, self.host, nodename,
-            expected_attrs=['system_metadata',
-                            'numa_topology',
-                            'flavor', 'migration_context'])
+        if usage is None or generation != self._usage_generation[nodename]:
+            usage = self._get_node_usage(context, nodename)
+        instances, migrations = usage
 
         # Now calculate usage based on instance utilization:
         self._update_usage_from_instances(context, instances, nodename)
 
-        # Grab all in-progress migrations:
-        migrations = objects.MigrationList.get_in_progress_by_host_and_node(
-                context, self.host, nodename)
-
         self._pair_instances_to_migrations(migrations, instances)
         self._update_usage_from_migrations(context, migrations, nodename)
 
@@ -644,11 +759,100 @@ class ResourceTracker(object):
         # but it is. This should be changed in ComputeNode
         cn.metrics = jsonutils.dumps(metrics)
 
+        self.last_audit[nodename] = time.time()
+        if tracked_usage is not None:
+            self._report_audit_changes(nodename, tracked_usage)
+
         # update the compute_node
         self._update(context, cn)
         LOG.debug('Compute_service record updated for %(host)s:%(node)s',
                   {'host': self.host, 'node': nodename})
 
+    @_node_synchronized
+    def _refresh_compute_node(self, context, resources):
+        """Refresh the hypervisor view of a node, keeping the tracked usage.
+
+        This is what the periodic task does between two full audits of the
+        node when CONF.resource_audit_interval is set: the resources reported
+        by the virt driver are copied to the compute node, but the usage
+        accounted by claims, usage updates and migrations since the last audit
+        is kept as is.
+        """
+        nodename = resources['hypervisor_hostname']
+        cn = self.compute_nodes[nodename]
+        usage = {field: getattr(cn, field) for field in _TRACKED_USAGE_FIELDS}
+
+        node_stats = self.stats[nodename]
+        node_stats.digest_stats(resources.get('stats'))
+        cn.stats = copy.deepcopy(node_stats)
+        cn.update_from_virt_driver(resources)
+        for field, value in usage.items():
+            setattr(cn, field, value)
+        cn.free_ram_mb = cn.memory_mb - cn.memory_mb_used
+        cn.free_disk_gb = cn.local_gb - cn.local_gb_used
+
+        self._report_final_resource_view(nodename)
+
+        metrics = self._get_host_metrics(context, nodename)
+        cn.metrics = jsonutils.dumps(metrics)
+
+        self._update(context, cn)
+        LOG.debug('Compute_service record refreshed for %(host)s:%(node)s',
+                  {'host': self.host, 'node': nodename})
+
+    def _get_tracked_usage(self, nodename):
+        """Snapshot the usage tracked for a node, see _report_audit_changes.
+        """
+        cn = self.compute_nodes[nodename]
+        usage = {field: getattr(cn, field) for field in _AUDITED_FIELDS}
+        usage['instances'] = set(
+            uuid for uuid, instance in self.tracked_instances.items()
+            if instance.get('node') == nodename)
+        usage['migrations'] = set(
+            uuid for uuid, migration in self.tracked_migrations.items()
+            if nodename in (migration.source_node, migration.dest_node))
+        return usage
+
+    def _report_audit_changes(self, nodename, tracked_usage):
+        """Log what a full audit changed in the incrementally tracked usage.
+
+        :param nodename: The node which was audited.
+        :param tracked_usage: The usage tracked for the node before the audit,
+                              as returned by _get_tracked_usage().
+        """
+        audited_usage = self._get_tracked_usage(nodename)
+        changes = []
+        for field in _AUDITED_FIELDS:
+            if tracked_usage[field] != audited_usage[field]:
+                changes.append('%s: %s -> %s' % (
+                    field, tracked_usage[field], audited_usage[field]))
+        for key in ('instances', 'migrations'):
+            added = audited_usage[key] - tracked_usage[key]
+            removed = tracked_usage[key] - audited_usage[key]
+            if added:
+                changes.append('untracked %s: %s' % (key, sorted(added)))
+            if removed:
+                changes.append('stale %s: %s' % (key, sorted(removed)))
+
+        if changes:
+            LOG.warning(_LW("Resource audit of %(host)s:%(node)s corrected "
+                            "the tracked usage: %(changes)s"),
+                        {'host': self.host, 'node': nodename,
+                         'changes': '; '.join(changes)})
+        else:
+            LOG.debug('Resource audit of %(host)s:%(node)s found no '
+                      'difference with the tracked usage',
+                      {'host': self.host, 'node': nodename})
+
+    def _is_tracked_for_other_node(self, nodename, nodes):
+        """Whether a tracked record belongs to another node of this host.
+
+        :param nodename: The node being audited.
+        :param nodes: The node names the tracked record refers to.
+        """
+        others = set(self.compute_nodes) - set([nodename])
+        return nodename not in nodes and bool(others.intersection(nodes))
+
     def _get_compute_node(self, context, nodename):
         """Returns compute node for the host and nodename."""
         try:
@@ -744,9 +948,51 @@ class ResourceTracker(object):
         return False
 
     def _update(self, context, compute_node):
-        """Update partial stats locally and populate them to Scheduler."""
+        """Update partial stats locally and populate them to Scheduler.
+
+        When the lock of the node is held, a copy of the compute node is saved
+        and reported by _report_update() once the lock is released.
+        """
         if not self._resource_change(compute_node):
             return
+        if self.pci_tracker:
+            self.pci_tracker.save(context)
+        nodename = compute_node.hypervisor_hostname
+        if nodename in self._deferred_nodes:
+            update = compute_node.obj_clone()
+            # The clone carries the changes to save, so that the changes of
+            # the tracked compute node do not pile up over its lifetime.
+            compute_node.obj_reset_changes(recursive=True)
+            pending = self._pending_updates.get(nodename)
+            if pending:
+                # Also save the changes of the update this one replaces.
+                for field in pending[1].obj_what_changed():
+                    if update.obj_attr_is_set(field):
+                        setattr(update, field, getattr(update, field))
+            self._pending_updates[nodename] = (context, update)
+            return
+        self._save_compute_node(context, compute_node)
+
+    def _report_update(self, nodename):
+        """Save and report the pending update of a node, if any.
+
+        The updates of a node are reported one at a time, so that an older
+        copy of the compute node never overwrites a newer one. If another
+        caller is reporting the node, it also reports the pending update when
+        it is done, so this returns without waiting for it.
+        """
+        lock = self._report_locks[nodename]
+        while nodename in self._pending_updates:
+            if not lock.acquire(False):
+                return
+            try:
+                update = self._pending_updates.pop(nodename, None)
+                if update:
+                    self._save_compute_node(*update)
+            finally:
+                lock.release()
+
+    def _save_compute_node(self, context, compute_node):
         nodename = compute_node.hypervisor_hostname
         compute_node.save()
         # Persist the stats to the Scheduler
@@ -763,9 +1009,6 @@ class ResourceTracker(object):
             # this code branch
             self.scheduler_client.update_compute_node(compute_node)
 
-        if self.pci_tracker:
-            self.pci_tracker.save(context)
-
     def _update_usage(self, usage, nodename, sign=1):
         mem_usage = usage['memory_mb']
         disk_usage = usage.get('root_gb', 0)
@@ -786,7 +1029,7 @@ class ResourceTracker(object):
         cn.free_ram_mb = cn.memory_mb - cn.memory_mb_used
         cn.free_disk_gb = cn.local_gb - cn.local_gb_used
 
-        cn.running_vms = self.stats.num_instances
+        cn.running_vms = self.stats[nodename].num_instances
 
         # Calculate the numa usage
         free = sign == -1
@@ -885,7 +1128,10 @@ class ResourceTracker(object):
     def _update_usage_from_migrations(self, context, migrations, nodename):
         filtered = {}
         instances = {}
-        self.tracked_migrations.clear()
+        for uuid, migration in list(self.tracked_migrations.items()):
+            nodes = (migration.source_node, migration.dest_node)
+            if not self._is_tracked_for_other_node(nodename, nodes):
+                del self.tracked_migrations[uuid]
 
         # do some defensive filtering against bad migrations records in the
         # database:
@@ -948,8 +1194,9 @@ class ResourceTracker(object):
             sign = -1
 
         cn = self.compute_nodes[nodename]
-        self.stats.update_stats_for_instance(instance, is_removed_instance)
-        cn.stats = copy.deepcopy(self.stats)
+        node_stats = self.stats[nodename]
+        node_stats.update_stats_for_instance(instance, is_removed_instance)
+        cn.stats = copy.deepcopy(node_stats)
 
         # if it's a new or deleted instance:
         if is_new_instance or is_removed_instance:
@@ -963,7 +1210,7 @@ class ResourceTracker(object):
             self._update_usage(self._get_usage_dict(instance), nodename,
                                sign=sign)
 
-        cn.current_workload = self.stats.calculate_workload()
+        cn.current_workload = node_stats.calculate_workload()
         if self.pci_tracker:
             obj = self.pci_tracker.stats.to_device_pools_obj()
             cn.pci_device_pools = obj
@@ -976,7 +1223,10 @@ class ResourceTracker(object):
         instances assigned to the local compute host, even if they are not
         currently powered on.
         """
-        self.tracked_instances.clear()
+        for uuid, instance in list(self.tracked_instances.items()):
+            nodes = (instance.get('node'),)
+            if not self._is_tracked_for_other_node(nodename, nodes):
+                del self.tracked_instances[uuid]
 
         cn = self.compute_nodes[nodename]
         # set some initial values, reserve room for host/hypervisor:
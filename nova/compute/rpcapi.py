@@ -319,6 +319,8 @@ class ComputeAPI(object):
         ... Newton and Ocata support messaging version 4.13. So, any changes to
         existing methods in 4.x after that point should be done so that they
         can handle the version_cap being set to 4.13
+
+        * 4.14 - Add cache_images()
     '''
 
     VERSION_ALIASES = {
@@ -916,6 +918,14 @@ class ComputeAPI(object):
                    instance=instance, old_volume_id=old_volume_id,
                    new_volume_id=new_volume_id)
 
+    def cache_images(self, ctxt, host, image_ids, timeout=None):
+        version = '4.14'
+        client = self.router.by_host(ctxt, host)
+        if not client.can_send_version(version):
+            raise exception.ImageCacheNotSupported(host=host)
+        cctxt = client.prepare(server=host, version=version, timeout=timeout)
+        return cctxt.call(ctxt, 'cache_images', image_ids=image_ids)
+
     def get_host_uptime(self, ctxt, host):
         version = '4.0'
         cctxt = self.router.by_host(ctxt, host).prepare(
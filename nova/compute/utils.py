@@ -19,8 +19,10 @@ import functools
 import inspect
 import itertools
 import string
+import time
 import traceback
 
+import eventlet.semaphore
 import netifaces
 from oslo_log import log
 import six
@@ -639,6 +641,57 @@ class EventReporter(object):
         return False
 
 
+class TimelineEvent(EventReporter):
+    """EventReporter which does not fail the operation it reports.
+
+    Used to record the stages of instance builds, see timeline_event().
+    """
+
+    def __enter__(self):
+        try:
+            super(TimelineEvent, self).__enter__()
+        except Exception as exc:
+            LOG.debug('Failed to record the start of the %(event)s event: '
+                      '%(exc)s', {'event': self.event_name, 'exc': exc})
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super(TimelineEvent, self).__exit__(exc_type, exc_val, exc_tb)
+        except Exception as exc:
+            LOG.debug('Failed to record the end of the %(event)s event: '
+                      '%(exc)s', {'event': self.event_name, 'exc': exc})
+        return False
+
+
+class _NullTimelineEvent(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMELINE_EVENT = _NullTimelineEvent()
+
+
+def timeline_event(context, event_name, *instances):
+    """Returns a context manager recording a stage of instance builds.
+
+    The stages are recorded as instance action events when
+    CONF.build_timeline is set, and are then listed with the other events
+    of the action by the os-instance-actions API.
+
+    :param context: The request context of the build.
+    :param event_name: The name of the stage.
+    :param instances: The instances being built.
+    """
+    if not CONF.build_timeline:
+        return _NULL_TIMELINE_EVENT
+    return TimelineEvent(context, event_name,
+                         *[instance.uuid for instance in instances])
+
+
 def wrap_instance_event(prefix):
     """Wraps a method to log the event taken on the instance, and result.
 
@@ -674,6 +727,67 @@ class UnlimitedSemaphore(object):
         return 0
 
 
+class BuildStage(object):
+    """Concurrency limit and queue metrics of a stage of instance builds.
+
+    Usage::
+
+        with stage.start(instance):
+            ...
+
+    :param name: The name of the stage, for logging.
+    :param limit: The maximum number of builds in the stage at the same time,
+                  0 for unlimited.
+    """
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._semaphore = None
+        if limit:
+            self._semaphore = eventlet.semaphore.Semaphore(limit)
+        # Number of builds waiting to enter or in the stage.
+        self.waiting = 0
+        self.running = 0
+        # Builds which entered the stage since the service started, and the
+        # time they waited.
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __repr__(self):
+        return ('%s: %d running, %d waiting, %d started, waited %.2fs on '
+                'average and %.2fs at most' %
+                (self.name, self.running, self.waiting, self.started,
+                 self.total_wait / max(self.started, 1), self.max_wait))
+
+    @contextlib.contextmanager
+    def start(self, instance):
+        """Enter the stage, waiting for a slot if the limit is reached."""
+        begin = time.time()
+        self.waiting += 1
+        try:
+            if self._semaphore is not None:
+                self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.time() - begin
+        self.running += 1
+        self.started += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        LOG.debug('Waited %(waited).2f seconds to start the %(name)s stage '
+                  'of the build. %(stage)r',
+                  {'waited': waited, 'name': self.name, 'stage': self},
+                  instance=instance)
+        try:
+            yield
+        finally:
+            self.running -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+
 @contextlib.contextmanager
 def notify_about_instance_delete(notifier, context, instance):
     # Pre-load system_metadata because if this context is around an
@@ -132,6 +132,10 @@ class ComputeTaskAPI(object):
             admin_password, injected_files, requested_networks,
             block_device_mapping)
 
+    def cache_images(self, context, aggregate, image_ids):
+        self.conductor_compute_rpcapi.cache_images(context, aggregate,
+                                                   image_ids)
+
     def unshelve_instance(self, context, instance, request_spec=None):
         self.conductor_compute_rpcapi.unshelve_instance(context,
                 instance=instance, request_spec=request_spec)
@@ -14,14 +14,17 @@
 
 """Handles database requests from other nova services."""
 
+import collections
 import contextlib
 import copy
 import functools
 
+import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
 from oslo_utils import excutils
+from oslo_utils import timeutils
 from oslo_utils import versionutils
 import six
 
@@ -218,7 +221,7 @@ class ComputeTaskManager(base.Base):
     may involve coordinating activities on multiple compute nodes.
     """
 
-    target = messaging.Target(namespace='compute_task', version='1.16')
+    target = messaging.Target(namespace='compute_task', version='1.17')
 
     def __init__(self):
         super(ComputeTaskManager, self).__init__()
@@ -234,6 +237,84 @@ class ComputeTaskManager(base.Base):
         compute_rpcapi.LAST_VERSION = None
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
 
+    def cache_images(self, context, aggregate, image_ids):
+        """Download images into the image cache of the hosts of an
+        aggregate.
+
+        Up to CONF.conductor.image_cache_concurrency hosts download the
+        images at the same time. The hosts download the images with the
+        token of the request, so once a host reports that it is not
+        authorized to download them, the hosts which did not start yet are
+        skipped.
+        """
+        timer = timeutils.StopWatch()
+        timer.start()
+        results = collections.Counter()
+        hosts_done = []
+
+        def call_host(ctxt, host):
+            while True:
+                try:
+                    return self.compute_rpcapi.cache_images(
+                        ctxt, host, image_ids,
+                        timeout=CONF.conductor.image_cache_timeout)
+                except messaging.MessagingTimeout:
+                    # The host keeps downloading the images, ask it again
+                    # rather than starting another host. The new call waits
+                    # for the downloads in progress.
+                    service = objects.Service.get_by_compute_host(ctxt,
+                                                                  host)
+                    if not self.servicegroup_api.service_is_up(service):
+                        raise
+                    LOG.info(_LI('Host %s is still caching images, waiting '
+                                 'for it to finish'), host)
+
+        def cache_images_on_host(host):
+            if results['unauthorized']:
+                results['skipped'] += len(image_ids)
+                return
+            # Each host gets its own copy of the context, as targeting a
+            # cell changes the context.
+            ctxt = copy.copy(context)
+            try:
+                host_mapping = objects.HostMapping.get_by_host(ctxt, host)
+                with nova_context.target_cell(ctxt, host_mapping.cell_mapping):
+                    host_results = call_host(ctxt, host)
+            except Exception:
+                LOG.warning(_LW('Failed to cache images on host %s'), host,
+                            exc_info=True)
+                results['error'] += len(image_ids)
+                return
+            LOG.debug('Cached images on host %(host)s: %(results)s',
+                      {'host': host, 'results': host_results})
+            results.update(host_results.values())
+            if 'unauthorized' not in host_results.values():
+                hosts_done.append(host)
+
+        pool = eventlet.GreenPool(CONF.conductor.image_cache_concurrency)
+        for host in aggregate.hosts:
+            pool.spawn_n(cache_images_on_host, host)
+        pool.waitall()
+        summary = {'images': len(image_ids), 'hosts': len(aggregate.hosts),
+                   'aggregate': aggregate.name, 'elapsed': timer.elapsed(),
+                   'results': ', '.join('%d %s' % (count, result) for
+                                        result, count in
+                                        sorted(results.items()))}
+        if results['unauthorized']:
+            summary['done'] = len(hosts_done)
+            LOG.error(_LE('Caching %(images)d images on the hosts of '
+                          'aggregate %(aggregate)s was stopped after '
+                          '%(elapsed).2f seconds, as the hosts were not '
+                          'authorized to download them, most likely because '
+                          'the token of the request expired. %(done)d of the '
+                          '%(hosts)d hosts cached the images: %(results)s. '
+                          'Cache the images again to complete the other '
+                          'hosts.'), summary)
+            return
+        LOG.info(_LI('Cached %(images)d images on the %(hosts)d hosts of '
+                     'aggregate %(aggregate)s in %(elapsed).2f seconds: '
+                     '%(results)s'), summary)
+
     # TODO(tdurakov): remove `live` parameter here on compute task api RPC
     # version bump to 2.x
     @messaging.expected_exceptions(
@@ -557,8 +638,10 @@ class ComputeTaskManager(base.Base):
                 context, image, instances)
             scheduler_utils.populate_retry(
                 filter_properties, instances[0].uuid)
-            hosts = self._schedule_instances(
-                    context, request_spec, filter_properties)
+            with compute_utils.timeline_event(
+                    context, 'schedule_instances', *instances):
+                hosts = self._schedule_instances(
+                        context, request_spec, filter_properties)
         except Exception as exc:
             updates = {'vm_state': vm_states.ERROR, 'task_state': None}
             for instance in instances:
@@ -910,9 +993,11 @@ class ComputeTaskManager(base.Base):
                                      admin_password, injected_files,
                                      requested_networks, block_device_mapping):
         legacy_spec = request_specs[0].to_legacy_request_spec_dict()
+        schedule_start = timeutils.utcnow()
         try:
             hosts = self._schedule_instances(context, legacy_spec,
                         request_specs[0].to_legacy_filter_properties_dict())
+            schedule_finish = timeutils.utcnow()
         except Exception as exc:
             LOG.exception(_LE('Failed to schedule instances'))
             self._bury_in_cell0(context, request_specs[0], exc,
@@ -975,6 +1060,10 @@ class ComputeTaskManager(base.Base):
                 objects.InstanceAction.action_start(
                     context, instance.uuid, instance_actions.CREATE,
                     want_result=False)
+                if CONF.build_timeline:
+                    self._record_build_timeline(
+                        context, instance.uuid, build_request.created_at,
+                        schedule_start, schedule_finish)
                 instance_bdms = self._create_block_device_mapping(
                     instance.flavor, instance.uuid, block_device_mapping)
 
@@ -1012,6 +1101,32 @@ class ComputeTaskManager(base.Base):
                     host=host['host'], node=host['nodename'],
                     limits=host['limits'])
 
+    def _record_build_timeline(self, context, instance_uuid, created_at,
+                               schedule_start, schedule_finish):
+        """Record the stages of a build which preceded its create action.
+
+        The create action of an instance only starts once the instance has
+        been scheduled, so the events of the stages are recorded afterwards
+        with their actual times.
+        """
+        stages = [('schedule_instances', schedule_start, schedule_finish)]
+        if created_at:
+            stages.insert(0, ('wait_for_scheduling', created_at,
+                              schedule_start))
+        try:
+            for event_name, start, finish in stages:
+                values = objects.InstanceActionEvent.pack_action_event_start(
+                    context, instance_uuid, event_name)
+                values['start_time'] = start
+                self.db.action_event_start(context, values)
+                values = objects.InstanceActionEvent.pack_action_event_finish(
+                    context, instance_uuid, event_name)
+                values['finish_time'] = finish
+                self.db.action_event_finish(context, values)
+        except Exception as exc:
+            LOG.debug('Failed to record the build timeline: %s', exc,
+                      instance_uuid=instance_uuid)
+
     def _delete_build_request(self, context, build_request, instance, cell,
                               instance_bdms):
         """Delete a build request after creating the instance in the cell.
@@ -273,6 +273,7 @@ class ComputeTaskAPI(object):
     1.14 - Added request_spec to unshelve_instance()
     1.15 - Added live_migrate_instance
     1.16 - Added schedule_and_build_instances
+    1.17 - Added cache_images
     """
 
     def __init__(self):
@@ -369,6 +370,12 @@ class ComputeTaskAPI(object):
         cctxt = self.client.prepare(version=version)
         cctxt.cast(context, 'schedule_and_build_instances', **kw)
 
+    def cache_images(self, context, aggregate, image_ids):
+        version = '1.17'
+        cctxt = self.client.prepare(version=version)
+        cctxt.cast(context, 'cache_images', aggregate=aggregate,
+                   image_ids=image_ids)
+
     def unshelve_instance(self, context, instance, request_spec=None):
         version = '1.14'
         kw = {'instance': instance,
@@ -541,6 +541,31 @@ Possible values:
 This option specifies whether to start guests that were running before the
 host rebooted. It ensures that all of the instances on a Nova compute node
 resume their state each time the compute node boots or restarts.
+"""),
+    cfg.IntOpt('init_host_workers',
+        default=1,
+        min=1,
+        help="""
+Number of instances initialized concurrently when the compute service starts.
+
+When the compute service starts, it recovers each instance of the host, for
+example by plugging its virtual interfaces, resuming it or completing an
+interrupted operation on it, one instance after the other by default. When
+this is greater than 1, this many instances are recovered at the same time
+instead, which shortens the restart of hosts running many instances. The
+evacuated instances are still destroyed before, and the deferred IPTables
+rules are still applied after, all of the instances have been initialized.
+The progress of the initialization is logged in either case.
+
+Possible values:
+
+* 1: Initialize the instances one after the other (default).
+* Any greater integer.
+
+Related options:
+
+* defer_iptables_apply
+* resume_guests_state_on_host_boot
 """),
     cfg.IntOpt('network_allocate_retries',
         default=0,
@@ -567,6 +592,81 @@ Possible Values:
 
 * 0 : treated as unlimited.
 * Any positive integer representing maximum concurrent builds.
+
+Related options:
+
+* ``max_concurrent_image_downloads``
+* ``max_concurrent_network_allocations``
+* ``max_concurrent_spawns``
+"""),
+    cfg.BoolOpt('build_timeline',
+        default=False,
+        help="""
+Record the timeline of instance builds.
+
+When enabled, the stages of the builds of instances, such as waiting for
+scheduling, scheduling, downloading the image, allocating the network,
+preparing the block devices, spawning the instance and waiting for the
+network interfaces to be plugged, are recorded as events of the ``create``
+instance action, with their start and finish times. They are listed by the
+``os-instance-actions`` API and can be summarized with the
+``tools/boot_timeline.py`` script. Recording each stage costs a few
+requests to the conductor. This option is read by the nova-conductor and
+nova-compute services.
+"""),
+    cfg.IntOpt('max_concurrent_image_downloads',
+        default=0,
+        min=0,
+        help="""
+Maximum number of images downloaded concurrently for instance builds.
+
+By default the image of an instance is downloaded by the compute driver while
+spawning the instance, so that builds waiting on slow image downloads count
+against ``max_concurrent_builds`` and delay the builds of instances whose
+image is already cached on the host. When set, and supported by the compute
+driver, the image of an instance is first downloaded into the image cache of
+the host, with at most this many downloads at the same time, before the build
+counts against ``max_concurrent_builds``.
+
+Possible values:
+
+* 0: Download the images while spawning the instances (default).
+* Any positive integer representing the maximum concurrent downloads.
+
+Related options:
+
+* ``max_concurrent_builds``
+"""),
+    cfg.IntOpt('max_concurrent_network_allocations',
+        default=0,
+        min=0,
+        help="""
+Maximum number of network allocations to run concurrently for instance
+builds.
+
+This limits the requests made to the network service by a burst of builds on
+the host, independently of ``max_concurrent_builds``.
+
+Possible values:
+
+* 0: Unlimited (default).
+* Any positive integer representing the maximum concurrent allocations.
+"""),
+    cfg.IntOpt('max_concurrent_spawns',
+        default=0,
+        min=0,
+        help="""
+Maximum number of instances spawned concurrently by the compute driver.
+
+This limits the load the spawning of a burst of instances puts on the
+hypervisor, independently of ``max_concurrent_builds`` which also covers
+the resource claim, the network allocation and the block device preparation
+of the builds.
+
+Possible values:
+
+* 0: Unlimited (default).
+* Any positive integer representing the maximum concurrent spawns.
 """),
     # TODO(sfinucan): Add min parameter
     cfg.IntOpt('max_concurrent_live_migrations',
@@ -611,6 +711,91 @@ for performance reasons, for example, with Ironic.
 Possible values:
 
 * Any positive integer representing greenthreads count.
+"""),
+    cfg.IntOpt('periodic_task_workers',
+        default=0,
+        min=0,
+        help="""
+Number of periodic tasks of the compute service to run concurrently.
+
+By default the periodic tasks run one after the other, so a slow task, such
+as the audit of the resources of a large host, delays all the others. When
+set, the due tasks are run in a pool of this many greenthreads instead. A
+task is never run twice at the same time: a run is skipped when the previous
+one is still in progress. The duration of each run is logged at debug level.
+
+Possible values:
+
+* 0: Run the periodic tasks one after the other (default).
+* Any positive integer representing the number of tasks run concurrently.
+
+Related options:
+
+* ``periodic_task_jitter``
+* ``periodic_task_deadlines``
+* ``periodic_task_priorities``
+"""),
+    cfg.FloatOpt('periodic_task_jitter',
+        default=0.0,
+        min=0.0,
+        max=1.0,
+        help="""
+Fraction of the interval of a periodic task by which its runs are randomly
+delayed.
+
+This spreads the runs of the periodic tasks of many compute services, and of
+the tasks sharing the same interval within a compute service, over time.
+Only used when ``periodic_task_workers`` is set.
+
+Possible values:
+
+* 0.0: Run the tasks exactly at their interval (default).
+* Any value up to 1.0, for instance 0.1 to delay each run of a task running
+  every 60 seconds by up to 6 seconds.
+"""),
+    cfg.Opt('periodic_task_deadlines',
+        type=types.Dict(types.Float()),
+        default={},
+        help="""
+Maximum number of seconds a run of a periodic task may last.
+
+A run lasting longer is interrupted and a warning is logged. Only used when
+``periodic_task_workers`` is set.
+
+Possible values:
+
+* A list of task:seconds pairs, where task is the name of the method
+  implementing the periodic task. For example:
+
+    periodic_task_deadlines = _poll_bandwidth_usage:120,_sync_power_states:300
+"""),
+    cfg.ListOpt('periodic_task_priorities',
+        default=['update_available_resource'],
+        help="""
+Periodic tasks to run first when several are due.
+
+When more periodic tasks are due than there are ``periodic_task_workers``,
+the tasks in this list are started first, in the order of the list, then the
+others, the longest overdue first. Only used when ``periodic_task_workers``
+is set.
+
+Possible values:
+
+* A list of names of the methods implementing the periodic tasks.
+"""),
+    cfg.BoolOpt('periodic_task_instance_cache',
+        default=False,
+        help="""
+Share the list of the instances of the host between the periodic tasks.
+
+Several periodic tasks of the compute service, such as the ones syncing the
+power states, polling the rebooting and rescued instances and managing the
+image cache, list the instances of the host from the database. When enabled,
+the instances are listed once per run of the periodic tasks and the tasks
+filter this list, so the database or the conductor receives a single query
+instead of one per task. The list is listed again after any operation on an
+instance of the host. The task reclaiming the soft deleted instances deletes
+them, so it always lists them from the database.
 """)
 ]
 
@@ -664,6 +849,30 @@ Related options:
   false and this option is negative, then instances that get out
   of sync between the hypervisor and the Nova database will have
   to be synchronized manually.
+* ``sync_power_state_event_interval``
+"""),
+    cfg.IntOpt('sync_power_state_event_interval',
+        default=3600,
+        help="""
+Interval to sync the power states of all the instances when the power state
+changes are synced on the lifecycle events of the hypervisor.
+
+When ``handle_virt_lifecycle_events`` in workarounds_group is true and the
+compute driver emits lifecycle events, like the libvirt driver does, the
+power state of an instance is synced as soon as it changes on the
+hypervisor. The periodic sync of all the instances, which runs every
+``sync_power_state_interval`` seconds, then only syncs them every this
+many seconds, to recover from missed events.
+
+Possible values:
+
+* 0 or any value < 0: Sync all the instances every
+  ``sync_power_state_interval`` seconds.
+* Any positive integer in seconds.
+
+Related options:
+
+* ``sync_power_state_interval``
 """),
     cfg.IntOpt('heal_instance_info_cache_interval',
         default=60,
@@ -682,6 +891,34 @@ Possible values:
 
 * Any positive integer in seconds.
 * Any value <=0 will disable the sync. This is not recommended.
+
+Related options:
+
+* ``heal_instance_info_cache_batch_size``
+"""),
+    cfg.IntOpt('heal_instance_info_cache_batch_size',
+        default=1,
+        min=1,
+        help="""
+Number of instances whose network information cache is updated at once.
+
+Every ``heal_instance_info_cache_interval`` seconds, each compute node
+updates the network information cache of this many of its instances.
+When greater than 1, the network information of these instances is
+fetched with a few bulk queries to Neutron, instead of several queries per
+instance, so that the caches of all the instances of the host can be
+updated at once.
+
+Possible values:
+
+* 1: Update the cache of one instance every
+  ``heal_instance_info_cache_interval`` seconds.
+* Any greater integer, such as the number of instances of the host to
+  update all of their caches at once.
+
+Related options:
+
+* ``heal_instance_info_cache_interval``
 """),
     cfg.IntOpt('reclaim_instance_interval',
         default=0,
@@ -845,6 +1082,78 @@ Possible values:
 * 0: Will run at the default periodic interval.
 * Any value < 0: Disables the option.
 * Any positive integer in seconds.
+"""),
+    cfg.IntOpt('resource_audit_interval',
+        default=0,
+        min=0,
+        help="""
+Interval between full audits of the resource usage of compute nodes.
+
+By default, every run of the update_available_resources periodic task reloads
+all of the instances and in-progress migrations of each compute node from the
+database and recalculates the resource usage of the node from scratch, which
+blocks resource claims on the host while it runs.
+
+When this is set to a positive value, the resource usage which is maintained
+incrementally by resource claims, usage updates and migrations is kept between
+two audits, and the periodic task only refreshes the resources reported by the
+hypervisor. The full audit then only runs when this many seconds have passed
+since the previous one, and logs a report of any difference it corrected in
+the incrementally tracked usage.
+
+Possible values:
+
+* 0: Do a full audit on every run of the periodic task (default).
+* Any positive integer in seconds.
+
+Related options:
+
+* update_resources_interval
+"""),
+    cfg.IntOpt('update_resources_workers',
+        default=1,
+        min=1,
+        help="""
+Number of compute nodes whose resources are updated concurrently.
+
+Compute drivers such as the Ironic and VMware drivers let a single compute
+service manage many compute nodes, whose resources are updated one after the
+other by the update_available_resources periodic task by default. When this
+is greater than 1, the resources of this many nodes are updated at the same
+time instead. The resources of a given node are still never updated by two
+greenthreads at the same time.
+
+Possible values:
+
+* 1: Update the resources of the nodes one after the other (default).
+* Any greater integer.
+
+Related options:
+
+* update_resources_node_timeout
+"""),
+    cfg.IntOpt('update_resources_node_timeout',
+        default=0,
+        min=0,
+        help="""
+Maximum number of seconds the virt driver may take to report the resources
+of a compute node.
+
+When the driver takes longer, for instance because the hypervisor managing the
+node does not respond, the update of the resources of the node is skipped and
+an error is logged, so that the other nodes of the compute service are still
+updated. The resources of the node are updated again on the next run of the
+update_available_resources periodic task. The accounting of the usage of the
+node which follows is never interrupted.
+
+Possible values:
+
+* 0: Do not interrupt the updates (default).
+* Any positive integer in seconds.
+
+Related options:
+
+* update_resources_workers
 """)
 ]
 
@@ -44,6 +44,47 @@ Topic exchange name on which conductor nodes listen.
         help="""
 Number of workers for OpenStack Conductor service. The default will be the
 number of CPUs available.
+"""),
+    cfg.IntOpt(
+        'image_cache_concurrency',
+        default=1,
+        min=1,
+        help="""
+Number of compute hosts which download images into their image cache at the
+same time, when images are cached on the hosts of an aggregate with the
+``cache_images`` action of the ``os-aggregates`` API.
+
+Each host downloads the images in turn, so that caching the images of a
+rollout on a large aggregate does not overload the image service. The number
+of images each host downloads at the same time is limited by the
+``max_concurrent_image_downloads`` option of the compute service.
+
+The hosts download the images with the token of the request, so the hosts of
+the aggregate must be done before the token expires. Once a host is no longer
+authorized to download the images, the hosts which did not start yet are
+skipped and the conductor logs an error with the results so far. Increase
+this value, or cache the images on smaller aggregates, when the images take
+longer than the lifetime of the tokens to download on all the hosts.
+
+Related options:
+
+* image_cache_timeout
+"""),
+    cfg.IntOpt(
+        'image_cache_timeout',
+        default=1800,
+        min=1,
+        help="""
+Time in seconds to wait for a compute host to download images into its image
+cache, when images are cached on the hosts of an aggregate. Once it expires,
+the host is asked again as long as its compute service is up, as it keeps
+downloading the images, and the next host only starts once it is done. When
+the compute service of the host is down, the images count as failed to cache
+on it and the next host starts.
+
+Related options:
+
+* image_cache_concurrency
 """),
 ]
 
@@ -97,6 +97,49 @@ api_db_opts = [
 ]  # noqa
 
 
+db_profiling_group = cfg.OptGroup('db_profiling',
+                                  title='Database Query Profiling Options',
+                                  help="""
+Options to account the SQL statements issued against the main and API
+databases to the database API functions and requests which issued them.
+""")
+
+db_profiling_opts = [
+    cfg.BoolOpt('enabled',
+                default=False,
+                help="""
+Enable database query profiling.
+
+When enabled, the number of SQL statements, the number of rows they returned
+and the time spent executing them are recorded per database API function and
+per request ID, and the top offenders are logged periodically. This helps
+finding database API calls or requests which issue too many queries, such as
+N+1 query patterns. This adds some overhead to every statement and should
+only be enabled for troubleshooting.
+
+Related options:
+
+* report_interval
+* report_top
+"""),
+    cfg.IntOpt('report_interval',
+               default=300,
+               min=1,
+               help="""
+Number of seconds between two reports of the database query profiling.
+
+The statistics are reset after each report.
+"""),
+    cfg.IntOpt('report_top',
+               default=10,
+               min=1,
+               help="""
+Number of database API functions and requests listed in each report of the
+database query profiling.
+"""),
+]
+
+
 def enrich_help_text(alt_db_opts):
 
     def get_db_opts():
@@ -117,6 +160,8 @@ def register_opts(conf):
     oslo_db_options.set_defaults(conf, connection=_DEFAULT_SQL_CONNECTION)
     conf.register_opt(db_driver_opt)
     conf.register_opts(api_db_opts, group=api_db_group)
+    conf.register_group(db_profiling_group)
+    conf.register_opts(db_profiling_opts, group=db_profiling_group)
 
 
 def list_opts():
@@ -130,4 +175,5 @@ def list_opts():
     enrich_help_text(api_db_opts)
     return {'DEFAULT': [db_driver_opt],
             api_db_group: api_db_opts,
+            db_profiling_group: db_profiling_opts,
             }
@@ -83,6 +83,86 @@ Related options:
 
 * The options in the `key_manager` group, as the key_manager is used
   for the signature validation.
+"""),
+    cfg.IntOpt('download_workers',
+        default=1,
+        min=1,
+        help="""
+Number of concurrent connections used to download an image.
+
+When greater than 1, images are downloaded to the compute host with
+concurrent HTTP range requests, each fetching a part of the image of
+``download_range_size`` MiB, which spreads the transfer of large images over
+several connections. An interrupted range is resumed from the last byte
+received rather than restarting the download, and the checksum of the image
+and its signature, if ``verify_glance_signatures`` is enabled, are verified as
+the parts complete. Images are downloaded sequentially over a single
+connection when the image API does not support range requests.
+
+Related options:
+
+* download_range_size
+* download_range_retries
+"""),
+    cfg.IntOpt('download_range_size',
+        default=64,
+        min=1,
+        help="""
+Size in MiB of the parts of an image fetched by each range request.
+
+Related options:
+
+* download_workers
+"""),
+    cfg.IntOpt('download_range_retries',
+        default=3,
+        min=0,
+        help="""
+Number of times the download of a part of an image is resumed after it is
+interrupted, before the download of the image fails.
+
+Related options:
+
+* download_workers
+"""),
+    cfg.ListOpt('peer_image_cache_urls',
+        default=[],
+        help="""
+List of URLs of the image caches of peer compute hosts.
+
+When set, images are first downloaded from the image cache of a peer compute
+host which already holds them, in random order of the peers, before falling
+back to downloading them from glance. This spreads the load of the rollout of
+a new image over the hosts which already fetched it. Each URL must serve the
+``_base`` image cache directory of a host, for example with a read-only
+static HTTP server, so that an image is available under the name the libvirt
+driver gives to the cached copy of the image.
+
+Images downloaded from a peer are verified against the checksum of the image
+in glance, and against its signature if ``verify_glance_signatures`` is
+enabled. Images without a checksum, and images other than raw ones when
+``force_raw_images`` is enabled, as the cached copies of those are converted,
+are always downloaded from glance.
+
+Possible values:
+
+* Empty list (default), to download images from glance only
+* A list of URLs, for example ``http://compute1:8080/``
+
+Related options:
+
+* peer_download_timeout
+"""),
+    cfg.IntOpt('peer_download_timeout',
+        default=30,
+        min=1,
+        help="""
+Timeout in seconds to connect to, and wait for data from, a peer compute host
+when downloading an image from its image cache.
+
+Related options:
+
+* peer_image_cache_urls
 """),
     cfg.BoolOpt('debug',
          default=False,
@@ -603,6 +603,23 @@ Create sparse logical volumes (with virtualsize) if this flag is set to True.
     cfg.StrOpt('images_rbd_ceph_conf',
                default='',  # default determined by librados
                help='Path to the ceph configuration file to use'),
+    cfg.BoolOpt('images_reflink',
+                default=False,
+                help="""
+Clone base images into instance disks with reflinks.
+
+When this is enabled, the flat and qcow2 image backends create the copies of
+the cached base images they need with ``cp --reflink=auto``. On filesystems
+which support reflinks, such as XFS and btrfs, the copy then shares the data
+blocks of the base image and is created almost instantly whatever the size of
+the image, the blocks being copied only when the instance writes to them. On
+other filesystems the image is copied in full, as when this is disabled.
+
+Related options:
+
+* images_type
+* preallocate_images
+"""),
     cfg.StrOpt('hw_disk_discard',
                choices=('ignore', 'unmap'),
                help="""
@@ -648,6 +665,72 @@ libvirt_imagecache_opts = [
                                  'Data integrity can be checked at the block '
                                  'or filesystem level.',
                help='How frequently to checksum base images'),
+    cfg.BoolOpt('image_cache_usage_index',
+                default=False,
+                help="""
+Maintain a persistent index of the base images used by the instance disks.
+
+Each pass of the image cache manager runs ``qemu-img info`` on the disk of
+every instance in the instances directory to find the base images they use,
+which includes the instances of all the hosts sharing the instances directory.
+When enabled, the backing file of each disk is recorded in an index in the
+image cache when the instance is spawned, and dropped when it is deleted, so
+that a pass only probes the disks missing from the index or which were
+replaced since they were recorded. Each host keeps its own index file in the
+``.usage`` subdirectory of the image cache, and reads the ones of the other
+hosts sharing the instances directory.
+
+Related options:
+
+* image_cache_manager_interval
+"""),
+    cfg.IntOpt('image_cache_max_size',
+               default=0,
+               min=0,
+               help="""
+Maximum space used by the image cache, in MiB.
+
+When the image cache manager finds the files of the image cache using more
+space than this, it removes the unused base images, least recently used
+first, until the cache fits, even if they are younger than the minimum ages
+of unused base images. Base images used by instances are never removed.
+Along with long minimum ages, this keeps unused images around for as long as
+there is room for them.
+
+Possible values:
+
+* 0 - no limit
+* >0 - maximum space used by the image cache, in MiB
+
+Related options:
+
+* image_cache_min_free_space
+* remove_unused_base_images
+* remove_unused_original_minimum_age_seconds
+* remove_unused_resized_minimum_age_seconds
+"""),
+    cfg.IntOpt('image_cache_min_free_space',
+               default=0,
+               min=0,
+               help="""
+Minimum free space to keep on the filesystem of the image cache, in MiB.
+
+When the image cache manager finds less free space than this on the
+filesystem of the image cache, it removes the unused base images, least
+recently used first, until there is enough free space or no unused base image
+is left, even if they are younger than the minimum ages of unused base images.
+Base images used by instances are never removed.
+
+Possible values:
+
+* 0 - no minimum
+* >0 - free space to keep on the filesystem of the image cache, in MiB
+
+Related options:
+
+* image_cache_max_size
+* remove_unused_base_images
+"""),
 ]
 
 libvirt_lvm_opts = [
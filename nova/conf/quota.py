@@ -286,6 +286,29 @@ This defaults to 0 (off) to avoid additional load but it is useful to turn on
 to help keep quota usage up-to-date and reduce the impact of out of sync usage
 issues. Note that quotas are not updated on a periodic task, they will update
 on a new reservation if max_age has passed since the last reservation.
+"""),
+    cfg.IntOpt('usage_shards',
+        min=1,
+        default=1,
+        help="""
+The number of counter shards used to track quota usage per user and resource.
+
+By default, every reservation locks all of the quota usage records of the
+project for the duration of the quota check, which serializes concurrent
+requests in the same project. When set to a value greater than 1, the usage of
+each resource is spread over up to this many records and a reservation only
+locks the record it updates. The quota check is then done against an unlocked
+read of the usage and re-checked once the reservation is committed, so a burst
+of concurrent requests close to the limit may be rejected even though some of
+them would have fit, but the limit is never exceeded.
+
+Usage records are refreshed and their shards merged back into a single record
+whenever a reservation requires a usage refresh (see ``max_age``). The
+``until_refresh`` option is not honored for sharded reservations.
+
+Related options:
+
+* max_age
 """),
 
 # TODO(pumaranikar): Add a new config to select between the db_driver and
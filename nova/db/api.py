@@ -841,6 +841,25 @@ def instance_update_and_get_original(context, instance_uuid, values,
     return rv
 
 
+def instance_update_and_get_original_many(context, values_by_uuid,
+                                          columns_to_join=None):
+    """Set the given properties on many instances in a single transaction.
+
+    :param context: = request context object
+    :param values_by_uuid: = dict of instance uuid to the dict of column
+                             values to set on that instance
+
+    Instances which no longer exist or which fail their
+    "expected_task_state"/"expected_vm_state" check are not updated and are
+    left out of the result.
+
+    :returns: a dict of instance uuid to a tuple of the form
+              (old_instance_ref, new_instance_ref)
+    """
+    return IMPL.instance_update_and_get_original_many(
+        context, values_by_uuid, columns_to_join=columns_to_join)
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -1217,6 +1236,16 @@ def quota_reserve(context, resources, quotas, user_quotas, deltas, expire,
                               project_id=project_id, user_id=user_id)
 
 
+def quota_reserve_sharded(context, resources, quotas, user_quotas, deltas,
+                          expire, until_refresh, max_age, shards,
+                          project_id=None, user_id=None):
+    """Check quotas and create reservations against sharded usages."""
+    return IMPL.quota_reserve_sharded(context, resources, quotas, user_quotas,
+                                      deltas, expire, until_refresh, max_age,
+                                      shards, project_id=project_id,
+                                      user_id=user_id)
+
+
 def reservation_commit(context, reservations, project_id=None, user_id=None):
     """Commit quota reservations."""
     return IMPL.reservation_commit(context, reservations,
@@ -22,6 +22,7 @@ import copy
 import datetime
 import functools
 import inspect
+import random
 import sys
 
 from oslo_db import api as oslo_db_api
@@ -64,6 +65,7 @@ from nova.compute import vm_states
 import nova.conf
 import nova.context
 from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import query_stats
 from nova import exception
 from nova.i18n import _, _LI, _LE, _LW
 from nova import quota
@@ -120,6 +122,13 @@ def configure(conf):
         api_context_manager.append_on_engine_create(
             lambda eng: profiler_sqlalchemy.add_tracing(sa, eng, "db"))
 
+    if CONF.db_profiling.enabled:
+        query_stats.enable()
+        main_context_manager.append_on_engine_create(
+            query_stats.add_listeners)
+        api_context_manager.append_on_engine_create(
+            query_stats.add_listeners)
+
 
 def create_context_manager(connection=None):
     """Create a database context manager object.
@@ -232,7 +241,7 @@ def select_db_reader_mode(f):
         else:
             reader_mode = get_context_manager(context).reader
 
-        with reader_mode.using(context):
+        with query_stats.scope(f), reader_mode.using(context):
             return f(*args, **kwargs)
     return wrapper
 
@@ -247,7 +256,7 @@ def pick_context_manager_writer(f):
     @functools.wraps(f)
     def wrapped(context, *args, **kwargs):
         ctxt_mgr = get_context_manager(context)
-        with ctxt_mgr.writer.using(context):
+        with query_stats.scope(f), ctxt_mgr.writer.using(context):
             return f(context, *args, **kwargs)
     return wrapped
 
@@ -262,7 +271,7 @@ def pick_context_manager_reader(f):
     @functools.wraps(f)
     def wrapped(context, *args, **kwargs):
         ctxt_mgr = get_context_manager(context)
-        with ctxt_mgr.reader.using(context):
+        with query_stats.scope(f), ctxt_mgr.reader.using(context):
             return f(context, *args, **kwargs)
     return wrapped
 
@@ -277,7 +286,8 @@ def pick_context_manager_reader_allow_async(f):
     @functools.wraps(f)
     def wrapped(context, *args, **kwargs):
         ctxt_mgr = get_context_manager(context)
-        with ctxt_mgr.reader.allow_async.using(context):
+        with query_stats.scope(f), \
+                ctxt_mgr.reader.allow_async.using(context):
             return f(context, *args, **kwargs)
     return wrapped
 
@@ -2655,6 +2665,51 @@ def instance_update_and_get_original(context, instance_uuid, values,
         context, instance_uuid, values, expected, original=instance_ref))
 
 
+@require_context
+@_retry_instance_update()
+@pick_context_manager_writer
+def instance_update_and_get_original_many(context, values_by_uuid,
+                                          columns_to_join=None):
+    """Set the given properties on many instances in a single transaction.
+
+    :param context: = request context object
+    :param values_by_uuid: = dict of instance uuid to the dict of column
+                             values to set on that instance
+
+    The "expected_task_state" and "expected_vm_state" checks are applied to
+    each instance on its own: an instance whose states do not match, or
+    which no longer exists, is left untouched and the other instances are
+    still updated.
+
+    :returns: a dict of instance uuid to a tuple of the form
+              (old_instance_ref, new_instance_ref) for every instance which
+              was updated
+    """
+    if not values_by_uuid:
+        return {}
+    originals = _build_instance_get(context, columns_to_join=columns_to_join).\
+                    filter(models.Instance.uuid.in_(list(values_by_uuid))).\
+                    all()
+    result = {}
+    for instance_ref in originals:
+        instance_uuid = instance_ref['uuid']
+        old_ref = copy.copy(instance_ref)
+        try:
+            # _instance_update pops the expected states out of the values,
+            # pass a copy so that a retried transaction still sees them.
+            new_ref = _instance_update(context, instance_uuid,
+                                       dict(values_by_uuid[instance_uuid]),
+                                       None, original=instance_ref)
+        except exception.UnknownInstanceUpdateConflict:
+            raise
+        except exception.InstanceUpdateConflict as e:
+            LOG.debug('Not updating instance %(uuid)s: %(error)s',
+                      {'uuid': instance_uuid, 'error': e})
+            continue
+        result[instance_uuid] = (old_ref, new_ref)
+    return result
+
+
 # NOTE(danms): This updates the instance's metadata list in-place and in
 # the database to avoid stale data and refresh issues. It assumes the
 # delete=True behavior of instance_metadata_update(...)
@@ -3613,10 +3668,33 @@ def _get_project_user_quota_usages(context, project_id, user_id):
         proj_result[row.resource]['reserved'] += row.reserved
         proj_result[row.resource]['total'] += (row.in_use + row.reserved)
         if row.user_id is None or row.user_id == user_id:
-            user_result[row.resource] = row
+            usage = user_result.get(row.resource)
+            if usage is not None and usage.user_id == row.user_id:
+                _merge_quota_usage_shard(context, usage, row)
+            else:
+                user_result[row.resource] = row
     return proj_result, user_result
 
 
+def _merge_quota_usage_shard(context, usage, shard):
+    """Folds a usage counter shard into the first usage record.
+
+    Sharded reservations (see quota_reserve_sharded) spread the usage of a
+    resource over several records. Whenever the usages are locked for the
+    project, the shards of the user are merged back into a single record so
+    that the refresh logic only ever has to deal with one.
+
+    :param usage: The QuotaUsage record the shard is merged into.
+    :param shard: Another QuotaUsage record for the same user and resource.
+    """
+    usage.in_use += shard.in_use
+    usage.reserved += shard.reserved
+    model_query(context, models.Reservation, read_deleted="no").\
+        filter_by(usage_id=shard.id).\
+        update({'usage_id': usage.id}, synchronize_session=False)
+    shard.soft_delete(context.session)
+
+
 def _create_quota_usage_if_missing(user_usages, resource, until_refresh,
                                    project_id, user_id, session):
     """Creates a QuotaUsage record and adds to user_usages if not present.
@@ -3919,6 +3997,191 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
     return reservations
 
 
+@pick_context_manager_reader
+def _quota_usage_shards_get(context, project_id, user_id):
+    """Returns the usage totals of a project and user, and the user shards.
+
+    Unlike _get_project_user_quota_usages, this does not lock anything.
+
+    :return: A tuple of the project usages and the user usages, both dicts of
+             resource keys to dicts of in_use, reserved and total, and a dict
+             of resource keys to the list of QuotaUsage records of the user,
+             as dicts of id and updated_at, in id order.
+    """
+    rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+        filter_by(project_id=project_id).\
+        order_by(models.QuotaUsage.id.asc()).\
+        all()
+    project_usages = collections.defaultdict(
+        lambda: dict(in_use=0, reserved=0, total=0))
+    user_usages = collections.defaultdict(
+        lambda: dict(in_use=0, reserved=0, total=0))
+    shards = collections.defaultdict(list)
+    for row in rows:
+        usages = [project_usages[row.resource]]
+        if row.user_id is None or row.user_id == user_id:
+            usages.append(user_usages[row.resource])
+            shards[row.resource].append(
+                dict(id=row.id, updated_at=row.updated_at or row.created_at))
+        for usage in usages:
+            usage['in_use'] += row.in_use
+            usage['reserved'] += row.reserved
+            usage['total'] += row.in_use + row.reserved
+    return project_usages, user_usages, shards
+
+
+def _is_sharded_refresh_needed(user_usages, shards, keys, max_age):
+    """Determines if a sharded reservation needs a usage refresh.
+
+    :param user_usages: dict of resource keys to the usage totals of the user.
+    :param shards:      dict of resource keys to the QuotaUsage shards of the
+                        user, as returned by _quota_usage_shards_get.
+    :param keys:        The resources being reserved.
+    :param max_age:     Number of seconds between subsequent usage refreshes.
+    :return:            True if a refresh is needed, False otherwise.
+    """
+    for resource in keys:
+        if not shards[resource]:
+            return True
+        if user_usages[resource]['in_use'] < 0:
+            LOG.debug('in_use has dropped below 0; forcing refresh for '
+                      'resource %s', resource)
+            return True
+        if max_age:
+            updated_at = max(shard['updated_at'] for shard in shards[resource])
+            if (timeutils.utcnow() - updated_at).total_seconds() >= max_age:
+                return True
+    return False
+
+
+def _sharded_over_quota(overs, project_quotas, user_quotas, project_usages,
+                        user_usages):
+    if project_quotas == user_quotas:
+        usages = project_usages
+    else:
+        usages = user_usages
+    usages = {k: dict(in_use=v['in_use'], reserved=v['reserved'])
+              for k, v in usages.items()}
+    return exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
+                               usages=usages)
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@pick_context_manager_writer
+def _quota_shard_reserve(context, shard_ids, deltas, expire, project_id,
+                         user_id):
+    """Creates reservations against the given usage shards.
+
+    Only the QuotaUsage records the reservations are made against are locked.
+
+    :param shard_ids: dict of resource keys to the id of the QuotaUsage record
+                      to reserve against, or None to create a new shard.
+    :return:          The list of reservation uuids.
+    """
+    ids = [shard_id for shard_id in shard_ids.values() if shard_id is not None]
+    usages = {}
+    if ids:
+        rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+            filter(models.QuotaUsage.id.in_(ids)).\
+            order_by(models.QuotaUsage.id.asc()).\
+            with_lockmode('update').\
+            all()
+        usages = {row.id: row for row in rows}
+
+    reservations = []
+    for res, delta in deltas.items():
+        usage = usages.get(shard_ids[res])
+        if usage is None:
+            # Either we were asked for a new shard, or the one we picked has
+            # been merged back since we looked it up.
+            user_id_to_use = user_id
+            if res in PER_PROJECT_QUOTAS:
+                user_id_to_use = None
+            usage = _quota_usage_create(project_id, user_id_to_use, res,
+                                        0, 0, None, context.session)
+        reservation = _reservation_create(uuidutils.generate_uuid(), usage,
+                                          project_id, user_id, res, delta,
+                                          expire, context.session)
+        reservations.append(reservation.uuid)
+        # Only positive increments are reserved, see quota_reserve.
+        if delta > 0:
+            usage.reserved += delta
+            context.session.add(usage)
+    return reservations
+
+
+@require_context
+def quota_reserve_sharded(context, resources, project_quotas, user_quotas,
+                          deltas, expire, until_refresh, max_age, shards,
+                          project_id=None, user_id=None):
+    """Check quotas and reserve resources against sharded usage counters.
+
+    This is quota_reserve without the lock on all of the usages of the
+    project. The quota check is done against an unlocked read of the usages,
+    each reservation is then recorded against one of up to ``shards`` usage
+    records of the resource, picked at random, and only that record is
+    locked. Once the reservations are committed, the usages are read again
+    and the reservations are rolled back if concurrent requests took the
+    project or user over quota in the meantime.
+
+    Whenever a usage refresh is needed, this falls back to quota_reserve,
+    which merges the shards of the user back into a single record.
+    """
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    project_usages, user_usages, usage_shards = _quota_usage_shards_get(
+        context, project_id, user_id)
+    if _is_sharded_refresh_needed(user_usages, usage_shards, deltas.keys(),
+                                  max_age):
+        return quota_reserve(context, resources, project_quotas, user_quotas,
+                             deltas, expire, until_refresh, max_age,
+                             project_id=project_id, user_id=user_id)
+
+    overs = _calculate_overquota(project_quotas, user_quotas, deltas,
+                                 project_usages, user_usages)
+    if overs:
+        raise _sharded_over_quota(overs, project_quotas, user_quotas,
+                                  project_usages, user_usages)
+
+    unders = [res for res, delta in deltas.items()
+              if delta < 0 and delta + user_usages[res]['in_use'] < 0]
+    if unders:
+        LOG.warning(_LW("Change will make usage less than 0 for the following "
+                        "resources: %s"), unders)
+
+    shard_ids = {}
+    for res in deltas:
+        index = random.randrange(shards)
+        if index < len(usage_shards[res]):
+            shard_ids[res] = usage_shards[res][index]['id']
+        else:
+            shard_ids[res] = None
+    reservations = _quota_shard_reserve(context, shard_ids, deltas, expire,
+                                        project_id, user_id)
+
+    # Our reservations are now part of the usages, so the project or user is
+    # over quota if the totals alone exceed the limits.
+    recheck = {res: 0 for res, delta in deltas.items() if delta > 0}
+    if recheck:
+        project_usages, user_usages, _shards = _quota_usage_shards_get(
+            context, project_id, user_id)
+        overs = _calculate_overquota(project_quotas, user_quotas, recheck,
+                                     project_usages, user_usages)
+        if overs:
+            LOG.debug('Concurrent reservations went over quota for resources '
+                      '%(overs)s, rolling back reservations %(reservations)s',
+                      {'overs': overs, 'reservations': reservations})
+            reservation_rollback(context, reservations, project_id=project_id,
+                                 user_id=user_id)
+            raise _sharded_over_quota(overs, project_quotas, user_quotas,
+                                      project_usages, user_usages)
+
+    return reservations
+
+
 def _quota_reservations_query(context, reservations):
     """Return the relevant reservations."""
 
@@ -3928,15 +4191,51 @@ def _quota_reservations_query(context, reservations):
         with_lockmode('update')
 
 
+def _get_reservation_quota_usages(context, reservations):
+    """Locks the QuotaUsage records the given reservations were made against.
+
+    Only the referenced records are locked rather than all of the usages of
+    the project, so that committing reservations does not serialize with
+    reservations made against other (sharded) records.
+
+    :return: dict of QuotaUsage ids to records.
+    """
+    rows = model_query(context, models.Reservation,
+                       (models.Reservation.usage_id,), read_deleted="no").\
+        filter(models.Reservation.uuid.in_(reservations)).\
+        all()
+    usage_ids = set(row.usage_id for row in rows)
+    if not usage_ids:
+        return {}
+    rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+        filter(models.QuotaUsage.id.in_(usage_ids)).\
+        order_by(models.QuotaUsage.id.asc()).\
+        with_lockmode('update').\
+        all()
+    return {row.id: row for row in rows}
+
+
+def _get_reservation_quota_usage(context, usages, reservation):
+    usage = usages.get(reservation.usage_id)
+    if usage is None:
+        # The shard the reservation was made against has been merged into
+        # another record since we looked the reservations up.
+        usage = model_query(context, models.QuotaUsage, read_deleted="no").\
+            filter_by(id=reservation.usage_id).\
+            with_lockmode('update').\
+            one()
+        usages[usage.id] = usage
+    return usage
+
+
 @require_context
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @pick_context_manager_writer
 def reservation_commit(context, reservations, project_id=None, user_id=None):
-    _project_usages, user_usages = _get_project_user_quota_usages(
-            context, project_id, user_id)
+    usages = _get_reservation_quota_usages(context, reservations)
     reservation_query = _quota_reservations_query(context, reservations)
     for reservation in reservation_query.all():
-        usage = user_usages[reservation.resource]
+        usage = _get_reservation_quota_usage(context, usages, reservation)
         if reservation.delta >= 0:
             usage.reserved -= reservation.delta
         usage.in_use += reservation.delta
@@ -3947,11 +4246,10 @@ def reservation_commit(context, reservations, project_id=None, user_id=None):
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 @pick_context_manager_writer
 def reservation_rollback(context, reservations, project_id=None, user_id=None):
-    _project_usages, user_usages = _get_project_user_quota_usages(
-            context, project_id, user_id)
+    usages = _get_reservation_quota_usages(context, reservations)
     reservation_query = _quota_reservations_query(context, reservations)
     for reservation in reservation_query.all():
-        usage = user_usages[reservation.resource]
+        usage = _get_reservation_quota_usage(context, usages, reservation)
         if reservation.delta >= 0:
             usage.reserved -= reservation.delta
     reservation_query.soft_delete(synchronize_session=False)
@@ -6172,10 +6470,16 @@ def action_event_finish(context, values):
                                     request_id=values['request_id'],
                                     instance_uuid=values['instance_uuid'])
 
-    event_ref = model_query(context, models.InstanceActionEvent).\
-                            filter_by(action_id=action['id']).\
-                            filter_by(event=values['event']).\
-                            first()
+    query = model_query(context, models.InstanceActionEvent).\
+                        filter_by(action_id=action['id']).\
+                        filter_by(event=values['event'])
+    # An event can be started again under the same name, by the retries of
+    # a stage of a build for instance, so finish the last one started.
+    event_ref = query.filter_by(finish_time=None).\
+                      order_by(desc("id")).\
+                      first()
+    if not event_ref:
+        event_ref = query.first()
 
     if not event_ref:
         raise exception.InstanceActionEventNotFound(action_id=action['id'],
@@ -0,0 +1,223 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Database query profiling.
+
+When [db_profiling]/enabled is set, every SQL statement executed on the main
+and API database engines is accounted to the database API function which
+issued it and to the request ID of the current RequestContext, and the top
+offenders are logged every [db_profiling]/report_interval seconds.
+
+Database API functions are the functions of nova.db.sqlalchemy.api decorated
+with one of its context manager decorators, which enter a scope() around the
+call. Statements issued outside of such a scope, for instance by the API
+database functions of nova.objects, are accounted to the innermost nova
+function on the stack.
+"""
+
+import sys
+import threading
+import time
+
+from oslo_context import context as common_context
+from oslo_log import log as logging
+from sqlalchemy import event
+
+import nova.conf
+from nova.i18n import _LI
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
+
+_enabled = False
+_local = threading.local()
+_lock = threading.Lock()
+_function_stats = {}
+_request_stats = {}
+_last_report = time.time()
+
+
+class QueryStats(object):
+    """Statements issued by a database API function or a request."""
+
+    __slots__ = ('calls', 'statements', 'rows', 'time')
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.rows = 0
+        self.time = 0.0
+
+    def __repr__(self):
+        return ('%d calls, %d statements, %d rows, %.3fs' %
+                (self.calls, self.statements, self.rows, self.time))
+
+
+class _NullScope(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope(object):
+    def __init__(self, name):
+        self.name = name
+        self.outermost = False
+
+    def __enter__(self):
+        # Nested database API calls are accounted to the outermost one.
+        if getattr(_local, 'name', None) is None:
+            _local.name = self.name
+            self.outermost = True
+            request_id = _request_id()
+            with _lock:
+                _get_stats(_function_stats, self.name).calls += 1
+                if request_id:
+                    _get_stats(_request_stats, request_id).calls += 1
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.outermost:
+            _local.name = None
+
+
+def enable():
+    """Start accounting statements to scopes and requests."""
+    global _enabled
+    _enabled = True
+
+
+def scope(func):
+    """Returns a context manager accounting statements to func.
+
+    :param func: The database API function being called.
+    """
+    if not _enabled:
+        return _NULL_SCOPE
+    return _Scope(func.__name__)
+
+
+def add_listeners(engine):
+    """Account the statements executed on engine."""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info['query_stats_start'] = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = conn.info.pop('query_stats_start', None)
+    if start is not None:
+        # rowcount is -1 when the driver does not know it.
+        record(time.time() - start, max(cursor.rowcount, 0))
+
+
+def _get_stats(stats, key):
+    try:
+        return stats[key]
+    except KeyError:
+        stats[key] = QueryStats()
+        return stats[key]
+
+
+def _request_id():
+    return getattr(common_context.get_current(), 'request_id', None)
+
+
+def _caller():
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('nova.') and module != __name__:
+            return '%s.%s' % (module, frame.f_code.co_name)
+        frame = frame.f_back
+    return 'unknown'
+
+
+def record(duration, rows):
+    """Account a statement to the current scope and request.
+
+    :param duration: Seconds spent executing the statement.
+    :param rows: Number of rows returned or affected by the statement.
+    """
+    if not _enabled:
+        return
+    name = getattr(_local, 'name', None) or _caller()
+    request_id = _request_id()
+    with _lock:
+        keys = [(_function_stats, name)]
+        if request_id:
+            keys.append((_request_stats, request_id))
+        for stats, key in keys:
+            query_stats = _get_stats(stats, key)
+            query_stats.statements += 1
+            query_stats.rows += rows
+            query_stats.time += duration
+        due = time.time() - _last_report >= CONF.db_profiling.report_interval
+    if due:
+        report()
+
+
+def get_stats():
+    """Returns the statistics recorded since the last report.
+
+    :returns: A tuple of dicts of QueryStats, keyed by database API function
+              and by request ID.
+    """
+    with _lock:
+        return dict(_function_stats), dict(_request_stats)
+
+
+def report():
+    """Log the top offenders since the last report and reset the stats."""
+    global _function_stats, _request_stats, _last_report
+    with _lock:
+        functions, requests = _function_stats, _request_stats
+        _function_stats, _request_stats = {}, {}
+        interval = time.time() - _last_report
+        _last_report = time.time()
+    if not functions:
+        return
+
+    top = CONF.db_profiling.report_top
+    functions = sorted(functions.items(), key=lambda item: item[1].time,
+                       reverse=True)[:top]
+    requests = sorted(requests.items(), key=lambda item: item[1].statements,
+                      reverse=True)[:top]
+    LOG.info(_LI('Database query profiling over the last %(interval)d '
+                 'seconds.\nTop database API functions by time:\n'
+                 '%(functions)s\nTop requests by statements:\n%(requests)s'),
+             {'interval': interval,
+              'functions': _format(functions),
+              'requests': _format(requests)})
+
+
+def _format(stats):
+    return '\n'.join('  %s: %r' % item for item in stats) or '  (none)'
+
+
+def reset():
+    """Stop accounting and drop the statistics."""
+    global _enabled, _function_stats, _request_stats, _last_report
+    with _lock:
+        _enabled = False
+        _function_stats, _request_stats = {}, {}
+        _last_report = time.time()
+    _local.name = None
@@ -1634,6 +1634,19 @@ class ImageDownloadModuleConfigurationError(ImageDownloadModuleError):
     msg_fmt = _("The module %(module)s is misconfigured: %(reason)s.")
 
 
+class ImageDownloadFailed(NovaException):
+    msg_fmt = _("Download of image %(image_id)s failed: %(reason)s")
+
+
+class ImageChecksumMismatch(ImageDownloadFailed):
+    msg_fmt = _("Checksum of the data of image %(image_id)s does not match: "
+                "expected %(expected)s, got %(actual)s.")
+
+
+class ImageCacheNotSupported(NovaException):
+    msg_fmt = _("Host %(host)s does not support caching images.")
+
+
 class SignatureVerificationError(NovaException):
     msg_fmt = _("Signature verification for the image "
                 "failed: %(reason)s.")
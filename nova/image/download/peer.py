@@ -0,0 +1,147 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Transfer module downloading images from the image caches of peer compute
+hosts.
+"""
+
+import hashlib
+import os
+import random
+
+import cryptography
+from oslo_log import log as logging
+from oslo_utils import excutils
+from oslo_utils import units
+import requests
+
+import nova.conf
+from nova.i18n import _LE, _LI, _LW
+
+LOG = logging.getLogger(__name__)
+CONF = nova.conf.CONF
+
+CHUNK_SIZE = 64 * units.Ki
+
+
+def _cache_name(image_id):
+    # The name of the cached copy of an image in the image cache of the
+    # libvirt driver.
+    return hashlib.sha1(image_id.encode('utf-8')).hexdigest()
+
+
+class PeerTransfer(object):
+    """Downloads images from the image caches listed in
+    [glance]/peer_image_cache_urls.
+    """
+
+    def __init__(self, urls=None):
+        self.urls = urls if urls is not None else \
+            CONF.glance.peer_image_cache_urls
+
+    def _fetch(self, url, dst_path, checksum):
+        """Download url to dst_path.
+
+        :returns: True if the data downloaded matches checksum, False if the
+                  peer does not have the image or the data does not match.
+        """
+        resp = requests.get(url, stream=True,
+                            timeout=CONF.glance.peer_download_timeout)
+        try:
+            if resp.status_code != requests.codes.ok:
+                LOG.debug('Peer image cache %(url)s returned %(status)d',
+                          {'url': url, 'status': resp.status_code})
+                return False
+            md5 = hashlib.md5()
+            with open(dst_path, 'wb') as f:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    md5.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            resp.close()
+
+        if md5.hexdigest() != checksum:
+            LOG.warning(_LW('Checksum of the image downloaded from %(url)s '
+                            'does not match, expected %(expected)s, got '
+                            '%(actual)s'),
+                        {'url': url, 'expected': checksum,
+                         'actual': md5.hexdigest()})
+            return False
+        return True
+
+    def _verify_signature(self, image_id, dst_path, verifier):
+        with open(dst_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                verifier.update(chunk)
+        try:
+            verifier.verify()
+        except cryptography.exceptions.InvalidSignature:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_LE('Image signature verification failed '
+                              'for image: %s'), image_id)
+                with open(dst_path, 'wb'):
+                    pass
+        LOG.info(_LI('Image signature verification succeeded '
+                     'for image %s'), image_id)
+
+    def download(self, context, image_meta, dst_path, verifier=None):
+        """Download an image from the image cache of a peer.
+
+        :param context: The security context
+        :param image_meta: The dict of the image, as returned by the show()
+                           method of the image service
+        :param dst_path: The path of the file to download the image to
+        :param verifier: (Optional) The verifier of the signature of the
+                         image, updated with the data of the image once it
+                         is downloaded from a peer
+        :returns: True if the image was downloaded from a peer, False if no
+                  peer could provide it, in which case dst_path should be
+                  downloaded from glance.
+        :raises: InvalidSignature if the image downloaded from a peer does
+                 not match its signature.
+        """
+        image_id = image_meta['id']
+        checksum = image_meta.get('checksum')
+        if not checksum:
+            return False
+        if CONF.force_raw_images and image_meta.get('disk_format') != 'raw':
+            # The image caches of peers hold converted copies of the image,
+            # which do not match its checksum.
+            return False
+
+        name = _cache_name(image_id)
+        for base_url in random.sample(self.urls, len(self.urls)):
+            url = '%s/%s' % (base_url.rstrip('/'), name)
+            try:
+                if self._fetch(url, dst_path, checksum):
+                    break
+            except Exception as e:
+                LOG.warning(_LW('Failed to download image %(image_id)s from '
+                                '%(url)s: %(error)s'),
+                            {'image_id': image_id, 'url': url, 'error': e})
+        else:
+            if os.path.exists(dst_path):
+                with open(dst_path, 'wb'):
+                    pass
+            return False
+
+        LOG.info(_LI('Downloaded image %(image_id)s from %(url)s'),
+                 {'image_id': image_id, 'url': url})
+        if verifier:
+            self._verify_signature(image_id, dst_path, verifier)
+        return True
+
+
+def get_download_handler(**kwargs):
+    return PeerTransfer(**kwargs)
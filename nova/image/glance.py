@@ -18,6 +18,7 @@
 from __future__ import absolute_import
 
 import copy
+import hashlib
 import inspect
 import itertools
 import os
@@ -26,6 +27,7 @@ import sys
 import time
 
 import cryptography
+import eventlet
 import glanceclient
 import glanceclient.exc
 from glanceclient.v2 import schemas
@@ -34,14 +36,16 @@ from oslo_serialization import jsonutils
 from oslo_service import sslutils
 from oslo_utils import excutils
 from oslo_utils import timeutils
+from oslo_utils import units
 import six
 from six.moves import range
 import six.moves.urllib.parse as urlparse
 
 import nova.conf
 from nova import exception
-from nova.i18n import _LE, _LI, _LW
+from nova.i18n import _, _LE, _LI, _LW
 import nova.image.download as image_xfers
+from nova.image.download import peer as peer_xfer
 from nova import objects
 from nova.objects import fields
 from nova import signature_utils
@@ -158,13 +162,13 @@ class GlanceClientWrapper(object):
                 glanceclient.exc.InvalidEndpoint,
                 glanceclient.exc.CommunicationError)
         num_attempts = 1 + CONF.glance.num_retries
+        controller_name = kwargs.pop('controller', 'images')
 
         for attempt in range(1, num_attempts + 1):
             client = self.client or self._create_onetime_client(context,
                                                                 version)
             try:
-                controller = getattr(client,
-                                     kwargs.pop('controller', 'images'))
+                controller = getattr(client, controller_name)
                 result = getattr(controller, method)(*args, **kwargs)
                 if inspect.isgenerator(result):
                     # Convert generator results to a list, so that we can
@@ -188,6 +192,231 @@ class GlanceClientWrapper(object):
                 time.sleep(1)
 
 
+class _ImageRange(object):
+    """A byte range of the data of an image, inclusive of its end."""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        # The (response, body) of a request already made for the range.
+        self.response = None
+        self.done = eventlet.event.Event()
+
+
+class RangedImageDownload(object):
+    """Download of the data of an image with concurrent range requests.
+
+    The image is split in ranges of [glance]/download_range_size MiB, which
+    [glance]/download_workers green threads fetch and write in place in the
+    destination file. A range which is interrupted is resumed from its last
+    byte written, up to [glance]/download_range_retries times. The ranges are
+    read back in order as they complete to compute the checksum of the image
+    and update the signature verifier, so that both are verified once the
+    last range is written.
+    """
+
+    CHUNK_SIZE = 64 * units.Ki
+
+    def __init__(self, client, context, image_id, dst_path, size,
+                 checksum=None, verifier=None):
+        self.client = client
+        self.context = context
+        self.image_id = image_id
+        self.dst_path = dst_path
+        self.size = size
+        self.checksum = checksum
+        self.verifier = verifier
+        self.workers = CONF.glance.download_workers
+        self.resumed = 0
+        self.elapsed = None
+        self._aborted = False
+        self._error = None
+        range_size = CONF.glance.download_range_size * units.Mi
+        self._ranges = [_ImageRange(start, min(start + range_size, size) - 1)
+                        for start in range(0, size, range_size)]
+
+    def _get(self, start, end):
+        url = '/v2/images/%s/file' % self.image_id
+        headers = {'Range': 'bytes=%d-%d' % (start, end)}
+        try:
+            return self.client.call(self.context, 2, 'get', url,
+                                    headers=headers, controller='http_client')
+        except Exception:
+            _reraise_translated_image_exception(self.image_id)
+
+    def _fetch(self, image_range):
+        offset = image_range.start
+        retries = 0
+        with open(self.dst_path, 'r+b') as f:
+            f.seek(offset)
+            while offset <= image_range.end:
+                if self._aborted:
+                    raise exception.ImageDownloadFailed(
+                        image_id=self.image_id, reason=_('aborted'))
+                if image_range.response is None:
+                    image_range.response = self._get(offset, image_range.end)
+                resp, body = image_range.response
+                image_range.response = None
+                if resp.status_code != 206:
+                    resp.close()
+                    raise exception.ImageDownloadFailed(
+                        image_id=self.image_id,
+                        reason=_('unexpected status %d for a range '
+                                 'request') % resp.status_code)
+                error = _('short read')
+                try:
+                    for chunk in body:
+                        chunk = chunk[:image_range.end + 1 - offset]
+                        f.write(chunk)
+                        offset += len(chunk)
+                        if offset > image_range.end or self._aborted:
+                            break
+                except Exception as e:
+                    error = e
+                finally:
+                    resp.close()
+
+                if offset > image_range.end or self._aborted:
+                    continue
+                if retries >= CONF.glance.download_range_retries:
+                    raise exception.ImageDownloadFailed(
+                        image_id=self.image_id,
+                        reason=_('range %(start)d-%(end)d interrupted at '
+                                 '%(offset)d: %(error)s') %
+                            {'start': image_range.start,
+                             'end': image_range.end, 'offset': offset,
+                             'error': error})
+                retries += 1
+                self.resumed += 1
+                LOG.warning(_LW('Download of range %(start)d-%(end)d of image '
+                                '%(image_id)s interrupted at %(offset)d, '
+                                'resuming: %(error)s'),
+                            {'start': image_range.start,
+                             'end': image_range.end, 'offset': offset,
+                             'image_id': self.image_id, 'error': error})
+                time.sleep(1)
+
+    def _worker(self, pending):
+        for image_range in pending:
+            try:
+                self._fetch(image_range)
+            except Exception as e:
+                if not self._aborted:
+                    # The other ranges are aborted because of this failure,
+                    # which is the one to report.
+                    LOG.error(_LE('Failed to download range %(start)d-'
+                                  '%(end)d of image %(image_id)s: %(error)s'),
+                              {'start': image_range.start,
+                               'end': image_range.end,
+                               'image_id': self.image_id, 'error': e})
+                    self._error = e
+                self._aborted = True
+                image_range.done.send_exception(e)
+                return
+            image_range.done.send()
+
+    def _verify(self):
+        md5 = hashlib.md5() if self.checksum else None
+        reader = None
+        if md5 or self.verifier:
+            # Unbuffered, as the buffer could hold data read ahead of a range
+            # which was not written yet.
+            reader = open(self.dst_path, 'rb', 0)
+        try:
+            for image_range in self._ranges:
+                image_range.done.wait()
+                if reader is None:
+                    continue
+                reader.seek(image_range.start)
+                remaining = image_range.end + 1 - image_range.start
+                while remaining:
+                    chunk = reader.read(min(remaining, self.CHUNK_SIZE))
+                    remaining -= len(chunk)
+                    if md5:
+                        md5.update(chunk)
+                    if self.verifier:
+                        self.verifier.update(chunk)
+        finally:
+            if reader is not None:
+                reader.close()
+
+        if md5 and md5.hexdigest() != self.checksum:
+            raise exception.ImageChecksumMismatch(image_id=self.image_id,
+                                                  expected=self.checksum,
+                                                  actual=md5.hexdigest())
+        if self.verifier:
+            try:
+                self.verifier.verify()
+            except cryptography.exceptions.InvalidSignature:
+                with excutils.save_and_reraise_exception():
+                    LOG.error(_LE('Image signature verification failed '
+                                  'for image: %s'), self.image_id)
+            LOG.info(_LI('Image signature verification succeeded '
+                         'for image %s'), self.image_id)
+
+    def run(self):
+        """Download the image to dst_path.
+
+        :returns: False, without writing to dst_path, if the image API does
+                  not support range requests, True once the image is
+                  downloaded and verified.
+        :raises: ImageDownloadFailed if a range could not be downloaded or
+                 the checksum of the image does not match, InvalidSignature
+                 if the signature of the image is not valid. dst_path is
+                 truncated in either case.
+        """
+        timer = timeutils.StopWatch()
+        timer.start()
+        first = self._ranges[0]
+        first.response = self._get(first.start, first.end)
+        if first.response[0].status_code != 206:
+            first.response[0].close()
+            return False
+
+        with open(self.dst_path, 'wb') as f:
+            f.truncate(self.size)
+
+        pending = iter(self._ranges)
+        pool = eventlet.GreenPool(self.workers)
+        for _i in range(min(self.workers, len(self._ranges))):
+            pool.spawn_n(self._worker, pending)
+        try:
+            self._verify()
+        except Exception as e:
+            with excutils.save_and_reraise_exception() as ctxt:
+                self._aborted = True
+                pool.waitall()
+                with open(self.dst_path, 'wb'):
+                    pass
+                # A range waited for may have been aborted because of the
+                # failure of a later one.
+                if self._error is not None and self._error is not e:
+                    ctxt.reraise = False
+            raise self._error
+
+        # Ensure that the data is pushed all the way down to persistent
+        # storage, as the sequential download does.
+        with open(self.dst_path, 'rb') as f:
+            os.fsync(f.fileno())
+        self.elapsed = timer.elapsed()
+        LOG.info(_LI('Downloaded %(size)d bytes of image %(image_id)s in '
+                     '%(seconds).2f seconds (%(rate).1f MiB/s) over '
+                     '%(workers)d connections, %(resumed)d interrupted '
+                     'ranges resumed'),
+                 {'size': self.size, 'image_id': self.image_id,
+                  'seconds': self.elapsed, 'rate': self.rate,
+                  'workers': min(self.workers, len(self._ranges)),
+                  'resumed': self.resumed})
+        return True
+
+    @property
+    def rate(self):
+        """Throughput of the download in MiB/s."""
+        if not self.elapsed:
+            return 0.0
+        return float(self.size) / units.Mi / self.elapsed
+
+
 class GlanceImageServiceV2(object):
     """Provides storage and retrieval of disk image objects within Glance."""
 
@@ -212,6 +441,10 @@ class GlanceImageServiceV2(object):
                               'following error occurred: %(ex)s'),
                           {'module_str': str(mod), 'ex': ex})
 
+        self._peer_handler = None
+        if CONF.glance.peer_image_cache_urls:
+            self._peer_handler = peer_xfer.get_download_handler()
+
     def show(self, context, image_id, include_locations=False,
              show_deleted=True):
         """Returns a dict with image data for the given opaque image id.
@@ -292,37 +525,38 @@ class GlanceImageServiceV2(object):
                     except Exception:
                         LOG.exception(_LE("Download image error"))
 
+        image_meta_dict = None
+        verifier = None
+        if (data is None and dst_path and
+                (self._peer_handler or CONF.glance.download_workers > 1)):
+            image_meta_dict = self.show(context, image_id,
+                                        include_locations=False)
+            verifier = self._get_verifier(context, image_id, image_meta_dict)
+            if self._peer_handler and self._peer_handler.download(
+                    context, image_meta_dict, dst_path, verifier=verifier):
+                return
+            if (CONF.glance.download_workers > 1 and
+                    image_meta_dict.get('size')):
+                download = RangedImageDownload(
+                    self._client, context, image_id, dst_path,
+                    image_meta_dict['size'],
+                    checksum=image_meta_dict.get('checksum'),
+                    verifier=verifier)
+                if download.run():
+                    return
+                LOG.info(_LI('Range requests are not supported for image '
+                             '%s, downloading it sequentially'), image_id)
+
         try:
             image_chunks = self._client.call(context, 2, 'data', image_id)
         except Exception:
             _reraise_translated_image_exception(image_id)
 
         # Retrieve properties for verification of Glance image signature
-        verifier = None
-        if CONF.glance.verify_glance_signatures:
+        if image_meta_dict is None and CONF.glance.verify_glance_signatures:
             image_meta_dict = self.show(context, image_id,
                                         include_locations=False)
-            image_meta = objects.ImageMeta.from_dict(image_meta_dict)
-            img_signature = image_meta.properties.get('img_signature')
-            img_sig_hash_method = image_meta.properties.get(
-                'img_signature_hash_method'
-            )
-            img_sig_cert_uuid = image_meta.properties.get(
-                'img_signature_certificate_uuid'
-            )
-            img_sig_key_type = image_meta.properties.get(
-                'img_signature_key_type'
-            )
-            try:
-                verifier = signature_utils.get_verifier(context,
-                                                        img_sig_cert_uuid,
-                                                        img_sig_hash_method,
-                                                        img_signature,
-                                                        img_sig_key_type)
-            except exception.SignatureVerificationError:
-                with excutils.save_and_reraise_exception():
-                    LOG.error(_LE('Image signature verification failed '
-                                  'for image: %s'), image_id)
+            verifier = self._get_verifier(context, image_id, image_meta_dict)
 
         close_file = False
         if data is None and dst_path:
@@ -375,6 +609,35 @@ class GlanceImageServiceV2(object):
                     os.fsync(data.fileno())
                     data.close()
 
+    @staticmethod
+    def _get_verifier(context, image_id, image_meta_dict):
+        """Return the verifier of the signature of an image, or None if
+        [glance]/verify_glance_signatures is disabled.
+        """
+        if not CONF.glance.verify_glance_signatures:
+            return None
+        image_meta = objects.ImageMeta.from_dict(image_meta_dict)
+        img_signature = image_meta.properties.get('img_signature')
+        img_sig_hash_method = image_meta.properties.get(
+            'img_signature_hash_method'
+        )
+        img_sig_cert_uuid = image_meta.properties.get(
+            'img_signature_certificate_uuid'
+        )
+        img_sig_key_type = image_meta.properties.get(
+            'img_signature_key_type'
+        )
+        try:
+            return signature_utils.get_verifier(context,
+                                                img_sig_cert_uuid,
+                                                img_sig_hash_method,
+                                                img_signature,
+                                                img_sig_key_type)
+        except exception.SignatureVerificationError:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_LE('Image signature verification failed '
+                              'for image: %s'), image_id)
+
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
         # Here we workaround the situation when user wants to activate an
@@ -261,6 +261,33 @@ class NetworkAPI(base.Base):
         """Template method, so a subclass can implement for neutron/network."""
         raise NotImplementedError()
 
+    def refresh_instances_nw_info(self, context, instances):
+        """Refresh the network info cache of several instances.
+
+        This is like calling get_instance_nw_info() for each instance, except
+        that the network information of all the instances may be fetched at
+        once, and that an error for an instance does not stop the others from
+        being refreshed.
+
+        :returns: A dict of the exceptions raised while refreshing the
+                  instances, keyed by instance UUID.
+        """
+        kwargs = self._get_bulk_nw_info_kwargs(context, instances)
+        errors = {}
+        for instance in instances:
+            try:
+                self.get_instance_nw_info(context, instance, **kwargs)
+            except Exception as e:
+                errors[instance.uuid] = e
+        return errors
+
+    def _get_bulk_nw_info_kwargs(self, context, instances):
+        """Template method returning the keyword arguments passed to
+        get_instance_nw_info() by refresh_instances_nw_info(), so a subclass
+        can fetch the network information of all the instances at once.
+        """
+        return {}
+
     def create_pci_requests_for_sriov_ports(self, context,
                                             pci_requests,
                                             requested_networks):
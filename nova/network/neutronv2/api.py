@@ -15,6 +15,7 @@
 #    under the License.
 #
 
+import collections
 import time
 
 from keystoneauth1 import loading as ks_loading
@@ -227,6 +228,105 @@ def _filter_hypervisor_macs(instance, ports, hypervisor_macs):
     return available_macs
 
 
+# The maximum number of IDs in the filter of a bulk Neutron query, to keep
+# the URL of the request short enough.
+_BULK_QUERY_SIZE = 50
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), _BULK_QUERY_SIZE):
+        yield items[i:i + _BULK_QUERY_SIZE]
+
+
+def _unique(items):
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+
+class _BulkNetworkInfoClient(object):
+    """A Neutron client serving the network info queries of many instances.
+
+    Building the network info of an instance takes a few Neutron queries for
+    each of its ports. This lists the ports of a group of instances, with
+    their subnets, floating IPs, the DHCP ports of their networks and the
+    networks of their info caches, in a few bulk queries, and answers the
+    queries made by API._build_network_info_model() for these instances from
+    them. Any other call is passed to the wrapped client.
+
+    The ports of each instance are still listed from Neutron, as that is done
+    under the refresh_cache lock of the instance: an interface attached or
+    detached since the bulk queries must not be missed. The queries about
+    the ports missing from the bulk data are passed to the wrapped client.
+    """
+
+    def __init__(self, api, client, instances):
+        self._client = client
+        ports = []
+        for uuids in _chunks(set(instance.uuid for instance in instances)):
+            ports.extend(client.list_ports(device_id=uuids).get('ports', []))
+
+        self._floating_ips = collections.defaultdict(list)
+        self._port_ids = set(port['id'] for port in ports)
+        for port_ids in _chunks(self._port_ids):
+            for fip in api._safe_get_floating_ips(client, port_id=port_ids):
+                key = (fip['port_id'], fip['fixed_ip_address'])
+                self._floating_ips[key].append(fip)
+
+        self._subnets = {}
+        subnet_ids = set(fixed_ip['subnet_id'] for port in ports
+                         for fixed_ip in port['fixed_ips'])
+        for ids in _chunks(subnet_ids):
+            for subnet in client.list_subnets(id=ids).get('subnets', []):
+                self._subnets[subnet['id']] = subnet
+
+        self._dhcp_ports = {subnet['network_id']: []
+                            for subnet in self._subnets.values()}
+        for ids in _chunks(self._dhcp_ports):
+            for port in client.list_ports(
+                    network_id=ids,
+                    device_owner='network:dhcp').get('ports', []):
+                self._dhcp_ports[port['network_id']].append(port)
+
+        self._networks = {}
+        network_ids = set(vif['network']['id'] for instance in instances
+                          for vif in compute_utils.get_nw_info_for_instance(
+                              instance))
+        for ids in _chunks(network_ids):
+            for network in client.list_networks(id=ids).get('networks', []):
+                self._networks[network['id']] = network
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def list_ports(self, **search_opts):
+        if (set(search_opts) == set(['network_id', 'device_owner']) and
+                search_opts['device_owner'] == 'network:dhcp' and
+                search_opts['network_id'] in self._dhcp_ports):
+            return {'ports': self._dhcp_ports[search_opts['network_id']]}
+        return self._client.list_ports(**search_opts)
+
+    def list_floatingips(self, **search_opts):
+        if (set(search_opts) == set(['fixed_ip_address', 'port_id']) and
+                search_opts['port_id'] in self._port_ids):
+            key = (search_opts['port_id'], search_opts['fixed_ip_address'])
+            return {'floatingips': self._floating_ips[key]}
+        return self._client.list_floatingips(**search_opts)
+
+    def list_subnets(self, **search_opts):
+        return self._list('subnets', self._subnets, search_opts)
+
+    def list_networks(self, **search_opts):
+        return self._list('networks', self._networks, search_opts)
+
+    def _list(self, resource, resources, search_opts):
+        ids = search_opts.get('id')
+        if (set(search_opts) == set(['id']) and ids and
+                all(id_ in resources for id_ in ids)):
+            return {resource: [resources[id_] for id_ in _unique(ids)]}
+        return getattr(self._client, 'list_' + resource)(**search_opts)
+
+
 class API(base_api.NetworkAPI):
     """API for interacting with the neutron 2.x API."""
 
@@ -1287,6 +1387,11 @@ class API(base_api.NetworkAPI):
                                                  preexisting_port_ids)
         return network_model.NetworkInfo.hydrate(nw_info)
 
+    def _get_bulk_nw_info_kwargs(self, context, instances):
+        client = get_client(context, admin=True)
+        return {'admin_client': _BulkNetworkInfoClient(self, client,
+                                                       instances)}
+
     def _gather_port_ids_and_networks(self, context, instance, networks=None,
                                       port_ids=None, neutron=None):
         """Return an instance's complete list of port_ids and networks."""
@@ -39,6 +39,22 @@ def get_attrname(name):
     return '_obj_' + name
 
 
+def obj_storage_slots(fields, extra=()):
+    """Return __slots__ holding the storage of the given fields.
+
+    Objects that are materialized in very large numbers (an Instance for
+    every guest in a cell, for example) can declare these slots so that
+    their field values and the base bookkeeping attributes do not live in
+    a per-object dict, which lowers memory and speeds up attribute access.
+    The slots must cover the fields inherited from mixins as well, and
+    extra lists any other private attributes the class sets on itself.
+    """
+    names = set(get_attrname(name) for name in fields)
+    names.update(('_context', '_changed_fields'))
+    names.update(extra)
+    return tuple(sorted(names))
+
+
 class NovaObjectRegistry(ovoo_base.VersionedObjectRegistry):
     notification_classes = []
 
@@ -138,6 +154,75 @@ class NovaObject(ovoo_base.VersionedObject):
         finally:
             self._context = original_context
 
+    @classmethod
+    def _obj_field_descriptors(cls):
+        """Return a cached tuple of (name, field, attrname) for this class.
+
+        The cache is keyed on the identity of the class' fields dict so
+        that replacing the fields (as the registry does for each class it
+        registers) transparently rebuilds it.
+        """
+        cache = cls.__dict__.get('_obj_field_descriptor_cache')
+        if cache is None or cache[0] is not cls.fields:
+            cache = (cls.fields,
+                     tuple((name, field, get_attrname(name))
+                           for name, field in cls.fields.items()))
+            cls._obj_field_descriptor_cache = cache
+        return cache[1]
+
+    def obj_to_primitive(self, target_version=None, version_manifest=None):
+        """Simple base-case dehydration.
+
+        This produces exactly the same primitive as the oslo.versionedobjects
+        implementation, but for the common case of serializing at our own
+        version (every RPC call) it avoids re-walking the field dict through
+        the property getters and only computes obj_what_changed() once, which
+        otherwise recurses into every child object twice. Backports are
+        handed to the base implementation.
+        """
+        if ((target_version is not None and
+                target_version != self.VERSION) or version_manifest):
+            return super(NovaObject, self).obj_to_primitive(
+                target_version=target_version,
+                version_manifest=version_manifest)
+        primitive = {}
+        for name, field, attrname in self._obj_field_descriptors():
+            if hasattr(self, attrname):
+                primitive[name] = field.to_primitive(self, name,
+                                                     getattr(self, attrname))
+        obj = {self._obj_primitive_key('name'): self.obj_name(),
+               self._obj_primitive_key('namespace'): (
+                   self.OBJ_PROJECT_NAMESPACE),
+               self._obj_primitive_key('version'): self.VERSION,
+               self._obj_primitive_key('data'): primitive}
+        what_changed = self.obj_what_changed()
+        if what_changed:
+            changes = [field for field in what_changed if field in primitive]
+            if changes:
+                obj[self._obj_primitive_key('changes')] = changes
+        return obj
+
+    @classmethod
+    def _obj_from_primitive(cls, context, objver, primitive):
+        self = cls()
+        self._context = context
+        self.VERSION = objver
+        objdata = cls._obj_primitive_field(primitive, 'data')
+        changes = cls._obj_primitive_field(primitive, 'changes', [])
+        # The object is brand new, so there is no need to go through the
+        # property setters: they would only re-check read-only fields that
+        # cannot be set yet and record changes that we replace below anyway.
+        fields = cls.fields
+        for name, value in objdata.items():
+            field = fields.get(name)
+            if field is None:
+                continue
+            setattr(self, get_attrname(name),
+                    field.coerce(self, name,
+                                 field.from_primitive(self, name, value)))
+        self._changed_fields = set([x for x in changes if x in fields])
+        return self
+
 
 class NovaTimestampObject(object):
     """Mixin class for db backed objects with timestamp fields.
@@ -91,6 +91,9 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject):
         'disk_allocation_ratio': fields.FloatField(),
         }
 
+    __slots__ = base.obj_storage_slots(
+        list(fields) + list(base.NovaPersistentObject.fields))
+
     def obj_make_compatible(self, primitive, target_version):
         super(ComputeNode, self).obj_make_compatible(primitive, target_version)
         target_version = versionutils.convert_version_to_tuple(target_version)
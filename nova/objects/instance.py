@@ -214,6 +214,10 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
 
     obj_extra_fields = ['name']
 
+    __slots__ = base.obj_storage_slots(
+        list(fields) + list(base.NovaPersistentObject.fields),
+        extra=('_orig_metadata', '_orig_system_metadata'))
+
     def obj_make_compatible(self, primitive, target_version):
         super(Instance, self).obj_make_compatible(primitive, target_version)
         target_version = versionutils.convert_version_to_tuple(target_version)
@@ -654,6 +658,57 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
                 value = jsonutils.dumps(obj.obj_to_primitive())
             self._extra_values_to_save[field] = value
 
+    def _get_save_expected_attrs(self):
+        """Return the attributes to load back from the database on save."""
+        expected_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
+                               if self.obj_attr_is_set(attr)]
+        if 'pci_devices' in expected_attrs:
+            # NOTE(danms): We don't refresh pci_devices on save right now
+            expected_attrs.remove('pci_devices')
+
+        # NOTE(alaski): We need to pull system_metadata for the
+        # notification.send_update() below.  If we don't there's a KeyError
+        # when it tries to extract the flavor.
+        # NOTE(danms): If we have sysmeta, we need flavor since the caller
+        # might be expecting flavor information as a result
+        if 'system_metadata' not in expected_attrs:
+            expected_attrs.append('system_metadata')
+            expected_attrs.append('flavor')
+        return expected_attrs
+
+    def _get_bulk_save_updates(self, expected_vm_state=None,
+                               expected_task_state=None):
+        """Return the column updates for saving this instance in bulk.
+
+        Returns None if the pending changes cannot be written as plain
+        instance columns (object fields like flavor or info_cache have their
+        own save handlers), in which case save() must be used instead.
+        """
+        changes = self.obj_what_changed()
+        if any(isinstance(self.fields[field], fields.ObjectField)
+               for field in changes):
+            return None
+        updates = {field: self[field] for field in changes}
+        if 'cleaned' in updates:
+            updates['cleaned'] = 1 if updates['cleaned'] else 0
+        if updates:
+            if expected_task_state is not None:
+                updates['expected_task_state'] = expected_task_state
+            if expected_vm_state is not None:
+                updates['expected_vm_state'] = expected_vm_state
+        return updates
+
+    def _finish_bulk_save(self, old_ref, inst_ref, expected_attrs):
+        """Refresh this instance from a bulk save and notify about it."""
+        context = self._context
+        self._from_db_object(context, self, inst_ref,
+                             expected_attrs=expected_attrs)
+        # NOTE(danms): We have to be super careful here not to trigger
+        # any lazy-loads that will unmigrate or unbackport something. So,
+        # make a copy of the instance for notifications first.
+        notifications.send_update(context, old_ref, self.obj_clone())
+        self.obj_reset_changes()
+
     @base.remotable
     def save(self, expected_vm_state=None,
              expected_task_state=None, admin_state_reset=False):
@@ -758,20 +813,7 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         if expected_vm_state is not None:
             updates['expected_vm_state'] = expected_vm_state
 
-        expected_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
-                               if self.obj_attr_is_set(attr)]
-        if 'pci_devices' in expected_attrs:
-            # NOTE(danms): We don't refresh pci_devices on save right now
-            expected_attrs.remove('pci_devices')
-
-        # NOTE(alaski): We need to pull system_metadata for the
-        # notification.send_update() below.  If we don't there's a KeyError
-        # when it tries to extract the flavor.
-        # NOTE(danms): If we have sysmeta, we need flavor since the caller
-        # might be expecting flavor information as a result
-        if 'system_metadata' not in expected_attrs:
-            expected_attrs.append('system_metadata')
-            expected_attrs.append('flavor')
+        expected_attrs = self._get_save_expected_attrs()
         old_ref, inst_ref = db.instance_update_and_get_original(
                 context, self.uuid, updates,
                 columns_to_join=_expected_cols(expected_attrs))
@@ -1176,6 +1218,7 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
+    inst_list._context = context
     inst_list.obj_reset_changes()
     return inst_list
 
@@ -1185,7 +1228,8 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 2.0: Initial Version
     # Version 2.1: Add get_uuids_by_host()
     # Version 2.2: Pagination for get_active_by_window_joined()
-    VERSION = '2.2'
+    # Version 2.3: Add save()
+    VERSION = '2.3'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -1371,6 +1415,62 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
                                                    columns_to_join=[])
         return [inst['uuid'] for inst in db_instances]
 
+    @base.remotable
+    def save(self, expected_vm_state=None, expected_task_state=None):
+        """Save the pending changes of all instances in the list.
+
+        The column changes of all instances are written in a single database
+        transaction, with the expected_vm_state and expected_task_state
+        checks applied to each instance on its own. Instances with changes
+        to object fields, or all of them when cells are in use, are saved
+        one at a time with Instance.save().
+
+        :returns: A list of the uuids of the instances which were not saved
+                  because they no longer exist or did not match the expected
+                  states. Their changes are left pending.
+        """
+        failed = []
+        bulk_updates = {}
+        expected_attrs = {}
+        use_bulk = cells_opts.get_cell_type() is None
+        for instance in self:
+            updates = None
+            if use_bulk:
+                updates = instance._get_bulk_save_updates(
+                    expected_vm_state=expected_vm_state,
+                    expected_task_state=expected_task_state)
+            if updates is None:
+                try:
+                    instance.save(expected_vm_state=expected_vm_state,
+                                  expected_task_state=expected_task_state)
+                except (exception.InstanceNotFound,
+                        exception.InstanceUpdateConflict):
+                    failed.append(instance.uuid)
+            elif updates:
+                bulk_updates[instance.uuid] = updates
+                expected_attrs[instance.uuid] = (
+                    instance._get_save_expected_attrs())
+
+        if not bulk_updates:
+            return failed
+
+        columns_to_join = set()
+        for attrs in expected_attrs.values():
+            columns_to_join.update(attrs)
+        results = db.instance_update_and_get_original_many(
+            self._context, bulk_updates,
+            columns_to_join=_expected_cols(list(columns_to_join)))
+        for instance in self:
+            if instance.uuid not in bulk_updates:
+                continue
+            if instance.uuid not in results:
+                failed.append(instance.uuid)
+                continue
+            old_ref, inst_ref = results[instance.uuid]
+            instance._finish_bulk_save(old_ref, inst_ref,
+                                       expected_attrs[instance.uuid])
+        return failed
+
 
 @db_api.pick_context_manager_writer
 def _migrate_instance_keypairs(ctxt, count):
@@ -42,6 +42,16 @@ aggregates_policies = [
                 'method': 'POST'
             }
         ]),
+    base.create_rule_default(
+        POLICY_ROOT % 'cache_images',
+        base.RULE_ADMIN_API,
+        "Download images into the image cache of the hosts of an aggregate",
+        [
+            {
+                'path': '/os-aggregates/{aggregate_id}/action (cache_images)',
+                'method': 'POST'
+            }
+        ]),
     policy.RuleDefault(
         name=POLICY_ROOT % 'discoverable',
         check_str=base.RULE_ANY),
@@ -537,6 +537,12 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
+        if CONF.quota.usage_shards > 1:
+            return db.quota_reserve_sharded(
+                context, resources, quotas, user_quotas, deltas, expire,
+                CONF.quota.until_refresh, CONF.quota.max_age,
+                CONF.quota.usage_shards, project_id=project_id,
+                user_id=user_id)
         return db.quota_reserve(context, resources, quotas, user_quotas,
                                 deltas, expire,
                                 CONF.quota.until_refresh, CONF.quota.max_age,
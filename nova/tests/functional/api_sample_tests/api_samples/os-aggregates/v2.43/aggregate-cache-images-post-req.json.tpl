@@ -0,0 +1,9 @@
+{
+    "cache_images": {
+        "images": [
+            {
+                "id": "%(image_id)s"
+            }
+        ]
+    }
+}
@@ -117,3 +117,27 @@ class AggregatesV2_41_SampleJsonTest(AggregatesSampleJsonTest):
         self.extra_subs['uuid'] = subs['uuid']
         return self._verify_response('aggregate-post-resp',
                                      subs, response, 200)
+
+
+class AggregatesV2_43_SampleJsonTest(api_sample_base.ApiSampleTestBaseV21):
+    ADMIN_API = True
+    sample_dir = "os-aggregates"
+    microversion = '2.43'
+    scenarios = [
+        (
+            "v2_43", {
+                'api_major_version': 'v2.1',
+            },
+        )
+    ]
+
+    def test_cache_images(self):
+        aggregate = self.api.api_post(
+            'os-aggregates',
+            {'aggregate': {'name': 'name'}}).body['aggregate']
+        response = self._do_post(
+            'os-aggregates/%s/action' % aggregate['id'],
+            'aggregate-cache-images-post-req',
+            {'image_id': '155d900f-4e14-4e4c-a73d-069cbf4541e6'})
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('', response.text)
@@ -680,6 +680,53 @@ class AggregateTestCaseV21(test.NoDBTestCase):
                               self.controller.delete,
                               self.req, "agg1")
 
+    def test_cache_images(self):
+        req = fakes.HTTPRequest.blank('/v2/os-aggregates',
+                                      use_admin_context=True, version='2.43')
+        body = {'cache_images': {'images': [{'id': uuidsentinel.image1},
+                                            {'id': uuidsentinel.image2}]}}
+        with mock.patch.object(self.controller.api,
+                               'cache_images') as mock_cache:
+            self.controller._cache_images(req, '1', body=body)
+        mock_cache.assert_called_once_with(
+            req.environ['nova.context'], '1',
+            [uuidsentinel.image1, uuidsentinel.image2])
+
+    def test_cache_images_old_microversion(self):
+        req = fakes.HTTPRequest.blank('/v2/os-aggregates',
+                                      use_admin_context=True, version='2.42')
+        body = {'cache_images': {'images': [{'id': uuidsentinel.image1}]}}
+        self.assertRaises(exception.VersionNotFoundForAPIMethod,
+                          self.controller._cache_images, req, '1', body=body)
+
+    def test_cache_images_no_admin(self):
+        req = fakes.HTTPRequest.blank('/v2/os-aggregates', version='2.43')
+        body = {'cache_images': {'images': [{'id': uuidsentinel.image1}]}}
+        self.assertRaises(exception.PolicyNotAuthorized,
+                          self.controller._cache_images, req, '1', body=body)
+
+    def test_cache_images_invalid_body(self):
+        req = fakes.HTTPRequest.blank('/v2/os-aggregates',
+                                      use_admin_context=True, version='2.43')
+        for images in ([], [{'id': 'not-a-uuid'}], [uuidsentinel.image1]):
+            self.assertRaises(exception.ValidationError,
+                              self.controller._cache_images, req, '1',
+                              body={'cache_images': {'images': images}})
+
+    def test_cache_images_not_found(self):
+        req = fakes.HTTPRequest.blank('/v2/os-aggregates',
+                                      use_admin_context=True, version='2.43')
+        body = {'cache_images': {'images': [{'id': uuidsentinel.image1}]}}
+        for error, http_error in (
+                (exception.AggregateNotFound(aggregate_id='1'),
+                 exc.HTTPNotFound),
+                (exception.ImageNotFound(image_id=uuidsentinel.image1),
+                 exc.HTTPBadRequest)):
+            with mock.patch.object(self.controller.api, 'cache_images',
+                                   side_effect=error):
+                self.assertRaises(http_error, self.controller._cache_images,
+                                  req, '1', body=body)
+
     def test_marshall_aggregate(self):
         # _marshall_aggregate() just basically turns the aggregate returned
         # from the AggregateAPI into a dict, so this tests that transform.
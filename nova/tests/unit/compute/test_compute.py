@@ -38,7 +38,6 @@ from oslo_utils import timeutils
 from oslo_utils import units
 from oslo_utils import uuidutils
 import testtools
-from testtools import matchers as testtools_matchers
 
 import nova
 from nova import availability_zones
@@ -7045,10 +7044,11 @@ class ComputeTestCase(BaseTestCase):
             mock.patch.object(self.compute.db.sqlalchemy.api,
                               'instance_get_all_by_filters',
                               return_value=instances),
-            mock.patch.object(objects.Instance, 'save'),
+            mock.patch.object(objects.InstanceList, 'save', autospec=True,
+                              return_value=[]),
         ) as (
             instance_get_all_by_filters,
-            conductor_instance_update
+            instance_list_save
         ):
             # run the code
             self.compute._check_instance_build_time(ctxt)
@@ -7060,11 +7060,16 @@ class ComputeTestCase(BaseTestCase):
                                             marker=None,
                                             columns_to_join=[],
                                             limit=None)
-            self.assertThat(conductor_instance_update.mock_calls,
-                            testtools_matchers.HasLength(len(old_instances)))
-            for inst in old_instances:
-                conductor_instance_update.assert_has_calls([
-                    mock.call()])
+            instance_list_save.assert_called_once_with(mock.ANY)
+            saved = instance_list_save.call_args[0][0]
+            old_uuids = [inst['uuid'] for inst in old_instances]
+            for inst in saved:
+                if inst.uuid in old_uuids:
+                    self.assertEqual(vm_states.ERROR, inst.vm_state)
+                    self.assertIn('vm_state', inst.obj_what_changed())
+                else:
+                    self.assertEqual(vm_states.BUILDING, inst.vm_state)
+                    self.assertEqual(set(), inst.obj_what_changed())
 
     @mock.patch.object(objects.Instance, 'save')
     def test_instance_update_host_check(self, mock_save):
@@ -10809,6 +10814,35 @@ class ComputeAPIAggrTestCase(BaseTestCase):
         self.assertRaises(exception.AggregateNotFound,
                           self.api.delete_aggregate, self.context, aggr.id)
 
+    def test_cache_images(self):
+        aggr = self.api.create_aggregate(self.context, 'fake_aggregate',
+                                         None)
+        with test.nested(
+            mock.patch.object(self.api.image_api, 'get'),
+            mock.patch.object(self.api.compute_task_api, 'cache_images'),
+        ) as (mock_get, mock_cache):
+            self.api.cache_images(self.context, aggr.id,
+                                  [uuids.image1, uuids.image2])
+        mock_get.assert_has_calls([mock.call(self.context, uuids.image1),
+                                   mock.call(self.context, uuids.image2)])
+        mock_cache.assert_called_once_with(self.context, mock.ANY,
+                                           [uuids.image1, uuids.image2])
+        self.assertEqual(aggr.id, mock_cache.call_args[0][1].id)
+
+    def test_cache_images_image_not_found(self):
+        aggr = self.api.create_aggregate(self.context, 'fake_aggregate',
+                                         None)
+        with test.nested(
+            mock.patch.object(self.api.image_api, 'get',
+                              side_effect=exception.ImageNotFound(
+                                  image_id=uuids.image)),
+            mock.patch.object(self.api.compute_task_api, 'cache_images'),
+        ) as (mock_get, mock_cache):
+            self.assertRaises(exception.ImageNotFound,
+                              self.api.cache_images, self.context, aggr.id,
+                              [uuids.image])
+        self.assertFalse(mock_cache.called)
+
     def test_check_az_for_aggregate(self):
         # Ensure all conflict hosts can be returned
         values = _create_service_entries(self.context)
@@ -17,6 +17,7 @@ import datetime
 import time
 
 from cinderclient import exceptions as cinder_exception
+import eventlet
 from eventlet import event as eventlet_event
 import mock
 import netaddr
@@ -79,6 +80,60 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.useFixture(fixtures.SpawnIsSynchronousFixture())
         self.useFixture(fixtures.EventReporterStub())
 
+    @mock.patch('nova.compute.periodic.HostInstanceCache.invalidate')
+    @mock.patch('nova.manager.Manager.periodic_tasks')
+    def test_periodic_tasks_serial(self, mock_periodic_tasks,
+                                   mock_invalidate):
+        self.assertIsNone(self.compute._periodic_scheduler)
+        self.assertEqual(mock_periodic_tasks.return_value,
+                         self.compute.periodic_tasks(self.context))
+        mock_periodic_tasks.assert_called_once_with(self.context,
+                                                    raise_on_error=False)
+        mock_invalidate.assert_called_once_with()
+
+    @mock.patch('nova.compute.periodic.HostInstanceCache.invalidate')
+    def test_wrap_instance_fault_invalidates_instance_cache(self,
+                                                           mock_invalidate):
+        @manager.wrap_instance_fault
+        def operation(compute, context, instance):
+            pass
+
+        operation(self.compute, self.context, instance=mock.sentinel.inst)
+        self.assertEqual(2, mock_invalidate.call_count)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_wrap_instance_fault_invalidates_instance_cache_after(
+            self, mock_get_by_host):
+        self.flags(periodic_task_instance_cache=True)
+        mock_get_by_host.return_value = objects.InstanceList(objects=[])
+
+        @manager.wrap_instance_fault
+        def operation(compute, context, instance):
+            # A periodic task lists the instances during the operation.
+            compute._instance_cache.get_by_host(context)
+
+        operation(self.compute, self.context, instance=mock.sentinel.inst)
+        self.compute._instance_cache.get_by_host(self.context)
+        self.assertEqual(2, mock_get_by_host.call_count)
+
+    @mock.patch('nova.manager.Manager.periodic_tasks')
+    @mock.patch('nova.compute.periodic.PeriodicTaskScheduler')
+    def test_periodic_tasks_scheduler(self, mock_scheduler,
+                                      mock_periodic_tasks):
+        self.flags(periodic_task_workers=4)
+        compute = manager.ComputeManager()
+        mock_scheduler.assert_called_once_with(compute, 4)
+        run_periodic_tasks = mock_scheduler.return_value.run_periodic_tasks
+
+        self.assertEqual(run_periodic_tasks.return_value,
+                         compute.periodic_tasks(self.context))
+        run_periodic_tasks.assert_called_once_with(self.context)
+        self.assertFalse(mock_periodic_tasks.called)
+
+        compute.periodic_tasks(self.context, raise_on_error=True)
+        mock_periodic_tasks.assert_called_once_with(self.context,
+                                                    raise_on_error=True)
+
     @mock.patch.object(manager.ComputeManager, '_get_power_state')
     @mock.patch.object(manager.ComputeManager, '_sync_instance_power_state')
     @mock.patch.object(objects.Instance, 'get_by_uuid')
@@ -241,6 +296,34 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             else:
                 self.assertFalse(db_node.destroy.called)
 
+    @mock.patch.object(manager.ComputeManager, '_get_compute_nodes_in_db',
+                       return_value=[])
+    @mock.patch.object(fake_driver.FakeDriver, 'get_available_nodes',
+                       return_value=['node1', 'node2', 'node3'])
+    def test_update_available_resource_workers(self, get_avail_nodes,
+                                               get_db_nodes):
+        self.flags(update_resources_workers=2)
+        running = set()
+        concurrency = []
+
+        def update(context, nodename):
+            running.add(nodename)
+            concurrency.append(len(running))
+            eventlet.sleep(0)
+            running.remove(nodename)
+
+        with mock.patch.object(self.compute,
+                               'update_available_resource_for_node',
+                               side_effect=update) as update_mock:
+            self.compute.update_available_resource(self.context)
+
+        self.assertEqual(2, max(concurrency))
+        self.assertEqual(
+            sorted([mock.call(self.context, 'node1'),
+                    mock.call(self.context, 'node2'),
+                    mock.call(self.context, 'node3')]),
+            sorted(update_mock.call_args_list))
+
     @mock.patch('nova.context.get_admin_context')
     def test_pre_start_hook(self, get_admin_context):
         """Very simple test just to make sure update_available_resource is
@@ -413,6 +496,29 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.assertFalse(mock_save.called)
         self.assertEqual('True', instance.system_metadata['network_allocated'])
 
+    @mock.patch('nova.compute.utils.timeline_event')
+    @mock.patch.object(time, 'sleep')
+    def test_allocate_network_timeline_event_per_attempt(
+            self, mock_sleep, mock_timeline_event):
+        self.flags(network_allocate_retries=2)
+        instance = fake_instance.fake_instance_obj(
+                       self.context, expected_attrs=['system_metadata'])
+        events = [mock.MagicMock(), mock.MagicMock()]
+        mock_timeline_event.side_effect = events
+
+        with mock.patch.object(
+                self.compute.network_api, 'allocate_for_instance',
+                side_effect=[test.TestingException(), 'meow']):
+            self.assertEqual('meow', self.compute._allocate_network_async(
+                self.context, instance, None, None, None, False, None))
+
+        self.assertEqual(
+            [mock.call(self.context, 'compute_allocate_network', instance)] *
+            2, mock_timeline_event.call_args_list)
+        for event in events:
+            event.__enter__.assert_called_once_with()
+            self.assertEqual(1, event.__exit__.call_count)
+
     def test_allocate_network_fails(self):
         self.flags(network_allocate_retries=0)
 
@@ -512,6 +618,72 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.assertIsInstance(compute._build_semaphore,
                               compute_utils.UnlimitedSemaphore)
 
+    @mock.patch.object(fake_driver.FakeDriver, 'cache_image',
+                       return_value=True)
+    def test_cache_build_image(self, mock_cache_image):
+        self.flags(max_concurrent_image_downloads=2)
+        compute = manager.ComputeManager()
+        instance = fake_instance.fake_instance_obj(self.context,
+                                                   image_ref=uuids.image)
+        compute._cache_build_image(self.context, instance, [])
+        mock_cache_image.assert_called_once_with(self.context, uuids.image)
+        self.assertEqual(1, compute._image_stage.started)
+        self.assertEqual(0, compute._image_stage.running)
+
+    @mock.patch.object(fake_driver.FakeDriver, 'cache_image')
+    def test_cache_build_image_disabled(self, mock_cache_image):
+        instance = fake_instance.fake_instance_obj(self.context,
+                                                   image_ref=uuids.image)
+        self.compute._cache_build_image(self.context, instance, [])
+        self.assertFalse(mock_cache_image.called)
+
+    @mock.patch.object(fake_driver.FakeDriver, 'cache_image')
+    def test_cache_build_image_volume_backed(self, mock_cache_image):
+        self.flags(max_concurrent_image_downloads=2)
+        instance = fake_instance.fake_instance_obj(self.context,
+                                                   image_ref=uuids.image)
+        bdms = objects.BlockDeviceMappingList(objects=[
+            objects.BlockDeviceMapping(boot_index=0, source_type='image',
+                                       destination_type='volume')])
+        self.compute._cache_build_image(self.context, instance, bdms)
+        self.assertFalse(mock_cache_image.called)
+
+    @mock.patch.object(fake_driver.FakeDriver, 'cache_image',
+                       side_effect=exception.ImageNotFound(image_id='fake'))
+    def test_cache_build_image_fails(self, mock_cache_image):
+        self.flags(max_concurrent_image_downloads=2)
+        instance = fake_instance.fake_instance_obj(self.context,
+                                                   image_ref=uuids.image)
+        self.compute._cache_build_image(self.context, instance, [])
+        mock_cache_image.assert_called_once_with(self.context, uuids.image)
+
+    def test_cache_images(self):
+        self.flags(max_concurrent_image_downloads=2)
+        compute = manager.ComputeManager()
+        results = {uuids.image1: True, uuids.image2: False,
+                   uuids.image3: NotImplementedError(),
+                   uuids.image4: exception.ImageNotFound(image_id='fake'),
+                   uuids.image5: exception.ImageNotAuthorized(
+                       image_id='fake')}
+
+        def cache_image(context, image_id):
+            if isinstance(results[image_id], Exception):
+                raise results[image_id]
+            return results[image_id]
+
+        with mock.patch.object(compute.driver, 'cache_image',
+                               side_effect=cache_image) as mock_cache_image:
+            self.assertEqual({uuids.image1: 'downloaded',
+                              uuids.image2: 'cached',
+                              uuids.image3: 'unsupported',
+                              uuids.image4: 'error',
+                              uuids.image5: 'unauthorized'},
+                             compute.cache_images(self.context,
+                                                  sorted(results)))
+        self.assertEqual(5, mock_cache_image.call_count)
+        self.assertEqual(5, compute._image_stage.started)
+        self.assertEqual(0, compute._image_stage.running)
+
     def test_nil_out_inst_obj_host_and_node_sets_nil(self):
         instance = fake_instance.fake_instance_obj(self.context,
                                                    uuid=uuids.instance,
@@ -576,6 +748,53 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.flags(defer_iptables_apply=False)
         _do_mock_calls(defer_iptables_apply=False)
 
+    @mock.patch.object(manager.ComputeManager, '_init_instance')
+    def test_init_instances_workers(self, mock_inst_init):
+        self.flags(init_host_workers=2)
+        instances = [objects.Instance(uuid=uuid) for uuid in
+                     (uuids.inst1, uuids.inst2, uuids.inst3)]
+        running = []
+        max_running = []
+
+        def fake_init_instance(context, instance):
+            running.append(instance)
+            max_running.append(len(running))
+            eventlet.sleep(0)
+            running.remove(instance)
+
+        mock_inst_init.side_effect = fake_init_instance
+        self.compute._init_instances(self.context, instances)
+
+        self.assertEqual(2, max(max_running))
+        mock_inst_init.assert_has_calls(
+            [mock.call(self.context, instance) for instance in instances],
+            any_order=True)
+
+    @mock.patch.object(manager.ComputeManager, '_init_instance')
+    def test_init_instances_workers_error(self, mock_inst_init):
+        self.flags(init_host_workers=2)
+        instances = [objects.Instance(uuid=uuid) for uuid in
+                     (uuids.inst1, uuids.inst2, uuids.inst3)]
+        mock_inst_init.side_effect = [test.TestingException, None, None]
+
+        self.assertRaises(test.TestingException,
+                          self.compute._init_instances, self.context,
+                          instances)
+        # The other instances are still initialized.
+        self.assertEqual(3, mock_inst_init.call_count)
+
+    @mock.patch.object(manager, 'LOG')
+    @mock.patch.object(manager.ComputeManager, '_init_instance')
+    def test_init_instances_progress(self, mock_inst_init, mock_log):
+        instances = [objects.Instance(uuid=uuids.inst1),
+                     objects.Instance(uuid=uuids.inst2)]
+
+        self.compute._init_instances(self.context, instances)
+
+        self.assertEqual(2, mock_inst_init.call_count)
+        self.assertEqual([1, 2], [call[0][1]['done'] for call in
+                                  mock_log.info.call_args_list])
+
     @mock.patch('nova.objects.InstanceList')
     @mock.patch('nova.objects.MigrationList.get_by_filters')
     def test_cleanup_host(self, mock_miglist_get, mock_instance_list):
@@ -1493,6 +1712,55 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             self.assertTrue(mock_begin.called)
             self.assertTrue(mock_end.called)
 
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_heal_instance_info_cache_batch(self, mock_get_by_host,
+                                            mock_get_by_filters):
+        self.flags(heal_instance_info_cache_batch_size=2)
+        instances = [
+            objects.Instance(uuid=uuids.building, vm_state=vm_states.BUILDING,
+                             task_state=None),
+            objects.Instance(uuid=uuids.instance1, vm_state=vm_states.ACTIVE,
+                             task_state=None),
+            objects.Instance(uuid=uuids.instance2, vm_state=vm_states.ACTIVE,
+                             task_state=None),
+            objects.Instance(uuid=uuids.instance3, vm_state=vm_states.ACTIVE,
+                             task_state=None)]
+        mock_get_by_host.return_value = instances
+        mock_get_by_filters.side_effect = [instances[1:3], instances[3:]]
+        with mock.patch.object(self.compute.network_api,
+                               'refresh_instances_nw_info',
+                               return_value={}) as mock_refresh:
+            self.compute._heal_instance_info_cache(self.context)
+            mock_refresh.assert_called_once_with(self.context,
+                                                 instances[1:3])
+            self.assertEqual([uuids.instance3],
+                             self.compute._instance_uuids_to_heal)
+
+            mock_refresh.reset_mock()
+            self.compute._heal_instance_info_cache(self.context)
+            mock_refresh.assert_called_once_with(self.context,
+                                                 instances[3:])
+            self.assertEqual([], self.compute._instance_uuids_to_heal)
+
+        mock_get_by_host.assert_called_once_with(
+            self.context, self.compute.host, expected_attrs=[],
+            use_slave=True)
+        mock_get_by_filters.assert_has_calls([
+            mock.call(self.context, {'uuid': [uuids.instance1,
+                                              uuids.instance2],
+                                     'host': self.compute.host,
+                                     'deleted': False},
+                      expected_attrs=['system_metadata', 'info_cache',
+                                      'flavor'],
+                      use_slave=True),
+            mock.call(self.context, {'uuid': [uuids.instance3],
+                                     'host': self.compute.host,
+                                     'deleted': False},
+                      expected_attrs=['system_metadata', 'info_cache',
+                                      'flavor'],
+                      use_slave=True)])
+
     @mock.patch.object(objects.InstanceList, 'get_by_host')
     def test_sync_power_states(self, mock_get):
         instance = mock.Mock()
@@ -1505,6 +1773,42 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                                         use_slave=True)
             mock_spawn.assert_called_once_with(mock.ANY, instance)
 
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_bulk(self, mock_get):
+        instance = objects.Instance(uuid=uuids.instance)
+        mock_get.return_value = [instance]
+        with test.nested(
+                mock.patch.object(self.compute.driver, 'get_power_states',
+                                  return_value={
+                                      uuids.instance: power_state.RUNNING}),
+                mock.patch.object(self.compute._sync_power_pool, 'spawn_n',
+                                  side_effect=lambda f, *args: f(*args)),
+                mock.patch.object(self.compute,
+                                  '_query_driver_power_state_and_sync')
+        ) as (mock_states, mock_spawn, mock_sync):
+            self.compute._sync_power_states(mock.sentinel.context)
+        mock_states.assert_called_once_with([uuids.instance])
+        mock_sync.assert_called_once_with(mock.sentinel.context, instance,
+                                          power_state.RUNNING)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_host', return_value=[])
+    def test_sync_power_states_lifecycle_events(self, mock_get):
+        self.flags(sync_power_state_event_interval=3600)
+        with mock.patch.dict(self.compute.driver.capabilities,
+                             emits_lifecycle_events=True):
+            self.compute._sync_power_states(mock.sentinel.context)
+            self.compute._sync_power_states(mock.sentinel.context)
+            self.assertEqual(1, mock_get.call_count)
+
+            self.compute._last_power_state_sweep -= 3600
+            self.compute._sync_power_states(mock.sentinel.context)
+            self.assertEqual(2, mock_get.call_count)
+
+            self.flags(handle_virt_lifecycle_events=False,
+                       group='workarounds')
+            self.compute._sync_power_states(mock.sentinel.context)
+            self.assertEqual(3, mock_get.call_count)
+
     def _get_sync_instance(self, power_state, vm_state, task_state=None,
                            shutdown_terminate=False):
         instance = objects.Instance()
@@ -1536,6 +1840,20 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         mock_refresh.assert_called_once_with(use_slave=False)
         self.assertTrue(mock_save.called)
 
+    @mock.patch.object(objects.Instance, 'refresh')
+    @mock.patch.object(objects.Instance, 'save')
+    def test_sync_instance_power_state_recheck(self, mock_save, mock_refresh):
+        instance = self._get_sync_instance(power_state.RUNNING,
+                                           vm_states.ACTIVE)
+        with mock.patch.object(self.compute, '_get_power_state',
+                               return_value=power_state.RUNNING) as mock_get:
+            self.compute._sync_instance_power_state(self.context, instance,
+                                                    power_state.SHUTDOWN,
+                                                    recheck=True)
+        mock_get.assert_called_once_with(self.context, instance)
+        self.assertEqual(power_state.RUNNING, instance.power_state)
+        self.assertFalse(mock_save.called)
+
     def _test_sync_to_stop(self, power_state, vm_state, driver_power_state,
                            stop=True, force=False, shutdown_terminate=False):
         instance = self._get_sync_instance(
@@ -1616,6 +1934,23 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                                                           power_state.NOSTATE,
                                                           use_slave=True)
 
+    @mock.patch('nova.compute.manager.ComputeManager.'
+                '_sync_instance_power_state')
+    def test_query_driver_power_state_and_sync_bulk_state(
+            self, mock_sync_power_state):
+        with mock.patch.object(self.compute.driver,
+                               'get_info') as mock_get_info:
+            db_instance = objects.Instance(uuid=uuids.db_instance,
+                                           task_state=None)
+            self.compute._query_driver_power_state_and_sync(
+                self.context, db_instance, power_state.RUNNING)
+            self.assertFalse(mock_get_info.called)
+            mock_sync_power_state.assert_called_once_with(self.context,
+                                                          db_instance,
+                                                          power_state.RUNNING,
+                                                          use_slave=True,
+                                                          recheck=True)
+
     @mock.patch.object(virt_driver.ComputeDriver, 'delete_instance_files')
     @mock.patch.object(objects.InstanceList, 'get_by_filters')
     def test_run_pending_deletes(self, mock_get, mock_delete):
@@ -1631,8 +1966,9 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             def __getitem__(self, name):
                 return getattr(self, name)
 
+        class FakeInstanceList(list):
             def save(self):
-                pass
+                self.saved_context = dict(ctxt)
 
         def _fake_get(ctx, filter, expected_attrs, use_slave):
             mock_get.assert_called_once_with(
@@ -1641,16 +1977,21 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                  'cleaned': False},
                 expected_attrs=['system_metadata'],
                 use_slave=True)
-            return [a, b, c]
+            return instances
 
         a = FakeInstance('123', 'apple', {'clean_attempts': '100'})
         b = FakeInstance('456', 'orange', {'clean_attempts': '3'})
         c = FakeInstance('789', 'banana', {})
+        instances = FakeInstanceList([a, b, c])
 
         mock_get.side_effect = _fake_get
         mock_delete.side_effect = [True, False]
 
-        self.compute._run_pending_deletes({})
+        ctxt = {}
+        self.compute._run_pending_deletes(ctxt)
+
+        # All of the instances are saved at once, with deleted ones visible
+        self.assertEqual({'read_deleted': 'yes'}, instances.saved_context)
 
         self.assertFalse(a.cleaned)
         self.assertEqual('100', a.system_metadata['clean_attempts'])
@@ -1661,6 +2002,26 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         mock_delete.assert_has_calls([mock.call(mock.ANY),
                                       mock.call(mock.ANY)])
 
+    @mock.patch.object(virt_driver.ComputeDriver, 'delete_instance_files')
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_run_pending_deletes_error(self, mock_get, mock_delete):
+        instances = objects.InstanceList(objects=[
+            fake_instance.fake_instance_obj(
+                self.context, uuid=uuid, expected_attrs=['system_metadata'])
+            for uuid in (uuids.cleaned, uuids.failed)])
+        mock_get.return_value = instances
+        mock_delete.side_effect = [True, test.TestingException]
+
+        with mock.patch.object(instances, 'save') as mock_save:
+            self.compute._run_pending_deletes(self.context)
+
+        # The instance cleaned before the failure is saved too.
+        mock_save.assert_called_once_with()
+        self.assertTrue(instances[0].cleaned)
+        self.assertEqual('1', instances[0].system_metadata['clean_attempts'])
+        self.assertFalse(instances[1].cleaned)
+        self.assertEqual('1', instances[1].system_metadata['clean_attempts'])
+
     @mock.patch.object(objects.Migration, 'obj_as_admin')
     @mock.patch.object(objects.Migration, 'save')
     @mock.patch.object(objects.MigrationList, 'get_by_filters')
@@ -20,6 +20,7 @@ import copy
 import string
 import uuid
 
+import eventlet
 import mock
 from oslo_serialization import jsonutils
 import six
@@ -852,6 +853,90 @@ class ComputeUtilsTestCase(test.NoDBTestCase):
         mock_notify_usage.assert_has_calls(expected_notify_calls)
 
 
+class BuildStageTestCase(test.NoDBTestCase):
+
+    def _test_stage(self, limit, max_running):
+        stage = compute_utils.BuildStage('fake', limit)
+        running = []
+
+        def build():
+            with stage.start(mock.sentinel.instance):
+                running.append(stage.running)
+                eventlet.sleep(0)
+
+        pool = eventlet.GreenPool()
+        for _i in range(3):
+            pool.spawn_n(build)
+        pool.waitall()
+
+        self.assertEqual(max_running, max(running))
+        self.assertEqual(3, stage.started)
+        self.assertEqual(0, stage.running)
+        self.assertEqual(0, stage.waiting)
+
+    def test_limited(self):
+        self._test_stage(1, 1)
+
+    def test_unlimited(self):
+        self._test_stage(0, 3)
+
+
+class TimelineEventTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(TimelineEventTestCase, self).setUp()
+        self.context = context.RequestContext('fake', 'fake')
+        self.instance = objects.Instance(uuid=uuids.inst)
+
+    @mock.patch.object(objects.InstanceActionEvent, 'event_start')
+    def test_timeline_event_disabled(self, mock_start):
+        self.flags(build_timeline=False)
+        with compute_utils.timeline_event(self.context, 'fake',
+                                          self.instance):
+            pass
+        self.assertFalse(mock_start.called)
+
+    @mock.patch.object(objects.InstanceActionEvent,
+                       'event_finish_with_failure')
+    @mock.patch.object(objects.InstanceActionEvent, 'event_start')
+    def test_timeline_event(self, mock_start, mock_finish):
+        self.flags(build_timeline=True)
+        with compute_utils.timeline_event(self.context, 'fake',
+                                          self.instance):
+            pass
+        mock_start.assert_called_once_with(
+            self.context, uuids.inst, 'fake', want_result=False)
+        mock_finish.assert_called_once_with(
+            self.context, uuids.inst, 'fake', exc_val=None, exc_tb=None,
+            want_result=False)
+
+    @mock.patch.object(objects.InstanceActionEvent,
+                       'event_finish_with_failure',
+                       side_effect=test.TestingException)
+    @mock.patch.object(objects.InstanceActionEvent, 'event_start',
+                       side_effect=test.TestingException)
+    def test_timeline_event_failure_ignored(self, mock_start, mock_finish):
+        self.flags(build_timeline=True)
+        with compute_utils.timeline_event(self.context, 'fake',
+                                          self.instance):
+            pass
+        self.assertTrue(mock_start.called)
+        self.assertTrue(mock_finish.called)
+
+    @mock.patch.object(objects.InstanceActionEvent,
+                       'event_finish_with_failure')
+    @mock.patch.object(objects.InstanceActionEvent, 'event_start')
+    def test_timeline_event_reraises(self, mock_start, mock_finish):
+        self.flags(build_timeline=True)
+
+        def fail():
+            with compute_utils.timeline_event(self.context, 'fake',
+                                              self.instance):
+                raise test.TestingException()
+
+        self.assertRaises(test.TestingException, fail)
+        self.assertTrue(mock_finish.called)
+
+
 class ComputeUtilsQuotaDeltaTestCase(test.TestCase):
     def setUp(self):
         super(ComputeUtilsQuotaDeltaTestCase, self).setUp()
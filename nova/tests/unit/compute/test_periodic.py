@@ -0,0 +1,272 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the concurrent scheduling of compute periodic tasks."""
+
+import eventlet
+from eventlet import event
+import mock
+from oslo_service import periodic_task
+
+from nova.compute import periodic
+from nova.compute import task_states
+from nova.compute import vm_states
+from nova import context
+from nova import manager
+from nova import objects
+from nova import test
+from nova.tests.unit import fake_instance
+from nova.tests import uuidsentinel as uuids
+
+
+class FakeManager(manager.Manager):
+
+    def __init__(self):
+        super(FakeManager, self).__init__(host='fake-host')
+        self.calls = []
+        self.block = None
+
+    @periodic_task.periodic_task(spacing=10, run_immediately=True)
+    def fast_task(self, context):
+        self.calls.append('fast_task')
+
+    @periodic_task.periodic_task(spacing=60, run_immediately=True)
+    def slow_task(self, context):
+        self.calls.append('slow_task')
+        if self.block:
+            self.block.wait()
+
+
+class PeriodicTaskSchedulerTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(PeriodicTaskSchedulerTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.manager = FakeManager()
+        self.now = 1000.0
+        patcher = mock.patch.object(periodic, 'time')
+        patcher.start().time.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def _scheduler(self, workers=2):
+        return periodic.PeriodicTaskScheduler(self.manager, workers)
+
+    def test_run_periodic_tasks(self):
+        scheduler = self._scheduler()
+        idle_for = scheduler.run_periodic_tasks(self.context)
+        scheduler._pool.waitall()
+
+        self.assertEqual(10, idle_for)
+        self.assertEqual(['fast_task', 'slow_task'],
+                         sorted(self.manager.calls))
+        self.assertEqual(1, scheduler.stats['slow_task'].runs)
+
+        self.now += 5
+        self.assertEqual(5, scheduler.run_periodic_tasks(self.context))
+        scheduler._pool.waitall()
+        self.assertEqual(2, len(self.manager.calls))
+
+    def test_skip_if_still_running(self):
+        self.manager.block = event.Event()
+        scheduler = self._scheduler()
+        scheduler.run_periodic_tasks(self.context)
+        eventlet.sleep(0)
+
+        self.now += 60
+        scheduler.run_periodic_tasks(self.context)
+        self.manager.block.send()
+        scheduler._pool.waitall()
+
+        self.assertEqual(1, self.manager.calls.count('slow_task'))
+        self.assertEqual(2, self.manager.calls.count('fast_task'))
+        self.assertEqual(1, scheduler.stats['slow_task'].skips)
+        self.assertEqual(1060, self.manager._periodic_last_run['slow_task'])
+
+    def test_priorities(self):
+        self.flags(periodic_task_priorities=['slow_task'])
+        self.manager.block = event.Event()
+        scheduler = self._scheduler(workers=1)
+
+        idle_for = scheduler.run_periodic_tasks(self.context)
+        eventlet.sleep(0)
+
+        self.assertEqual(periodic._RETRY_INTERVAL, idle_for)
+        self.assertEqual(['slow_task'], self.manager.calls)
+        self.assertIsNone(self.manager._periodic_last_run['fast_task'])
+        self.manager.block.send()
+        scheduler._pool.waitall()
+
+        scheduler.run_periodic_tasks(self.context)
+        scheduler._pool.waitall()
+        self.assertEqual(['slow_task', 'fast_task'], self.manager.calls)
+
+    def test_jitter(self):
+        self.flags(periodic_task_jitter=0.5)
+        scheduler = self._scheduler()
+        scheduler.run_periodic_tasks(self.context)
+        scheduler._pool.waitall()
+
+        self.now += 10
+        with mock.patch('random.uniform', return_value=3) as mock_uniform:
+            self.assertEqual(3, scheduler.run_periodic_tasks(self.context))
+        mock_uniform.assert_has_calls([mock.call(0, 5.0)])
+
+    @mock.patch.object(periodic, 'LOG')
+    def test_deadline(self, mock_log):
+        self.flags(periodic_task_deadlines={'slow_task': 0.01})
+        self.manager.block = event.Event()
+        scheduler = self._scheduler()
+        scheduler.run_periodic_tasks(self.context)
+        scheduler._pool.waitall()
+
+        self.assertEqual(1, scheduler.stats['slow_task'].timeouts)
+        self.assertEqual(0, scheduler.stats['fast_task'].timeouts)
+        self.assertEqual(1, mock_log.warning.call_count)
+        self.assertEqual(set(), scheduler._running)
+
+    @mock.patch.object(periodic, 'LOG')
+    def test_failure(self, mock_log):
+        scheduler = self._scheduler()
+        with mock.patch.object(self.manager, 'calls') as mock_calls:
+            mock_calls.append.side_effect = ValueError
+            scheduler.run_periodic_tasks(self.context)
+            scheduler._pool.waitall()
+
+        self.assertEqual(1, scheduler.stats['slow_task'].failures)
+        self.assertEqual(2, mock_log.exception.call_count)
+
+
+class HostInstanceCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostInstanceCacheTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.cache = periodic.HostInstanceCache('fake-host')
+        self.instances = objects.InstanceList(objects=[
+            fake_instance.fake_instance_obj(
+                self.context, uuid=uuids.active, host='fake-host',
+                vm_state=vm_states.ACTIVE, task_state=None),
+            fake_instance.fake_instance_obj(
+                self.context, uuid=uuids.rebooting, host='fake-host',
+                vm_state=vm_states.ACTIVE, task_state=task_states.REBOOTING),
+            fake_instance.fake_instance_obj(
+                self.context, uuid=uuids.soft_deleted, host='fake-host',
+                vm_state=vm_states.SOFT_DELETED, task_state=None)])
+        patcher = mock.patch.object(objects.InstanceList, 'get_by_host',
+                                    return_value=self.instances)
+        self.mock_get_by_host = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_disabled(self):
+        self.cache.get_by_host(self.context, expected_attrs=[])
+        self.cache.get_by_host(self.context, expected_attrs=[])
+
+        self.assertEqual(2, self.mock_get_by_host.call_count)
+        self.mock_get_by_host.assert_called_with(
+            self.context, 'fake-host', expected_attrs=[], use_slave=True)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_get_by_filters_disabled(self, mock_get_by_filters):
+        filters = {'vm_state': vm_states.RESCUED, 'host': 'fake-host'}
+        self.assertEqual(mock_get_by_filters.return_value,
+                         self.cache.get_by_filters(self.context, filters))
+        mock_get_by_filters.assert_called_once_with(
+            self.context, filters, expected_attrs=None, use_slave=True)
+
+    def test_get_by_host(self):
+        self.flags(periodic_task_instance_cache=True)
+        instances = self.cache.get_by_host(self.context)
+        self.assertEqual([uuids.active, uuids.rebooting, uuids.soft_deleted],
+                         [instance.uuid for instance in instances])
+        # Each caller gets its own copy of the instances.
+        self.assertIsNot(self.instances[0], instances[0])
+
+        self.cache.get_by_host(self.context)
+        self.mock_get_by_host.assert_called_once_with(
+            self.context, 'fake-host', expected_attrs=[], use_slave=True)
+
+        self.cache.invalidate()
+        self.cache.get_by_host(self.context)
+        self.assertEqual(2, self.mock_get_by_host.call_count)
+
+    def test_expected_attrs(self):
+        self.flags(periodic_task_instance_cache=True)
+        self.cache.get_by_host(self.context, expected_attrs=[])
+        self.cache.get_by_filters(
+            self.context, {'host': 'fake-host'},
+            expected_attrs=['system_metadata'])
+        self.cache.get_by_host(self.context, expected_attrs=['flavor'])
+        self.cache.get_by_host(self.context,
+                               expected_attrs=['flavor', 'system_metadata'])
+        self.mock_get_by_host.assert_has_calls([
+            mock.call(self.context, 'fake-host', expected_attrs=[],
+                      use_slave=True),
+            mock.call(self.context, 'fake-host',
+                      expected_attrs=['system_metadata'], use_slave=True),
+            mock.call(self.context, 'fake-host',
+                      expected_attrs=['flavor', 'system_metadata'],
+                      use_slave=True)])
+        self.assertEqual(3, self.mock_get_by_host.call_count)
+
+        # The next listings load the fields of all the callers at once.
+        self.cache.invalidate()
+        self.cache.get_by_host(self.context, expected_attrs=[])
+        self.mock_get_by_host.assert_called_with(
+            self.context, 'fake-host',
+            expected_attrs=['flavor', 'system_metadata'], use_slave=True)
+        self.assertEqual(4, self.mock_get_by_host.call_count)
+
+    def test_invalidate_while_listing(self):
+        self.flags(periodic_task_instance_cache=True)
+
+        def get_by_host(*args, **kwargs):
+            self.cache.invalidate()
+            return self.instances
+
+        self.mock_get_by_host.side_effect = get_by_host
+        self.cache.get_by_host(self.context)
+        self.cache.get_by_host(self.context)
+        self.assertEqual(2, self.mock_get_by_host.call_count)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_get_by_filters(self, mock_get_by_filters):
+        self.flags(periodic_task_instance_cache=True)
+
+        def uuids_by_filters(**filters):
+            filters['host'] = filters.get('host', 'fake-host')
+            return [instance.uuid for instance in
+                    self.cache.get_by_filters(self.context, filters)]
+
+        self.assertEqual(
+            [uuids.rebooting],
+            uuids_by_filters(task_state=[task_states.REBOOTING,
+                                         task_states.REBOOT_STARTED]))
+        self.assertEqual(
+            [uuids.soft_deleted],
+            uuids_by_filters(vm_state=vm_states.SOFT_DELETED,
+                             task_state=None))
+        self.assertEqual([uuids.active, uuids.rebooting],
+                         uuids_by_filters(deleted=False))
+        self.assertEqual(
+            [uuids.active, uuids.rebooting, uuids.soft_deleted],
+            uuids_by_filters(deleted=False, soft_deleted=True,
+                             host=['fake-host']))
+        self.mock_get_by_host.assert_called_once_with(
+            self.context, 'fake-host', expected_attrs=[], use_slave=True)
+        self.assertFalse(mock_get_by_filters.called)
+
+        for filters in ({'host': ['fake-host', 'other-host']},
+                        {'host': 'fake-host', 'deleted': True},
+                        {'host': 'fake-host', 'image_ref': 'fake-image'}):
+            self.cache.get_by_filters(self.context, filters)
+            mock_get_by_filters.assert_called_with(
+                self.context, filters, expected_attrs=None, use_slave=True)
@@ -13,6 +13,8 @@
 import copy
 import datetime
 
+import eventlet
+from eventlet import event as eventlet_event
 import mock
 from oslo_config import cfg
 from oslo_utils import timeutils
@@ -34,6 +36,7 @@ from nova.pci import manager as pci_manager
 from nova import test
 from nova.tests.unit.objects import test_pci_device as fake_pci_device
 from nova.tests import uuidsentinel as uuids
+from nova import utils
 
 _HOSTNAME = 'fake-host'
 _NODENAME = 'fake-node'
@@ -507,6 +510,21 @@ class TestUpdateAvailableResources(BaseTestCase):
 
         self.assertFalse(get_mock.called)
 
+    @mock.patch.object(resource_tracker.LOG, 'error')
+    def test_driver_timeout(self, mock_log):
+        self.flags(update_resources_node_timeout=1)
+        self._setup_rt()
+        self.driver_mock.get_available_resource.side_effect = (
+            lambda nodename: eventlet.sleep(10))
+
+        with mock.patch.object(self.rt,
+                               '_update_available_resource') as audit_mock:
+            self.rt.update_available_resource(mock.sentinel.ctx, _NODENAME)
+
+        # The audit of the usage of the node is skipped, not interrupted.
+        audit_mock.assert_not_called()
+        self.assertEqual(1, mock_log.call_count)
+
     @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
                 return_value=objects.InstancePCIRequests(requests=[]))
     @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
@@ -957,6 +975,88 @@ class TestUpdateAvailableResources(BaseTestCase):
         self.assertTrue(obj_base.obj_equal_prims(expected_resources,
                                                  actual_resources))
 
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_incremental_refresh(self, get_mock, migr_mock, get_cn_mock,
+                                 pci_mock, instance_pci_mock):
+        self.flags(resource_audit_interval=600)
+        self._setup_rt()
+        get_mock.return_value = []
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+
+        self._update_available_resources()
+        self.assertTrue(get_mock.called)
+        get_mock.reset_mock()
+        migr_mock.reset_mock()
+
+        # Usage accounted by a claim since the audit, and more memory
+        # reported by the hypervisor.
+        self.rt.compute_nodes[_NODENAME].memory_mb_used = 256
+        virt_resources = copy.deepcopy(_VIRT_DRIVER_AVAIL_RESOURCES)
+        virt_resources.update(memory_mb=1024, memory_mb_used=0)
+        self.driver_mock.get_available_resource.return_value = virt_resources
+
+        update_mock = self._update_available_resources()
+
+        self.assertFalse(get_mock.called)
+        self.assertFalse(migr_mock.called)
+        actual_resources = update_mock.call_args[0][1]
+        self.assertEqual(1024, actual_resources.memory_mb)
+        self.assertEqual(256, actual_resources.memory_mb_used)
+        self.assertEqual(768, actual_resources.free_ram_mb)
+
+    @mock.patch.object(resource_tracker.LOG, 'warning')
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_audit_reports_changes(self, get_mock, migr_mock, get_cn_mock,
+                                   pci_mock, instance_pci_mock, mock_warning):
+        self.flags(resource_audit_interval=600)
+        self._setup_rt()
+        get_mock.return_value = []
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+
+        self._update_available_resources()
+        self.assertFalse(mock_warning.called)
+        get_mock.reset_mock()
+
+        # The tracked usage drifted, and the audit is due again.
+        self.rt.compute_nodes[_NODENAME].memory_mb_used = 256
+        self.rt.tracked_instances[uuids.stale] = {'node': _NODENAME}
+        self.rt.last_audit[_NODENAME] -= 600
+
+        update_mock = self._update_available_resources()
+
+        self.assertTrue(get_mock.called)
+        self.assertEqual(0, update_mock.call_args[0][1].memory_mb_used)
+        changes = mock_warning.call_args[0][1]['changes']
+        self.assertEqual("memory_mb_used: 256 -> 0; "
+                         "stale instances: ['%s']" % uuids.stale, changes)
+
+    def test_audit_keeps_other_nodes_tracked(self):
+        self._setup_rt()
+        self.rt.compute_nodes = {
+            _NODENAME: _COMPUTE_NODE_FIXTURES[0].obj_clone(),
+            'other-node': objects.ComputeNode()}
+        self.rt.tracked_instances = {uuids.mine: {'node': _NODENAME},
+                                     uuids.other: {'node': 'other-node'}}
+
+        self.rt._update_usage_from_instances(mock.sentinel.ctx, [],
+                                             _NODENAME)
+
+        self.assertEqual([uuids.other], list(self.rt.tracked_instances))
+
 
 class TestInitComputeNode(BaseTestCase):
 
@@ -1373,6 +1473,144 @@ class TestInstanceClaim(BaseTestCase):
         self.assertEqual(self.rt.host, self.instance.launched_on)
         self.assertEqual(_NODENAME, self.instance.node)
 
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node',
+                return_value=[])
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_claim_during_audit_queries(self, get_mock, migr_mock, pci_mock,
+                                        pci_dev_mock, inst_pci_mock):
+        querying = eventlet_event.Event()
+        release = eventlet_event.Event()
+
+        def fake_get(*args, **kwargs):
+            if get_mock.call_count == 1:
+                querying.send()
+                release.wait()
+                return []
+            return [self.instance]
+
+        get_mock.side_effect = fake_get
+        with test.nested(
+                mock.patch.object(self.rt, '_save_compute_node'),
+                mock.patch.object(self.instance, 'save')) as (save_mock, _):
+            audit = utils.spawn(self.rt.update_available_resource,
+                                self.ctx, _NODENAME)
+            querying.wait()
+            # The audit loads the instances without holding the node lock.
+            self.rt.instance_claim(self.ctx, self.instance, _NODENAME, None)
+            self.assertEqual(1, save_mock.call_count)
+            release.send()
+            audit.wait()
+
+        # The instances are loaded again as the claim changed the node.
+        self.assertEqual(2, get_mock.call_count)
+        cn = self.rt.compute_nodes[_NODENAME]
+        self.assertEqual(self.instance.memory_mb, cn.memory_mb_used)
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.PciDeviceList.get_by_compute_node',
+                return_value=objects.PciDeviceList())
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node',
+                return_value=[])
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node',
+                return_value=[])
+    def test_claim_during_audit_report(self, get_mock, migr_mock, pci_mock,
+                                       pci_dev_mock, inst_pci_mock):
+        saving = eventlet_event.Event()
+        release = eventlet_event.Event()
+        saved = []
+
+        def fake_save(context, compute_node):
+            saved.append(compute_node.memory_mb_used)
+            if len(saved) == 1:
+                saving.send()
+                release.wait()
+
+        with test.nested(
+                mock.patch.object(self.rt, '_save_compute_node',
+                                  side_effect=fake_save),
+                mock.patch.object(self.instance, 'save')):
+            audit = utils.spawn(self.rt.update_available_resource,
+                                self.ctx, _NODENAME)
+            saving.wait()
+            # The audit saves the compute node without holding the node lock.
+            self.rt.instance_claim(self.ctx, self.instance, _NODENAME, None)
+            self.assertEqual([0], saved)
+            release.send()
+            audit.wait()
+
+        # The claim is saved by the audit once it is done saving its own.
+        self.assertEqual([0, self.instance.memory_mb], saved)
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node',
+                return_value=[])
+    def test_claim_resets_changes(self, migr_mock, pci_mock):
+        cn = self.rt.compute_nodes[_NODENAME]
+        cn.obj_reset_changes(recursive=True)
+        saved = []
+
+        def fake_save(context, compute_node):
+            saved.append(compute_node.obj_what_changed())
+
+        with test.nested(
+                mock.patch.object(self.rt, '_save_compute_node',
+                                  side_effect=fake_save),
+                mock.patch.object(self.instance, 'save')):
+            self.rt.instance_claim(self.ctx, self.instance, _NODENAME, None)
+
+        # The copy saved carries the changes, the tracked node is reset.
+        self.assertIn('memory_mb_used', saved[0])
+        self.assertEqual(set(), cn.obj_what_changed())
+
+    def test_deferred_update_keeps_replaced_changes(self):
+        cn = self.rt.compute_nodes[_NODENAME]
+        cn.obj_reset_changes(recursive=True)
+        self.rt._deferred_nodes.add(_NODENAME)
+
+        cn.memory_mb_used = 1
+        self.rt._update(self.ctx, cn)
+        cn.vcpus_used = 1
+        self.rt._update(self.ctx, cn)
+
+        # The second update replaces the first one, unreported yet.
+        _ctx, update = self.rt._pending_updates[_NODENAME]
+        self.assertTrue(set(['memory_mb_used', 'vcpus_used']).issubset(
+            update.obj_what_changed()))
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node',
+                return_value=[])
+    @mock.patch.object(resource_tracker.LOG, 'exception')
+    def test_claim_error_not_replaced_by_report_error(self, mock_log,
+                                                      migr_mock, pci_mock):
+        # An update of the node is left to report when the claim fails.
+        self.rt._pending_updates[_NODENAME] = (
+            self.ctx, self.rt.compute_nodes[_NODENAME].obj_clone())
+        error = exc.ComputeResourcesUnavailable(reason='fake')
+
+        with test.nested(
+                mock.patch.object(self.rt, '_save_compute_node',
+                                  side_effect=exc.ComputeHostNotFound(
+                                      host=_HOSTNAME)),
+                mock.patch.object(claims, 'Claim', side_effect=error)):
+            raised = self.assertRaises(exc.ComputeResourcesUnavailable,
+                                       self.rt.instance_claim, self.ctx,
+                                       self.instance, _NODENAME, None)
+
+        self.assertIs(error, raised)
+        self.assertEqual(1, mock_log.call_count)
+
     @mock.patch('nova.pci.stats.PciDeviceStats.support_requests',
                 return_value=True)
     @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid')
@@ -2264,6 +2502,21 @@ class TestUpdateUsageFromInstance(BaseTestCase):
         mock_update_usage.assert_called_once_with(
             self.rt._get_usage_dict(self.instance), _NODENAME, sign=-1)
 
+    @mock.patch('nova.compute.resource_tracker.ResourceTracker.'
+                '_update_usage')
+    def test_stats_per_node(self, mock_update_usage):
+        cn = _COMPUTE_NODE_FIXTURES[0].obj_clone()
+        cn.hypervisor_hostname = 'other-node'
+        cn.stats = {}
+        self.rt.compute_nodes['other-node'] = cn
+        self.instance.vm_state = vm_states.BUILDING
+        self.rt._update_usage_from_instance(mock.sentinel.ctx, self.instance,
+                                            _NODENAME)
+
+        self.assertEqual(1, self.rt.stats[_NODENAME].num_instances)
+        self.assertEqual(0, self.rt.stats['other-node'].num_instances)
+        self.assertEqual({}, cn.stats)
+
 
 class TestInstanceInResizeState(test.NoDBTestCase):
     def test_active_suspending(self):
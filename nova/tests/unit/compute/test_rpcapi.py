@@ -521,6 +521,34 @@ class ComputeRpcAPITestCase(test.NoDBTestCase):
     def test_get_host_uptime(self):
         self._test_compute_api('get_host_uptime', 'call', host='host')
 
+    @mock.patch('nova.rpc.ClientRouter.by_host')
+    def test_cache_images(self, mock_by_host):
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        client = mock_by_host.return_value
+        client.can_send_version.return_value = True
+        cctxt = client.prepare.return_value
+        rpcapi = compute_rpcapi.ComputeAPI()
+
+        result = rpcapi.cache_images(ctxt, 'host', ['image'], timeout=60)
+        self.assertEqual(cctxt.call.return_value, result)
+        mock_by_host.assert_called_once_with(ctxt, 'host')
+        client.can_send_version.assert_called_once_with('4.14')
+        client.prepare.assert_called_once_with(server='host', version='4.14',
+                                               timeout=60)
+        cctxt.call.assert_called_once_with(ctxt, 'cache_images',
+                                           image_ids=['image'])
+
+    @mock.patch('nova.rpc.ClientRouter.by_host')
+    def test_cache_images_old_compute(self, mock_by_host):
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        client = mock_by_host.return_value
+        client.can_send_version.return_value = False
+        rpcapi = compute_rpcapi.ComputeAPI()
+
+        self.assertRaises(exception.ImageCacheNotSupported,
+                          rpcapi.cache_images, ctxt, 'host', ['image'])
+        self.assertFalse(client.prepare.called)
+
     def test_backup_instance(self):
         self._test_compute_api('backup_instance', 'cast',
                 instance=self.fake_instance_obj, image_id='id',
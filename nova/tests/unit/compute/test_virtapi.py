@@ -15,11 +15,14 @@
 import mock
 
 from nova.compute import manager as compute_manager
+from nova.compute import task_states
+from nova.compute import vm_states
 from nova import context
 from nova import db
 from nova import exception
 from nova import objects
 from nova import test
+from nova.tests.unit import fake_instance
 from nova.virt import fake
 from nova.virt import virtapi
 
@@ -138,6 +141,25 @@ class ComputeVirtAPITest(VirtAPIBaseTest):
             self.assertIn(event.event_name, events.values())
             event.wait.assert_called_once_with()
 
+    @mock.patch('nova.compute.utils.timeline_event')
+    def test_wait_for_instance_event_timeline(self, mock_timeline_event):
+        self.flags(build_timeline=True)
+        instance = fake_instance.fake_instance_obj(
+            self.context, vm_state=vm_states.BUILDING,
+            task_state=task_states.SPAWNING)
+        with self.virtapi.wait_for_instance_event(instance, ['foo']):
+            pass
+        mock_timeline_event.assert_called_once_with(
+            instance._context, 'compute_wait_for_instance_event', instance)
+
+        # Only the builds record the wait.
+        mock_timeline_event.reset_mock()
+        instance.vm_state = vm_states.ACTIVE
+        instance.task_state = task_states.REBOOTING_HARD
+        with self.virtapi.wait_for_instance_event(instance, ['foo']):
+            pass
+        self.assertFalse(mock_timeline_event.called)
+
     def test_wait_for_instance_event_failed(self):
         def _failer():
             event = mock.MagicMock()
@@ -16,6 +16,7 @@
 """Tests for the conductor service."""
 
 import copy
+import datetime
 
 import mock
 from mox3 import mox
@@ -1487,6 +1488,35 @@ class ConductorTaskTestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
                 else:
                     self.assertEqual(0, len(actions))
 
+    @mock.patch.object(db, 'action_event_finish')
+    @mock.patch.object(db, 'action_event_start')
+    def test_record_build_timeline(self, mock_start, mock_finish):
+        created_at = timeutils.utcnow()
+        schedule_start = created_at + datetime.timedelta(seconds=1)
+        schedule_finish = created_at + datetime.timedelta(seconds=3)
+        self.conductor._record_build_timeline(
+            self.context, uuids.instance, created_at, schedule_start,
+            schedule_finish)
+        self.assertEqual(
+            [('wait_for_scheduling', created_at),
+             ('schedule_instances', schedule_start)],
+            [(call[0][1]['event'], call[0][1]['start_time'])
+             for call in mock_start.call_args_list])
+        self.assertEqual(
+            [('wait_for_scheduling', schedule_start),
+             ('schedule_instances', schedule_finish)],
+            [(call[0][1]['event'], call[0][1]['finish_time'])
+             for call in mock_finish.call_args_list])
+
+    @mock.patch.object(db, 'action_event_start',
+                       side_effect=exc.InstanceActionNotFound(
+                           request_id='fake', instance_uuid=uuids.instance))
+    def test_record_build_timeline_failure_ignored(self, mock_start):
+        self.conductor._record_build_timeline(
+            self.context, uuids.instance, None, timeutils.utcnow(),
+            timeutils.utcnow())
+        self.assertEqual(1, mock_start.call_count)
+
     @mock.patch('nova.compute.rpcapi.ComputeAPI.build_and_run_instance')
     @mock.patch('nova.scheduler.rpcapi.SchedulerAPI.select_destinations')
     @mock.patch('nova.objects.HostMapping.get_by_host')
@@ -2398,6 +2428,112 @@ class ConductorTaskTestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
                          fake_inst.system_metadata)
         mock_save.assert_called_once_with()
 
+    @mock.patch('nova.context.target_cell')
+    @mock.patch.object(objects.HostMapping, 'get_by_host')
+    def test_cache_images(self, mock_get_hm, mock_target):
+        self.flags(image_cache_concurrency=2, group='conductor')
+        aggregate = objects.Aggregate(name='agg',
+                                      hosts=['host1', 'host2', 'host3'])
+        results = {'host1': {uuids.image1: 'downloaded',
+                             uuids.image2: 'cached'},
+                   'host2': exc.ComputeHostNotFound(host='host2'),
+                   'host3': {uuids.image1: 'downloaded',
+                             uuids.image2: 'error'}}
+
+        def cache_images(ctxt, host, image_ids, timeout):
+            self.assertIsNot(self.context, ctxt)
+            self.assertEqual([uuids.image1, uuids.image2], image_ids)
+            self.assertEqual(1800, timeout)
+            if isinstance(results[host], Exception):
+                raise results[host]
+            return results[host]
+
+        with test.nested(
+            mock.patch.object(self.conductor.compute_rpcapi, 'cache_images',
+                              side_effect=cache_images),
+            mock.patch.object(conductor_manager.LOG, 'info'),
+        ) as (mock_cache, mock_info):
+            self.conductor.cache_images(self.context, aggregate,
+                                        [uuids.image1, uuids.image2])
+
+        self.assertEqual(3, mock_cache.call_count)
+        self.assertEqual(3, mock_get_hm.call_count)
+        mock_target.assert_has_calls(
+            [mock.call(mock.ANY, mock_get_hm.return_value.cell_mapping)] * 3,
+            any_order=True)
+        self.assertEqual('1 cached, 2 downloaded, 3 error',
+                         mock_info.call_args[0][1]['results'])
+
+    @mock.patch('nova.context.target_cell')
+    @mock.patch.object(objects.HostMapping, 'get_by_host')
+    @mock.patch.object(objects.Service, 'get_by_compute_host')
+    def test_cache_images_timeout(self, mock_get_service, mock_get_hm,
+                                  mock_target):
+        aggregate = objects.Aggregate(name='agg', hosts=['host1', 'host2'])
+        calls = []
+        results = {'host1': [messaging.MessagingTimeout(),
+                             {uuids.image: 'cached'}],
+                   'host2': [messaging.MessagingTimeout()]}
+
+        def cache_images(ctxt, host, image_ids, timeout):
+            calls.append(host)
+            result = results[host].pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with test.nested(
+            mock.patch.object(self.conductor.compute_rpcapi, 'cache_images',
+                              side_effect=cache_images),
+            mock.patch.object(self.conductor.servicegroup_api,
+                              'service_is_up', side_effect=[True, False]),
+            mock.patch.object(conductor_manager.LOG, 'info'),
+        ) as (mock_cache, mock_is_up, mock_info):
+            self.conductor.cache_images(self.context, aggregate,
+                                        [uuids.image])
+
+        # The first host is asked again until it is done, before the second
+        # host starts.
+        self.assertEqual(['host1', 'host1', 'host2'], calls)
+        mock_get_service.assert_has_calls([mock.call(mock.ANY, 'host1'),
+                                           mock.call(mock.ANY, 'host2')])
+        self.assertEqual('1 cached, 1 error',
+                         mock_info.call_args[0][1]['results'])
+
+    @mock.patch('nova.context.target_cell')
+    @mock.patch.object(objects.HostMapping, 'get_by_host')
+    def test_cache_images_unauthorized(self, mock_get_hm, mock_target):
+        aggregate = objects.Aggregate(name='agg',
+                                      hosts=['host1', 'host2', 'host3'])
+        results = {'host1': {uuids.image: 'downloaded'},
+                   'host2': {uuids.image: 'unauthorized'}}
+
+        def cache_images(ctxt, host, image_ids, timeout):
+            return results[host]
+
+        with test.nested(
+            mock.patch.object(self.conductor.compute_rpcapi, 'cache_images',
+                              side_effect=cache_images),
+            mock.patch.object(conductor_manager.LOG, 'error'),
+        ) as (mock_cache, mock_error):
+            self.conductor.cache_images(self.context, aggregate,
+                                        [uuids.image])
+
+        self.assertEqual(['host1', 'host2'],
+                         [c[0][1] for c in mock_cache.call_args_list])
+        summary = mock_error.call_args[0][1]
+        self.assertEqual(1, summary['done'])
+        self.assertEqual('1 downloaded, 1 skipped, 1 unauthorized',
+                         summary['results'])
+
+    def test_cache_images_empty_aggregate(self):
+        aggregate = objects.Aggregate(name='agg', hosts=[])
+        with mock.patch.object(self.conductor.compute_rpcapi,
+                               'cache_images') as mock_cache:
+            self.conductor.cache_images(self.context, aggregate,
+                                        [uuids.image1])
+        self.assertFalse(mock_cache.called)
+
 
 class ConductorTaskRPCAPITestCase(_BaseTaskTestCase,
         test_compute.BaseTestCase):
@@ -2435,6 +2571,18 @@ class ConductorTaskRPCAPITestCase(_BaseTaskTestCase,
                 self.context, 'live_migrate_instance', **kw)
         _test()
 
+    def test_cache_images(self):
+        aggregate = objects.Aggregate(name='agg', hosts=['host1'])
+        cctxt_mock = mock.MagicMock()
+        with mock.patch.object(self.conductor.client, 'prepare',
+                               return_value=cctxt_mock) as prepare_mock:
+            self.conductor.cache_images(self.context, aggregate,
+                                        [uuids.image])
+        prepare_mock.assert_called_once_with(version='1.17')
+        cctxt_mock.cast.assert_called_once_with(
+            self.context, 'cache_images', aggregate=aggregate,
+            image_ids=[uuids.image])
+
     @mock.patch.object(objects.InstanceMapping, 'get_by_instance_uuid')
     def test_targets_cell_no_instance_mapping(self, mock_im):
 
@@ -2473,3 +2621,12 @@ class ConductorTaskAPITestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
                 self.context, inst_obj, {'host': 'destination'}, True, False,
                 None, 'block_migration', 'disk_over_commit', None,
                 request_spec=None)
+
+    def test_cache_images(self):
+        aggregate = objects.Aggregate(name='agg', hosts=['host1'])
+        with mock.patch.object(self.conductor.conductor_compute_rpcapi,
+                               'cache_images') as mock_cache:
+            self.conductor.cache_images(self.context, aggregate,
+                                        [uuids.image])
+        mock_cache.assert_called_once_with(self.context, aggregate,
+                                           [uuids.image])
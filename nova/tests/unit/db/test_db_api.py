@@ -2980,6 +2980,47 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         meta = utils.metadata_to_dict(new_ref['metadata'])
         self.assertEqual(meta, {'mk1': 'mv3'})
 
+    def test_instance_update_and_get_original_many(self):
+        inst1 = self.create_instance_with_args(vm_state='building')
+        inst2 = self.create_instance_with_args(vm_state='active')
+        result = db.instance_update_and_get_original_many(
+            self.ctxt, {inst1['uuid']: {'vm_state': 'error'},
+                        inst2['uuid']: {'vm_state': 'stopped',
+                                        'metadata': {'mk1': 'mv3'}}},
+            columns_to_join=['metadata'])
+        self.assertEqual(set([inst1['uuid'], inst2['uuid']]), set(result))
+        old_ref, new_ref = result[inst1['uuid']]
+        self.assertEqual('building', old_ref['vm_state'])
+        self.assertEqual('error', new_ref['vm_state'])
+        old_ref, new_ref = result[inst2['uuid']]
+        self.assertEqual('active', old_ref['vm_state'])
+        self.assertEqual('stopped', new_ref['vm_state'])
+        self.assertEqual({'mk1': 'mv3'},
+                         utils.metadata_to_dict(new_ref['metadata']))
+
+    def test_instance_update_and_get_original_many_expected_per_row(self):
+        inst1 = self.create_instance_with_args(task_state=None)
+        inst2 = self.create_instance_with_args(task_state='rebooting')
+        values = {'power_state': 4, 'expected_task_state': None}
+        result = db.instance_update_and_get_original_many(
+            self.ctxt, {inst1['uuid']: dict(values),
+                        inst2['uuid']: dict(values),
+                        uuidsentinel.missing: dict(values)})
+        # Only the matching instance is updated, the others are skipped
+        # without failing the whole transaction.
+        self.assertEqual([inst1['uuid']], list(result))
+        self.assertEqual(
+            4, db.instance_get_by_uuid(self.ctxt,
+                                       inst1['uuid'])['power_state'])
+        self.assertNotEqual(
+            4, db.instance_get_by_uuid(self.ctxt,
+                                       inst2['uuid'])['power_state'])
+
+    def test_instance_update_and_get_original_many_empty(self):
+        self.assertEqual({},
+                         db.instance_update_and_get_original_many(self.ctxt,
+                                                                  {}))
+
     def test_instance_update_and_get_original_no_conflict_on_session(self):
         @sqlalchemy_api.pick_context_manager_writer
         def test(context):
@@ -4000,6 +4041,27 @@ class InstanceActionTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                              self.ctxt.request_id)
         self.assertNotEqual('Error', action['message'])
 
+    def test_instance_action_event_finish_attempts(self):
+        """Finish the events of two attempts of the same stage."""
+        uuid = uuidsentinel.uuid1
+
+        action = db.action_start(self.ctxt, self._create_action_values(uuid))
+
+        for result in ('Error', 'Success'):
+            db.action_event_start(self.ctxt, self._create_event_values(uuid))
+            event_values = {
+                'finish_time': timeutils.utcnow(),
+                'result': result
+            }
+            event_values = self._create_event_values(uuid, extra=event_values)
+            db.action_event_finish(self.ctxt, event_values)
+
+        events = db.action_events_get(self.ctxt, action['id'])
+        self.assertEqual(['Success', 'Error'],
+                         [event['result'] for event in events])
+        for event in events:
+            self.assertIsNotNone(event['finish_time'])
+
     def test_instance_action_event_finish_error(self):
         """Finish an instance action event with an error."""
         uuid = uuidsentinel.uuid1
@@ -7515,6 +7577,113 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
                           'project1', 'resource1', 42)
 
 
+class QuotaReserveShardedTestCase(test.TestCase):
+
+    """Tests for db.api.quota_reserve_sharded."""
+
+    def setUp(self):
+        super(QuotaReserveShardedTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.quotas = {'resource0': 10}
+        self.resources = {'resource0': quota.ReservableResource(
+            'resource0', '_sync_resource0', 'quota_res_0')}
+        self.expire = timeutils.utcnow() + datetime.timedelta(days=1)
+
+        def sync(elevated, project_id, user_id):
+            return {'resource0': 1}
+        patcher = mock.patch.dict(sqlalchemy_api.QUOTA_SYNC_FUNCTIONS,
+                                  {'_sync_resource0': sync})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _reserve(self, delta):
+        return db.quota_reserve_sharded(
+            self.ctxt, self.resources, self.quotas, self.quotas,
+            {'resource0': delta}, self.expire, None, 0, 4,
+            project_id='project1', user_id='user1')
+
+    def _usages(self):
+        @sqlalchemy_api.pick_context_manager_reader
+        def get(context):
+            return sqlalchemy_api.model_query(
+                context, models.QuotaUsage, read_deleted='no').\
+                filter_by(project_id='project1').\
+                order_by(models.QuotaUsage.id).\
+                all()
+        return [(row.in_use, row.reserved) for row in get(self.ctxt)]
+
+    def test_reserve_refreshes_missing_usage(self):
+        with mock.patch.object(sqlalchemy_api, 'quota_reserve',
+                               wraps=sqlalchemy_api.quota_reserve) as reserve:
+            self._reserve(2)
+        self.assertTrue(reserve.called)
+        self.assertEqual([(1, 2)], self._usages())
+
+    @mock.patch.object(sqlalchemy_api.random, 'randrange')
+    def test_reserve_spreads_over_shards(self, randrange):
+        self._reserve(2)
+        randrange.side_effect = [3, 0, 3]
+        with mock.patch.object(sqlalchemy_api, 'quota_reserve') as reserve:
+            for i in range(3):
+                self._reserve(1)
+        self.assertFalse(reserve.called)
+        randrange.assert_called_with(4)
+        self.assertEqual([(1, 3), (0, 1), (0, 1)], self._usages())
+        self.assertEqual({'project_id': 'project1', 'user_id': 'user1',
+                          'resource0': {'in_use': 1, 'reserved': 5}},
+                         db.quota_usage_get_all_by_project_and_user(
+                             self.ctxt, 'project1', 'user1'))
+
+    def test_reserve_over_quota(self):
+        self._reserve(2)
+        self.assertRaises(exception.OverQuota, self._reserve, 8)
+        self.assertEqual([(1, 2)], self._usages())
+
+    def test_reserve_concurrently_over_quota(self):
+        self._reserve(2)
+        concurrent = []
+        real_reserve = sqlalchemy_api._quota_shard_reserve
+
+        def fake_reserve(*args, **kwargs):
+            # Another request passed the quota check at the same time.
+            concurrent.extend(real_reserve(*args, **kwargs))
+            return real_reserve(*args, **kwargs)
+
+        with mock.patch.object(sqlalchemy_api, '_quota_shard_reserve',
+                               side_effect=fake_reserve):
+            self.assertRaises(exception.OverQuota, self._reserve, 4)
+        self.assertEqual({'project_id': 'project1',
+                          'resource0': {'in_use': 1, 'reserved': 6}},
+                         db.quota_usage_get_all_by_project(self.ctxt,
+                                                           'project1'))
+        _reservation_get(self.ctxt, concurrent[0])
+
+    @mock.patch.object(sqlalchemy_api.random, 'randrange', return_value=3)
+    def test_locked_reserve_merges_shards(self, randrange):
+        self._reserve(2)
+        reservations = self._reserve(1)
+        self.assertEqual([(1, 2), (0, 1)], self._usages())
+
+        db.quota_reserve(self.ctxt, self.resources, self.quotas, self.quotas,
+                         {'resource0': 1}, self.expire, None, 0,
+                         project_id='project1', user_id='user1')
+        self.assertEqual([(1, 4)], self._usages())
+
+        # The reservation now points at the record the shard was merged into.
+        db.reservation_commit(self.ctxt, reservations, 'project1', 'user1')
+        self.assertEqual([(2, 3)], self._usages())
+
+    @mock.patch.object(sqlalchemy_api.random, 'randrange', return_value=3)
+    def test_commit_and_rollback_shard(self, randrange):
+        self._reserve(2)
+        commit = self._reserve(1)
+        rollback = self._reserve(3)
+        self.assertEqual([(1, 2), (0, 1), (0, 3)], self._usages())
+        db.reservation_commit(self.ctxt, commit, 'project1', 'user1')
+        db.reservation_rollback(self.ctxt, rollback, 'project1', 'user1')
+        self.assertEqual([(1, 2), (1, 0), (0, 0)], self._usages())
+
+
 class QuotaReserveNoDbTestCase(test.NoDBTestCase):
     """Tests quota reserve/refresh operations using mock."""
 
@@ -0,0 +1,106 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import sqlalchemy as sa
+
+from nova import context
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import query_stats
+from nova import test
+
+
+def instance_get_all(engine):
+    return engine.execute('SELECT 1').fetchall()
+
+
+class QueryStatsTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(QueryStatsTestCase, self).setUp()
+        self.addCleanup(query_stats.reset)
+        query_stats.enable()
+        self.engine = sa.create_engine('sqlite://')
+        query_stats.add_listeners(self.engine)
+        self.ctxt = context.RequestContext('fake-user', 'fake-project',
+                                           request_id='req-1')
+
+    def test_scope_disabled(self):
+        query_stats.reset()
+        with query_stats.scope(instance_get_all):
+            instance_get_all(self.engine)
+        self.assertEqual(({}, {}), query_stats.get_stats())
+
+    def test_scope(self):
+        with query_stats.scope(instance_get_all):
+            instance_get_all(self.engine)
+            instance_get_all(self.engine)
+        functions, requests = query_stats.get_stats()
+        self.assertEqual(['instance_get_all'], list(functions))
+        self.assertEqual(1, functions['instance_get_all'].calls)
+        self.assertEqual(2, functions['instance_get_all'].statements)
+        self.assertEqual(['req-1'], list(requests))
+        self.assertEqual(1, requests['req-1'].calls)
+        self.assertEqual(2, requests['req-1'].statements)
+
+    def test_nested_scope(self):
+        def outer():
+            pass
+
+        with query_stats.scope(outer):
+            with query_stats.scope(instance_get_all):
+                instance_get_all(self.engine)
+        functions, _requests = query_stats.get_stats()
+        self.assertEqual(['outer'], list(functions))
+        self.assertEqual(1, functions['outer'].statements)
+
+    def test_no_scope(self):
+        instance_get_all(self.engine)
+        functions, _requests = query_stats.get_stats()
+        self.assertEqual([__name__ + '.instance_get_all'], list(functions))
+        self.assertEqual(0, functions[__name__ + '.instance_get_all'].calls)
+
+    def test_decorators(self):
+        @sqlalchemy_api.pick_context_manager_reader
+        def func(context):
+            pass
+
+        with mock.patch.object(sqlalchemy_api, 'get_context_manager'):
+            func(self.ctxt)
+        functions, _requests = query_stats.get_stats()
+        self.assertEqual(1, functions['func'].calls)
+
+    @mock.patch.object(query_stats, 'LOG')
+    def test_report(self, mock_log):
+        self.flags(report_top=1, group='db_profiling')
+        with query_stats.scope(instance_get_all):
+            query_stats.record(0.5, 3)
+        query_stats.record(0.1, 1)
+
+        query_stats.report()
+
+        self.assertEqual(1, mock_log.info.call_count)
+        params = mock_log.info.call_args[0][1]
+        self.assertEqual('  instance_get_all: 1 calls, 1 statements, 3 rows, '
+                         '0.500s', params['functions'])
+        self.assertIn('req-1: 1 calls, 2 statements', params['requests'])
+        self.assertEqual(({}, {}), query_stats.get_stats())
+
+    @mock.patch.object(query_stats, 'report')
+    def test_record_reports_periodically(self, mock_report):
+        self.flags(report_interval=60, group='db_profiling')
+        query_stats.record(0.1, 1)
+        self.assertFalse(mock_report.called)
+        now = query_stats._last_report + 60
+        with mock.patch('time.time', return_value=now):
+            query_stats.record(0.1, 1)
+        mock_report.assert_called_once_with()
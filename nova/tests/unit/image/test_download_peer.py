@@ -0,0 +1,145 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+
+import cryptography
+import fixtures
+import mock
+from requests_mock.contrib import fixture
+
+from nova.image.download import peer
+from nova.image import glance
+from nova import test
+from nova.tests import uuidsentinel as uuids
+
+PEER1 = 'http://peer1:8080/'
+PEER2 = 'http://peer2:8080'
+
+
+class TestPeerTransfer(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestPeerTransfer, self).setUp()
+        self.flags(peer_image_cache_urls=[PEER1, PEER2], group='glance')
+        self.requests = self.useFixture(fixture.Fixture())
+        self.data = b'image data' * 10000
+        self.image = {'id': uuids.image, 'disk_format': 'raw',
+                      'checksum': hashlib.md5(self.data).hexdigest()}
+        self.name = hashlib.sha1(uuids.image.encode('utf-8')).hexdigest()
+        self.dst_path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'image')
+        # Try the peers in the order of the option.
+        self.useFixture(fixtures.MockPatch(
+            'random.sample', side_effect=lambda l, n: list(l)))
+
+    def _read(self):
+        with open(self.dst_path, 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        self.requests.get(PEER1 + self.name, content=self.data)
+        xfer = peer.get_download_handler()
+
+        self.assertTrue(xfer.download(None, self.image, self.dst_path))
+        self.assertEqual(self.data, self._read())
+        self.assertEqual(1, self.requests.call_count)
+
+    def test_download_next_peer(self):
+        self.requests.get(PEER1 + self.name, status_code=404)
+        self.requests.get(PEER2 + '/' + self.name, content=self.data)
+        xfer = peer.get_download_handler()
+
+        self.assertTrue(xfer.download(None, self.image, self.dst_path))
+        self.assertEqual(self.data, self._read())
+        self.assertEqual(2, self.requests.call_count)
+
+    def test_download_checksum_mismatch(self):
+        self.requests.get(PEER1 + self.name, content=b'corrupt')
+        self.requests.get(PEER2 + '/' + self.name, status_code=404)
+        xfer = peer.get_download_handler()
+
+        self.assertFalse(xfer.download(None, self.image, self.dst_path))
+        self.assertEqual(b'', self._read())
+
+    def test_download_connection_error(self):
+        self.requests.get(PEER1 + self.name, exc=IOError('refused'))
+        self.requests.get(PEER2 + '/' + self.name, content=self.data)
+        xfer = peer.get_download_handler()
+
+        self.assertTrue(xfer.download(None, self.image, self.dst_path))
+        self.assertEqual(self.data, self._read())
+
+    def test_download_converted_image(self):
+        self.flags(force_raw_images=True)
+        self.image['disk_format'] = 'qcow2'
+        xfer = peer.get_download_handler()
+
+        self.assertFalse(xfer.download(None, self.image, self.dst_path))
+        self.assertEqual(0, self.requests.call_count)
+
+    def test_download_no_checksum(self):
+        del self.image['checksum']
+        xfer = peer.get_download_handler()
+
+        self.assertFalse(xfer.download(None, self.image, self.dst_path))
+        self.assertEqual(0, self.requests.call_count)
+
+    def test_download_verifies_signature(self):
+        self.requests.get(PEER1 + self.name, content=self.data)
+        verifier = mock.Mock()
+        xfer = peer.get_download_handler()
+
+        self.assertTrue(xfer.download(None, self.image, self.dst_path,
+                                      verifier=verifier))
+        self.assertEqual(self.data, b''.join(
+            c[0][0] for c in verifier.update.call_args_list))
+        verifier.verify.assert_called_once_with()
+
+    def test_download_invalid_signature(self):
+        self.requests.get(PEER1 + self.name, content=self.data)
+        verifier = mock.Mock()
+        verifier.verify.side_effect = (
+            cryptography.exceptions.InvalidSignature('Invalid signature.'))
+        xfer = peer.get_download_handler()
+
+        self.assertRaises(cryptography.exceptions.InvalidSignature,
+                          xfer.download, None, self.image, self.dst_path,
+                          verifier=verifier)
+        self.assertEqual(b'', self._read())
+
+    @mock.patch('nova.image.glance.GlanceImageServiceV2.show')
+    def test_service_download_from_peer(self, mock_show):
+        mock_show.return_value = self.image
+        self.requests.get(PEER1 + self.name, content=self.data)
+        client = mock.Mock()
+        service = glance.GlanceImageServiceV2(client)
+
+        service.download(None, uuids.image, dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read())
+        self.assertFalse(client.call.called)
+
+    @mock.patch('os.fsync')
+    @mock.patch('nova.image.glance.GlanceImageServiceV2.show')
+    def test_service_download_falls_back_to_glance(self, mock_show,
+                                                   mock_fsync):
+        mock_show.return_value = self.image
+        self.requests.get(PEER1 + self.name, status_code=404)
+        self.requests.get(PEER2 + '/' + self.name, status_code=404)
+        client = mock.Mock()
+        client.call.return_value = [self.data]
+        service = glance.GlanceImageServiceV2(client)
+
+        service.download(None, uuids.image, dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read())
+        client.call.assert_called_once_with(None, 2, 'data', uuids.image)
@@ -16,12 +16,17 @@
 
 import copy
 import datetime
+import hashlib
+import os
 
 import cryptography
+import eventlet
+import fixtures
 import glanceclient.exc
 from glanceclient.v1 import images
 import glanceclient.v2.schemas as schemas
 import mock
+from oslo_utils import units
 import six
 from six.moves import StringIO
 import testtools
@@ -938,6 +943,218 @@ class TestDownloadSignatureVerification(test.NoDBTestCase):
         self.assertTrue(mock_dest.close.called)
 
 
+class FakeRangeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRangeClient(object):
+    """Stand-in for the glance client wrapper, serving the data of an image
+    to range requests made through its http_client.
+    """
+
+    def __init__(self, data, support_ranges=True, fail_at=None,
+                 yield_chunks=False):
+        self.data = data
+        self.support_ranges = support_ranges
+        # Offsets at which the connection drops, once each.
+        self.fail_at = set(fail_at or [])
+        # Whether to let the other green threads run after each chunk.
+        self.yield_chunks = yield_chunks
+        self.requests = []
+
+    def _body(self, start, end):
+        offset = start
+        while offset <= end:
+            chunk_end = min(offset + 64 * units.Ki, end + 1)
+            for fail in sorted(self.fail_at):
+                if offset <= fail < chunk_end:
+                    self.fail_at.discard(fail)
+                    yield self.data[offset:fail]
+                    raise IOError('connection reset')
+            yield self.data[offset:chunk_end]
+            offset = chunk_end
+            if self.yield_chunks:
+                eventlet.sleep(0)
+
+    def call(self, context, version, method, url, headers=None,
+             controller=None):
+        assert (version, method, controller) == (2, 'get', 'http_client')
+        start, end = [int(x) for x in
+                      headers['Range'][len('bytes='):].split('-')]
+        self.requests.append((start, end))
+        if not self.support_ranges:
+            return (FakeRangeResponse(200),
+                    self._body(0, len(self.data) - 1))
+        return FakeRangeResponse(206), self._body(start, end)
+
+
+class TestRangedImageDownload(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestRangedImageDownload, self).setUp()
+        self.flags(download_workers=4, download_range_size=1,
+                   group='glance')
+        self.data = b''.join(six.int2byte(i % 251)
+                             for i in range(256)) * (10 * units.Ki + 7)
+        self.checksum = hashlib.md5(self.data).hexdigest()
+        self.dst_path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'image')
+        self.mock_sleep = self.useFixture(
+            fixtures.MockPatch('time.sleep')).mock
+
+    def _download(self, client, checksum=None, verifier=None):
+        return glance.RangedImageDownload(
+            client, mock.sentinel.ctx, uuids.image, self.dst_path,
+            len(self.data), checksum=checksum or self.checksum,
+            verifier=verifier)
+
+    def _read(self):
+        with open(self.dst_path, 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        client = FakeRangeClient(self.data)
+        download = self._download(client)
+
+        self.assertTrue(download.run())
+        self.assertEqual(self.data, self._read())
+        mib = units.Mi
+        self.assertEqual([(0, mib - 1), (mib, 2 * mib - 1),
+                          (2 * mib, len(self.data) - 1)],
+                         sorted(client.requests))
+        self.assertEqual(0, download.resumed)
+        self.assertIsNotNone(download.elapsed)
+
+    def test_download_resumes_interrupted_range(self):
+        fail_at = units.Mi + 300 * units.Ki + 5
+        client = FakeRangeClient(self.data, fail_at=[fail_at])
+        download = self._download(client)
+
+        self.assertTrue(download.run())
+        self.assertEqual(self.data, self._read())
+        self.assertIn((fail_at, 2 * units.Mi - 1), client.requests)
+        self.assertEqual(4, len(client.requests))
+        self.assertEqual(1, download.resumed)
+        self.mock_sleep.assert_called_once_with(1)
+
+    def test_download_retries_range_request(self):
+        self.flags(num_retries=1, group='glance')
+        ranges = FakeRangeClient(self.data)
+        client = glance.GlanceClientWrapper()
+        client.client = mock.Mock()
+        client.api_server = 'http://host1:9292'
+        errors = [glanceclient.exc.CommunicationError()]
+
+        def get(url, headers):
+            if errors:
+                raise errors.pop()
+            return ranges.call(mock.sentinel.ctx, 2, 'get', url,
+                               headers=headers, controller='http_client')
+
+        client.client.http_client.get.side_effect = get
+        download = self._download(client)
+
+        self.assertTrue(download.run())
+        self.assertEqual(self.data, self._read())
+        self.assertEqual(4, client.client.http_client.get.call_count)
+        self.mock_sleep.assert_called_once_with(1)
+
+    def test_download_interrupted_too_often(self):
+        self.flags(download_range_retries=1, group='glance')
+        client = FakeRangeClient(self.data,
+                                 fail_at=[units.Mi + 10, units.Mi + 20])
+        download = self._download(client)
+
+        self.assertRaises(exception.ImageDownloadFailed, download.run)
+        self.assertEqual(b'', self._read())
+
+    def test_download_reports_failed_range(self):
+        self.flags(download_workers=2, download_range_retries=0,
+                   group='glance')
+        client = FakeRangeClient(self.data, fail_at=[units.Mi + 10],
+                                 yield_chunks=True)
+        download = self._download(client)
+
+        # The first range is aborted by the failure of the second one.
+        exc = self.assertRaises(exception.ImageDownloadFailed, download.run)
+        self.assertIn('range %d-%d interrupted at %d' %
+                      (units.Mi, 2 * units.Mi - 1, units.Mi + 10),
+                      six.text_type(exc))
+        self.assertEqual(b'', self._read())
+
+    def test_download_checksum_mismatch(self):
+        client = FakeRangeClient(self.data)
+        download = self._download(client, checksum='0' * 32)
+
+        self.assertRaises(exception.ImageChecksumMismatch, download.run)
+        self.assertEqual(b'', self._read())
+
+    def test_download_updates_verifier(self):
+        client = FakeRangeClient(self.data)
+        verifier = mock.Mock()
+        download = self._download(client, verifier=verifier)
+
+        self.assertTrue(download.run())
+        self.assertEqual(self.data, b''.join(
+            c[0][0] for c in verifier.update.call_args_list))
+        verifier.verify.assert_called_once_with()
+
+    def test_download_invalid_signature(self):
+        client = FakeRangeClient(self.data)
+        verifier = mock.Mock()
+        verifier.verify.side_effect = (
+            cryptography.exceptions.InvalidSignature('Invalid signature.'))
+        download = self._download(client, verifier=verifier)
+
+        self.assertRaises(cryptography.exceptions.InvalidSignature,
+                          download.run)
+        self.assertEqual(b'', self._read())
+
+    def test_download_ranges_not_supported(self):
+        client = FakeRangeClient(self.data, support_ranges=False)
+        download = self._download(client)
+
+        self.assertFalse(download.run())
+        self.assertFalse(os.path.exists(self.dst_path))
+        self.assertEqual(1, len(client.requests))
+
+    @mock.patch('nova.image.glance.GlanceImageServiceV2.show')
+    def test_service_download_uses_ranges(self, mock_show):
+        mock_show.return_value = {'size': len(self.data),
+                                  'checksum': self.checksum,
+                                  'properties': {}}
+        client = FakeRangeClient(self.data)
+        service = glance.GlanceImageServiceV2(client)
+
+        self.assertIsNone(service.download(mock.sentinel.ctx, uuids.image,
+                                           dst_path=self.dst_path))
+        self.assertEqual(self.data, self._read())
+        mock_show.assert_called_once_with(mock.sentinel.ctx, uuids.image,
+                                          include_locations=False)
+
+    @mock.patch('nova.image.glance.GlanceImageServiceV2.show')
+    def test_service_download_falls_back_to_sequential(self, mock_show):
+        mock_show.return_value = {'size': len(self.data),
+                                  'checksum': self.checksum,
+                                  'properties': {}}
+        client = mock.Mock()
+        client.call.side_effect = [
+            (FakeRangeResponse(200), iter([])),
+            [self.data[:units.Mi], self.data[units.Mi:]]]
+        service = glance.GlanceImageServiceV2(client)
+
+        service.download(mock.sentinel.ctx, uuids.image,
+                         dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read())
+        client.call.assert_called_with(mock.sentinel.ctx, 2, 'data',
+                                       uuids.image)
+
+
 class TestIsImageAvailable(test.NoDBTestCase):
     """Tests the internal _is_image_available function."""
 
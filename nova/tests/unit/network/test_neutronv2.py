@@ -4688,6 +4688,141 @@ class TestNeutronv2ModuleMethods(test.NoDBTestCase):
         self.assertEqual(l, [{'id': 1}, {'id': 2}, {'id': 3}])
 
 
+class TestRefreshInstancesNwInfo(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestRefreshInstancesNwInfo, self).setUp()
+        self.api = neutronapi.API()
+        self.context = context.RequestContext('fake-user', 'fake-project')
+        self.instances = [self._instance(uuids.instance1, uuids.port1),
+                          self._instance(uuids.instance2, uuids.port2)]
+        self.ports = [self._port(uuids.port1, uuids.instance1, '10.0.0.2'),
+                      self._port(uuids.port2, uuids.instance2, '10.0.0.3')]
+        self.client = mock.Mock()
+        self.client.list_ports.side_effect = self._list_ports
+        self.client.list_floatingips.return_value = {'floatingips': [
+            {'port_id': uuids.port1, 'fixed_ip_address': '10.0.0.2',
+             'floating_ip_address': '172.24.4.3'}]}
+        self.client.list_subnets.return_value = {'subnets': [
+            {'id': uuids.subnet, 'network_id': uuids.network,
+             'cidr': '10.0.0.0/24', 'gateway_ip': '10.0.0.1'}]}
+        self.client.list_networks.return_value = {'networks': [
+            {'id': uuids.network, 'name': 'private',
+             'tenant_id': 'fake-project'}]}
+
+    def _instance(self, instance_uuid, port_id):
+        network_info = model.NetworkInfo([
+            model.VIF(id=port_id, network=model.Network(id=uuids.network))])
+        return objects.Instance(
+            uuid=instance_uuid, project_id='fake-project',
+            info_cache=objects.InstanceInfoCache(network_info=network_info))
+
+    def _port(self, port_id, device_id, address):
+        return {'id': port_id, 'device_id': device_id,
+                'tenant_id': 'fake-project', 'network_id': uuids.network,
+                'mac_address': 'fa:16:3e:00:00:01', 'admin_state_up': True,
+                'status': 'ACTIVE',
+                'fixed_ips': [{'subnet_id': uuids.subnet,
+                               'ip_address': address}]}
+
+    def _list_ports(self, **search_opts):
+        if search_opts.get('device_owner') == 'network:dhcp':
+            return {'ports': [self._port(uuids.dhcp, 'dhcp', '10.0.0.10')]}
+        device_ids = search_opts['device_id']
+        if not isinstance(device_ids, list):
+            device_ids = [device_ids]
+        return {'ports': [port for port in self.ports
+                          if port['device_id'] in device_ids]}
+
+    @mock.patch.object(neutronapi, 'get_client')
+    @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
+    @mock.patch('nova.compute.utils.refresh_info_cache_for_instance')
+    def test_refresh_instances_nw_info(self, mock_refresh, mock_update,
+                                       mock_get_client):
+        mock_get_client.return_value = self.client
+
+        errors = self.api.refresh_instances_nw_info(self.context,
+                                                    self.instances)
+
+        self.assertEqual({}, errors)
+        mock_get_client.assert_called_once_with(self.context, admin=True)
+        # The ports of the instances and the DHCP ports of their networks,
+        # then the ports of each instance under its refresh_cache lock.
+        self.assertEqual(4, self.client.list_ports.call_count)
+        self.client.list_floatingips.assert_called_once_with(
+            port_id=mock.ANY)
+        self.client.list_subnets.assert_called_once_with(
+            id=[uuids.subnet])
+        self.client.list_networks.assert_called_once_with(
+            id=[uuids.network])
+
+        self.assertEqual(2, mock_update.call_count)
+        nw_info = mock_update.call_args_list[0][1]['nw_info']
+        self.assertEqual(uuids.port1, nw_info[0]['id'])
+        subnet = nw_info[0]['network']['subnets'][0]
+        self.assertEqual('10.0.0.10', subnet['meta']['dhcp_server'])
+        self.assertEqual(['172.24.4.3'],
+                         [ip['address'] for ip in nw_info.floating_ips()])
+        nw_info = mock_update.call_args_list[1][1]['nw_info']
+        self.assertEqual(uuids.port2, nw_info[0]['id'])
+        self.assertEqual([], nw_info.floating_ips())
+
+    @mock.patch.object(neutronapi, 'get_client')
+    @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
+    @mock.patch('nova.compute.utils.refresh_info_cache_for_instance')
+    def test_refresh_instances_nw_info_error(self, mock_refresh, mock_update,
+                                             mock_get_client):
+        mock_get_client.return_value = self.client
+        error = exception.InstanceInfoCacheNotFound(
+            instance_uuid=uuids.instance1)
+        mock_update.side_effect = [error, None]
+
+        errors = self.api.refresh_instances_nw_info(self.context,
+                                                    self.instances)
+
+        self.assertEqual({uuids.instance1: error}, errors)
+        self.assertEqual(2, mock_update.call_count)
+
+    @mock.patch.object(neutronapi, 'get_client')
+    @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
+    @mock.patch('nova.compute.utils.refresh_info_cache_for_instance')
+    def test_refresh_instances_nw_info_port_detached(self, mock_refresh,
+                                                     mock_update,
+                                                     mock_get_client):
+        mock_get_client.return_value = self.client
+        real_get_bulk_kwargs = self.api._get_bulk_nw_info_kwargs
+
+        def get_bulk_kwargs(context, instances):
+            kwargs = real_get_bulk_kwargs(context, instances)
+            # The interface of the first instance is detached after the bulk
+            # queries.
+            del self.ports[0]
+            return kwargs
+
+        with mock.patch.object(self.api, '_get_bulk_nw_info_kwargs',
+                               side_effect=get_bulk_kwargs):
+            self.api.refresh_instances_nw_info(self.context, self.instances)
+
+        nw_info = mock_update.call_args_list[0][1]['nw_info']
+        self.assertEqual([], [vif['id'] for vif in nw_info])
+        nw_info = mock_update.call_args_list[1][1]['nw_info']
+        self.assertEqual([uuids.port2], [vif['id'] for vif in nw_info])
+
+    def test_bulk_client_passes_other_queries(self):
+        client = neutronapi._BulkNetworkInfoClient(self.api, self.client,
+                                                   self.instances[:1])
+        self.client.reset_mock()
+
+        client.list_ports(tenant_id='fake-project', device_id=uuids.other)
+        self.client.list_ports.assert_called_once_with(
+            tenant_id='fake-project', device_id=uuids.other)
+        client.list_subnets(id=[uuids.other_subnet])
+        self.client.list_subnets.assert_called_once_with(
+            id=[uuids.other_subnet])
+        client.show_port(uuids.port1)
+        self.client.show_port.assert_called_once_with(uuids.port1)
+
+
 class TestNeutronv2Portbinding(TestNeutronv2Base):
 
     def test_allocate_for_instance_portbinding(self):
@@ -153,6 +153,14 @@ class _TestComputeNodeObject(object):
         return {'supported_hv_specs': 'supported_instances',
                 'pci_device_pools': 'pci_stats'}
 
+    def test_field_storage_in_slots(self):
+        compute = compute_node.ComputeNode(host='fake', vcpus=4)
+        for name in compute.fields:
+            self.assertIn(base.get_attrname(name),
+                          compute_node.ComputeNode.__slots__)
+        self.assertEqual({}, compute.__dict__)
+        self.assertEqual(4, compute.vcpus)
+
     @mock.patch.object(db, 'compute_node_get')
     def test_get_by_id(self, get_mock):
         get_mock.return_value = fake_compute_node
@@ -102,6 +102,16 @@ class _TestInstanceObject(object):
         self.assertIsInstance(inst2.launched_at, datetime.datetime)
         self.assertEqual(red_letter_date, inst2.launched_at)
 
+    def test_field_storage_in_slots(self):
+        inst = objects.Instance(uuid=uuids.instance, host='foo',
+                                metadata={'foo': 'bar'})
+        for name in inst.fields:
+            self.assertIn(base.get_attrname(name), objects.Instance.__slots__)
+        self.assertEqual({}, inst.__dict__)
+        self.assertEqual('foo', inst.host)
+        del inst.host
+        self.assertNotIn('host', inst)
+
     def test_ip_deserialization(self):
         inst = objects.Instance(uuid=uuids.instance, access_ip_v4='1.2.3.4',
                                 access_ip_v6='::1')
@@ -1838,6 +1848,65 @@ class _TestInstanceListObject(object):
                                                [x.uuid for x in insts],
                                                latest=True)
 
+    def _make_list_for_save(self):
+        fakes = [self.fake_instance(1, {'uuid': uuids.save_1}),
+                 self.fake_instance(2, {'uuid': uuids.save_2}),
+                 self.fake_instance(3, {'uuid': uuids.save_3})]
+        inst_list = instance._make_instance_list(
+            self.context, objects.InstanceList(), fakes, [])
+        return fakes, inst_list
+
+    @mock.patch.object(notifications, 'send_update')
+    @mock.patch.object(db, 'instance_update_and_get_original_many')
+    def test_save(self, mock_update, mock_notify):
+        fakes, inst_list = self._make_list_for_save()
+        inst_list[0].vm_state = vm_states.ERROR
+        inst_list[1].vm_state = vm_states.ERROR
+        mock_update.return_value = {
+            uuids.save_1: (fakes[0],
+                           dict(fakes[0], vm_state=vm_states.ERROR))}
+
+        failed = inst_list.save(expected_task_state=task_states.REBOOTING)
+
+        # The second instance did not match the expected task state
+        self.assertEqual([uuids.save_2], failed)
+        expected = {'vm_state': vm_states.ERROR,
+                    'expected_task_state': task_states.REBOOTING}
+        mock_update.assert_called_once_with(
+            self.context, {uuids.save_1: expected, uuids.save_2: expected},
+            columns_to_join=mock.ANY)
+        self.assertEqual(vm_states.ERROR, inst_list[0].vm_state)
+        self.assertEqual(set(), inst_list[0].obj_what_changed())
+        self.assertEqual(set(['vm_state']), inst_list[1].obj_what_changed())
+        self.assertEqual(set(), inst_list[2].obj_what_changed())
+        self.assertEqual(1, mock_notify.call_count)
+
+    @mock.patch.object(objects.Instance, 'save')
+    @mock.patch.object(db, 'instance_update_and_get_original_many')
+    def test_save_object_field_changes(self, mock_update, mock_save):
+        fakes, inst_list = self._make_list_for_save()
+        inst_list[0].vcpu_model = None
+        mock_save.side_effect = exception.InstanceNotFound(
+            instance_id=uuids.save_1)
+
+        self.assertEqual([uuids.save_1], inst_list.save())
+
+        mock_save.assert_called_once_with(expected_vm_state=None,
+                                          expected_task_state=None)
+        self.assertFalse(mock_update.called)
+
+    @mock.patch('nova.cells.opts.get_cell_type', return_value='compute')
+    @mock.patch.object(objects.Instance, 'save')
+    @mock.patch.object(db, 'instance_update_and_get_original_many')
+    def test_save_with_cells(self, mock_update, mock_save, mock_cell_type):
+        fakes, inst_list = self._make_list_for_save()
+        inst_list[0].vm_state = vm_states.ERROR
+
+        self.assertEqual([], inst_list.save())
+
+        self.assertEqual(3, mock_save.call_count)
+        self.assertFalse(mock_update.called)
+
     @mock.patch('nova.objects.instance.Instance.obj_make_compatible')
     def test_get_by_security_group(self, mock_compat):
         fake_secgroup = dict(test_security_group.fake_secgroup)
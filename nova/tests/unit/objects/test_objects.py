@@ -448,6 +448,62 @@ class _TestObject(object):
         obj2.obj_reset_changes()
         self.assertEqual(obj2.obj_what_changed(), set())
 
+    def test_obj_to_primitive_matches_base(self):
+        obj = MyObj(foo=123, bar='bar', readonly=1,
+                    rel_object=MyOwnedObject(baz=1),
+                    rel_objects=[MyOwnedObject(baz=2), MyOwnedObject(baz=3)])
+        obj.obj_reset_changes(['readonly'])
+        obj.rel_objects[1].baz = 4
+        expected = ovo_base.VersionedObject.obj_to_primitive(obj)
+        primitive = obj.obj_to_primitive()
+        self.assertEqual(
+            sorted(expected.pop('nova_object.changes')),
+            sorted(primitive.pop('nova_object.changes')))
+        self.assertEqual(expected, primitive)
+
+    def test_obj_to_primitive_computes_changes_once(self):
+        obj = MyObj(foo=123)
+        with mock.patch.object(obj, 'obj_what_changed',
+                               return_value=set(['foo'])) as mock_changed:
+            primitive = obj.obj_to_primitive()
+        mock_changed.assert_called_once_with()
+        self.assertEqual(['foo'], primitive['nova_object.changes'])
+
+    def test_obj_to_primitive_same_version_no_backport(self):
+        obj = MyObj(foo=1)
+        with mock.patch.object(obj, 'obj_make_compatible') as mock_compat:
+            obj.obj_to_primitive(target_version=obj.VERSION)
+        self.assertFalse(mock_compat.called)
+
+    def test_obj_to_primitive_backport_uses_base(self):
+        obj = MyObj(bar='bar')
+        primitive = obj.obj_to_primitive(target_version='1.1')
+        self.assertEqual('1.1', primitive['nova_object.version'])
+        self.assertEqual('oldbar', primitive['nova_object.data']['bar'])
+
+    def test_obj_from_primitive_read_only_and_changes(self):
+        obj = MyObj(foo=1, readonly=2, rel_object=MyOwnedObject(baz=3))
+        obj.obj_reset_changes(['readonly'])
+        primitive = obj.obj_to_primitive()
+        primitive['nova_object.data']['unknown'] = 'ignored'
+        obj2 = MyObj.obj_from_primitive(primitive)
+        self.assertEqual(2, obj2.readonly)
+        self.assertEqual(3, obj2.rel_object.baz)
+        self.assertEqual(set(['foo', 'rel_object']), obj2.obj_what_changed())
+        self.assertRaises(ovo_exc.ReadOnlyFieldError,
+                          setattr, obj2, 'readonly', 3)
+
+    def test_obj_field_descriptors_rebuilt_with_fields(self):
+        @base.NovaObjectRegistry.register_if(False)
+        class Foo(base.NovaObject):
+            fields = {'foo': fields.IntegerField()}
+
+        self.assertEqual([('foo', '_obj_foo')],
+                         [(n, a) for n, f, a in Foo._obj_field_descriptors()])
+        Foo.fields = dict(Foo.fields, bar=fields.IntegerField())
+        self.assertEqual(set(['foo', 'bar']),
+                         set(n for n, f, a in Foo._obj_field_descriptors()))
+
     def test_orphaned_object(self):
         obj = MyObj.query(self.context)
         obj._context = None
@@ -1109,7 +1165,7 @@ object_data = {
     'InstanceGroup': '1.10-1a0c8c7447dc7ecb9da53849430c4a5f',
     'InstanceGroupList': '1.7-be18078220513316abd0ae1b2d916873',
     'InstanceInfoCache': '1.5-cd8b96fefe0fc8d4d337243ba0bf0e1e',
-    'InstanceList': '2.2-ff71772c7bf6d72f6ef6eee0199fb1c9',
+    'InstanceList': '2.3-24fa97b940beade9b70e337bf8780b4d',
     'InstanceMapping': '1.0-65de80c491f54d19374703c0753c4d47',
     'InstanceMappingList': '1.1-14d4a4296c3cbf51e660b657dc37b19e',
     'InstanceNUMACell': '1.4-7c1eb9a198dee076b4de0840e45f4f55',
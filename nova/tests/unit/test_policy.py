@@ -284,6 +284,7 @@ class RealRolePolicyTestCase(test.NoDBTestCase):
 "os_compute_api:os-aggregates:add_host",
 "os_compute_api:os-aggregates:remove_host",
 "os_compute_api:os-aggregates:set_metadata",
+"os_compute_api:os-aggregates:cache_images",
 "os_compute_api:os-agents",
 "os_compute_api:os-baremetal-nodes",
 "os_compute_api:os-cells",
@@ -2337,6 +2337,30 @@ class DbQuotaDriverTestCase(test.TestCase):
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
+    def test_reserve_usage_shards(self):
+        def fake_quota_reserve_sharded(context, resources, quotas,
+                                       user_quotas, deltas, expire,
+                                       until_refresh, max_age, shards,
+                                       project_id=None, user_id=None):
+            self.calls.append(('quota_reserve_sharded', expire, until_refresh,
+                               max_age, shards))
+            return ['resv-1']
+        self.stub_out('nova.db.quota_reserve_sharded',
+                      fake_quota_reserve_sharded)
+        self._stub_get_project_quotas()
+        self._stub_quota_reserve()
+        self.flags(usage_shards=4, group='quota')
+        expire = timeutils.utcnow() + datetime.timedelta(seconds=120)
+        result = self.driver.reserve(FakeContext('test_project', 'test_class'),
+                                     quota.QUOTAS._resources,
+                                     dict(instances=2), expire=expire)
+
+        self.assertEqual(self.calls, [
+                'get_project_quotas',
+                ('quota_reserve_sharded', expire, 0, 0, 4),
+                ])
+        self.assertEqual(result, ['resv-1'])
+
     def test_usage_reset(self):
         calls = []
 
@@ -58,7 +58,7 @@ def get_disk_type_from_path(path):
 
 def copy_image(src, dest, host=None, receive=False,
                on_execute=None, on_completion=None,
-               compression=True):
+               compression=True, reflink=False):
     pass
 
 
@@ -57,6 +57,7 @@ VIR_DOMAIN_BLOCK_JOB_ABORT_ASYNC = 1
 VIR_DOMAIN_BLOCK_JOB_ABORT_PIVOT = 2
 
 VIR_DOMAIN_EVENT_ID_LIFECYCLE = 0
+VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED = 15
 
 VIR_DOMAIN_EVENT_DEFINED = 0
 VIR_DOMAIN_EVENT_UNDEFINED = 1
@@ -148,6 +149,15 @@ VIR_DOMAIN_BLOCK_REBASE_RELATIVE = 8
 VIR_CONNECT_LIST_DOMAINS_ACTIVE = 1
 VIR_CONNECT_LIST_DOMAINS_INACTIVE = 2
 
+# getAllDomainStats stats and flags
+VIR_DOMAIN_STATS_STATE = 1
+VIR_DOMAIN_STATS_BALLOON = 4
+VIR_DOMAIN_STATS_VCPU = 8
+VIR_DOMAIN_STATS_INTERFACE = 16
+VIR_DOMAIN_STATS_BLOCK = 32
+VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE = 1
+VIR_CONNECT_GET_ALL_DOMAINS_STATS_INACTIVE = 2
+
 # secret type
 VIR_SECRET_USAGE_TYPE_NONE = 0
 VIR_SECRET_USAGE_TYPE_VOLUME = 1
@@ -6052,6 +6052,72 @@ class LibvirtConnTestCase(test.NoDBTestCase):
         self.assertEqual(uuids[3], vm4.UUIDString())
         mock_list.assert_called_with(only_guests=True, only_running=False)
 
+    @mock.patch.object(host.Host, "list_instance_domains")
+    def test_get_power_states(self, mock_list):
+        vm1 = FakeVirtDomain(uuidstr=uuids.vm1)
+        vm2 = FakeVirtDomain(uuidstr=uuids.vm2,
+                             info=[libvirt_guest.VIR_DOMAIN_SHUTOFF,
+                                   2048 * units.Mi, 0, None, None])
+        vm3 = FakeVirtDomain(uuidstr=uuids.vm3)
+
+        mock_list.return_value = [vm1, vm2, vm3]
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        states = drvr.get_power_states([uuids.vm1, uuids.vm2, uuids.vm4])
+        self.assertEqual({uuids.vm1: power_state.RUNNING,
+                          uuids.vm2: power_state.SHUTDOWN,
+                          uuids.vm4: power_state.NOSTATE}, states)
+        mock_list.assert_called_once_with(only_guests=True,
+                                          only_running=False)
+
+    @mock.patch.object(host.Host, "list_instance_domains")
+    @mock.patch.object(host.Host, "get_all_domain_stats")
+    def test_get_power_states_bulk(self, mock_stats, mock_list):
+        guest = libvirt_guest.Guest(mock.Mock())
+        mock_stats.return_value = {
+            uuids.vm1: libvirt_guest.DomainStats(guest, {
+                'state.state': libvirt_guest.VIR_DOMAIN_RUNNING}),
+            uuids.vm2: libvirt_guest.DomainStats(guest, {
+                'state.state': libvirt_guest.VIR_DOMAIN_SHUTOFF}),
+            uuids.vm3: libvirt_guest.DomainStats(guest, {
+                'state.state': libvirt_guest.VIR_DOMAIN_RUNNING})}
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        states = drvr.get_power_states([uuids.vm1, uuids.vm2, uuids.vm4])
+        self.assertEqual({uuids.vm1: power_state.RUNNING,
+                          uuids.vm2: power_state.SHUTDOWN,
+                          uuids.vm4: power_state.NOSTATE}, states)
+        mock_stats.assert_called_once_with(
+            only_running=False, stats=fakelibvirt.VIR_DOMAIN_STATS_STATE)
+        self.assertFalse(mock_list.called)
+
+    @mock.patch.object(fake_libvirt_utils, 'fetch_image')
+    def test_cache_image(self, mock_fetch):
+        self.flags(instances_path=self.useFixture(fixtures.TempDir()).path)
+        base = os.path.join(CONF.instances_path,
+                            CONF.image_cache_subdirectory_name,
+                            imagecache.get_cache_fname(uuids.image))
+
+        def fetch_image(context, target, image_id):
+            open(target, 'w').close()
+
+        mock_fetch.side_effect = fetch_image
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+
+        self.assertTrue(drvr.cache_image(self.context, uuids.image))
+        mock_fetch.assert_called_once_with(self.context, base, uuids.image)
+        with mock.patch.object(fake_libvirt_utils,
+                               'update_mtime') as mock_update_mtime:
+            self.assertFalse(drvr.cache_image(self.context, uuids.image))
+        self.assertEqual(1, mock_fetch.call_count)
+        mock_update_mtime.assert_called_once_with(base)
+
+    @mock.patch.object(fake_libvirt_utils, 'fetch_image')
+    def test_cache_image_clone(self, mock_fetch):
+        self.flags(images_type='rbd', group='libvirt')
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.assertRaises(NotImplementedError, drvr.cache_image,
+                          self.context, uuids.image)
+        self.assertFalse(mock_fetch.called)
+
     @mock.patch('nova.virt.libvirt.host.Host.get_online_cpus',
                 return_value=None)
     @mock.patch('nova.virt.libvirt.host.Host.get_cpu_count',
@@ -12357,7 +12423,7 @@ class LibvirtConnTestCase(test.NoDBTestCase):
                         'disk_size': '10737418240',
                         'over_committed_disk_size': '0'}]}
 
-        def get_info(instance_name, xml, block_device_info):
+        def get_info(instance_name, xml, block_device_info, use_cache):
             return fake_disks.get(instance_name)
 
         instance_uuids = [dom.UUIDString() for dom in instance_domains]
@@ -12441,7 +12507,7 @@ class LibvirtConnTestCase(test.NoDBTestCase):
                         'disk_size': '32212254720',
                         'over_committed_disk_size': '42949672960'}]}
 
-        def side_effect(name, dom, block_device_info):
+        def side_effect(name, dom, block_device_info, use_cache):
             if name == 'instance0000001':
                 self.assertEqual('/dev/vda',
                                  block_device_info['root_device_name'])
@@ -12509,6 +12575,65 @@ class LibvirtConnTestCase(test.NoDBTestCase):
         drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         self.assertEqual(0, drvr._get_disk_over_committed_size_total())
 
+    @mock.patch.object(fake_libvirt_utils, 'get_disk_backing_file',
+                       return_value='base')
+    @mock.patch.object(disk_api, 'get_disk_size', return_value=10 * units.Gi)
+    @mock.patch.object(os, 'stat')
+    def test_get_qcow2_disk_info_cached(self, mock_stat, mock_size,
+                                        mock_backing):
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        mock_stat.return_value = mock.Mock(st_mtime=1.0, st_size=units.Mi)
+
+        for _i in range(2):
+            self.assertEqual((10 * units.Gi, 'base'),
+                             drvr._get_qcow2_disk_info('/test/disk'))
+        self.assertEqual(1, mock_size.call_count)
+        self.assertEqual(1, mock_backing.call_count)
+
+        # The disk is inspected again once it changed.
+        mock_stat.return_value = mock.Mock(st_mtime=2.0, st_size=units.Mi)
+        drvr._get_qcow2_disk_info('/test/disk')
+        self.assertEqual(2, mock_size.call_count)
+        self.assertEqual(2, mock_backing.call_count)
+
+    def test_invalidate_qcow2_disk_info(self):
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instance = objects.Instance(**self.test_instance)
+        inst_path = libvirt_utils.get_instance_path(instance)
+        other_path = libvirt_utils.get_instance_path(
+            objects.Instance(uuid=uuids.other))
+        drvr._qcow2_disk_info = {
+            os.path.join(inst_path, 'disk'): mock.sentinel.disk,
+            os.path.join(inst_path, 'disk.local'): mock.sentinel.local,
+            os.path.join(other_path, 'disk'): mock.sentinel.other}
+
+        drvr._invalidate_qcow2_disk_info(instance)
+
+        self.assertEqual({os.path.join(other_path, 'disk'):
+                          mock.sentinel.other}, drvr._qcow2_disk_info)
+
+    @mock.patch.object(libvirt_driver.LibvirtDriver,
+                       "_get_instance_disk_info_from_xml",
+                       return_value=[{'path': '/test/disk1',
+                                      'over_committed_disk_size': 1}])
+    @mock.patch.object(host.Host, "list_instance_domains",
+                       return_value=[mock.MagicMock(name='foo')])
+    @mock.patch.object(objects.BlockDeviceMappingList, "bdms_by_instance_uuid")
+    @mock.patch.object(objects.InstanceList, "get_by_filters")
+    def test_disk_over_committed_size_total_cache(self, mock_get, mock_bdms,
+                                                  mock_list, mock_info):
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        drvr._qcow2_disk_info = {'/test/disk1': mock.sentinel.disk1,
+                                 '/test/disk2': mock.sentinel.disk2}
+
+        self.assertEqual(1, drvr._get_disk_over_committed_size_total())
+
+        mock_info.assert_called_once_with(mock.ANY, mock.ANY, None,
+                                          use_cache=True)
+        # The disks which are gone are forgotten.
+        self.assertEqual({'/test/disk1': mock.sentinel.disk1},
+                         drvr._qcow2_disk_info)
+
     def test_cpu_info(self):
         drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -13625,6 +13750,23 @@ class LibvirtConnTestCase(test.NoDBTestCase):
         self.assertEqual(6, drvr._get_vcpu_used())
         mock_list.assert_called_with(only_guests=True, only_running=True)
 
+    @mock.patch.object(host.Host, "list_instance_domains")
+    @mock.patch.object(host.Host, "get_all_domain_stats")
+    def test_vcpu_count_bulk(self, mock_stats, mock_list):
+        guest = libvirt_guest.Guest(mock.Mock())
+        # The vcpu statistics are missing when the hypervisor cannot
+        # report them, such guests count as 1 vCPU.
+        mock_stats.return_value = {
+            uuids.vm1: libvirt_guest.DomainStats(guest, {}),
+            uuids.vm2: libvirt_guest.DomainStats(guest, {'vcpu.current': 5})}
+
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+
+        self.assertEqual(6, drvr._get_vcpu_used())
+        mock_stats.assert_called_once_with(
+            stats=fakelibvirt.VIR_DOMAIN_STATS_VCPU)
+        self.assertFalse(mock_list.called)
+
     def test_get_instance_capabilities(self):
         drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -17549,6 +17691,36 @@ class LibvirtVolumeUsageTestCase(test.NoDBTestCase):
                             'rd_req': 169, 'wr_bytes': 0}]
         self.assertEqual(vol_usage, expected_usage)
 
+    @mock.patch.object(host.Host, 'get_all_domain_stats')
+    def test_get_all_volume_usage_bulk(self, mock_stats):
+        guest = libvirt_guest.Guest(mock.Mock())
+        mock_stats.return_value = {
+            self.ins_ref.uuid: libvirt_guest.DomainStats(guest, {
+                'block.count': 1,
+                'block.0.name': 'vde',
+                'block.0.rd.reqs': 169, 'block.0.rd.bytes': 688640,
+                'block.0.wr.reqs': 0, 'block.0.wr.bytes': 0})}
+
+        # The statistics of the disks missing from the bulk statistics
+        # are queried one by one.
+        with mock.patch.object(self.drvr, 'block_stats',
+                               return_value=(1, 2, 3, 4, -1)) as mock_block:
+            vol_usage = self.drvr.get_all_volume_usage(self.c,
+                  [dict(instance=self.ins_ref, instance_bdms=self.bdms)])
+
+        mock_stats.assert_called_once_with(
+            stats=fakelibvirt.VIR_DOMAIN_STATS_BLOCK)
+        mock_block.assert_called_once_with(self.ins_ref, 'vda')
+        expected_usage = [{'volume': 1,
+                           'instance': self.ins_ref,
+                           'rd_bytes': 688640, 'wr_req': 0,
+                           'rd_req': 169, 'wr_bytes': 0},
+                          {'volume': 2,
+                           'instance': self.ins_ref,
+                           'rd_bytes': 2, 'wr_req': 3,
+                           'rd_req': 1, 'wr_bytes': 4}]
+        self.assertEqual(expected_usage, vol_usage)
+
     def test_get_all_volume_usage_device_not_found(self):
         def fake_get_domain(self, instance):
             raise exception.InstanceNotFound(instance_id="fakedom")
@@ -17592,6 +17764,12 @@ class LibvirtNonblockingTestCase(test.NoDBTestCase):
             fakelibvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
             mox.IgnoreArg(),
             mox.IgnoreArg())
+        eventlet.tpool.execute(
+            conn.domainEventRegisterAny,
+            None,
+            fakelibvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED,
+            mox.IgnoreArg(),
+            mox.IgnoreArg())
         if hasattr(fakelibvirt.virConnect, 'registerCloseCallback'):
             eventlet.tpool.execute(
                 conn.registerCloseCallback,
@@ -18604,6 +18782,36 @@ class LibvirtSnapshotTests(_BaseSnapshotTests):
     def test_raw(self, mock_convert_image):
         self._test_snapshot(disk_format='raw')
 
+    @mock.patch.object(fake_libvirt_utils, 'disk_type', new='raw')
+    @mock.patch.object(libvirt_driver.imagebackend.images,
+                       'convert_image')
+    @mock.patch.object(libvirt_driver.imagebackend.Flat, 'snapshot_source',
+                       return_value='filename')
+    @mock.patch.object(libvirt_guest.Guest, 'get_power_state',
+                       return_value=power_state.SHUTDOWN)
+    def test_raw_stopped_instance(self, mock_get_power_state,
+                                  mock_snapshot_source, mock_convert_image):
+        with mock.patch.dict(fake_libvirt_utils.files,
+                             {'filename': b'data'}):
+            self._test_snapshot(disk_format='raw')
+
+        # The disk is uploaded as is, without extracting it first.
+        mock_snapshot_source.assert_called_once_with('raw')
+        mock_convert_image.assert_not_called()
+
+    @mock.patch.object(fake_libvirt_utils, 'disk_type', new='raw')
+    @mock.patch.object(libvirt_driver.imagebackend.images,
+                       'convert_image',
+                       side_effect=_fake_convert_image)
+    @mock.patch.object(libvirt_driver.imagebackend.Flat, 'snapshot_source')
+    def test_raw_running_instance_extracts(self, mock_snapshot_source,
+                                           mock_convert_image):
+        self._test_snapshot(disk_format='raw')
+
+        mock_snapshot_source.assert_not_called()
+        mock_convert_image.assert_called_once_with(
+            'filename', mock.ANY, mock.ANY, 'raw')
+
     def test_qcow2(self):
         self._test_snapshot(disk_format='qcow2')
 
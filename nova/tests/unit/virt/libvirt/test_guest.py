@@ -19,6 +19,7 @@ import sys
 import mock
 from oslo_utils import encodeutils
 
+from nova.compute import power_state
 from nova import context
 from nova import exception
 from nova import test
@@ -594,6 +595,105 @@ class GuestTestCase(test.NoDBTestCase):
         self.domain.migrateSetMaxDowntime.assert_called_once_with(1000)
 
 
+class GuestConfigCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(GuestConfigCacheTestCase, self).setUp()
+
+        self.useFixture(fakelibvirt.FakeLibvirtFixture())
+        self.cache = libvirt_guest.GuestConfigCache()
+        self.domain = mock.Mock(spec=fakelibvirt.virDomain)
+        self.domain.UUIDString.return_value = 'fake-uuid'
+        self.domain.XMLDesc.return_value = (
+            "<domain type='kvm'><name>fake</name>"
+            "<devices><disk type='file' device='disk'>"
+            "<target dev='vda' bus='virtio'/></disk></devices></domain>")
+        self.guest = libvirt_guest.Guest(self.domain, config_cache=self.cache)
+
+    def test_get_xml(self):
+        self.assertEqual(self.domain.XMLDesc.return_value,
+                         self.cache.get_xml(self.domain))
+        self.assertEqual(self.domain.XMLDesc.return_value,
+                         self.cache.get_xml(self.domain))
+        self.domain.XMLDesc.assert_called_once_with(0)
+
+    def test_get_config(self):
+        config = self.cache.get_config(self.domain)
+        self.assertIsInstance(config, vconfig.LibvirtConfigGuest)
+        self.assertEqual('fake', config.name)
+        self.assertIs(config, self.cache.get_config(self.domain))
+        self.domain.XMLDesc.assert_called_once_with(0)
+
+    def test_invalidate(self):
+        self.cache.get_xml(self.domain)
+        self.cache.invalidate('other-uuid')
+        self.cache.get_xml(self.domain)
+        self.assertEqual(1, self.domain.XMLDesc.call_count)
+
+        self.cache.invalidate('fake-uuid')
+        self.cache.get_xml(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+        self.cache.invalidate()
+        self.cache.get_xml(self.domain)
+        self.assertEqual(3, self.domain.XMLDesc.call_count)
+
+    def test_invalidate_while_fetching(self):
+        def fake_xml_desc(flags):
+            # An event for the domain arrives while its XML is fetched.
+            self.cache.invalidate('fake-uuid')
+            return '<domain/>'
+
+        self.domain.XMLDesc.side_effect = fake_xml_desc
+        self.assertEqual('<domain/>', self.cache.get_xml(self.domain))
+        self.assertNotIn('fake-uuid', self.cache._entries)
+
+    def test_guest_lookups(self):
+        self.assertEqual(self.domain.XMLDesc.return_value,
+                         self.guest.get_xml_desc())
+        self.assertEqual('vda', self.guest.get_disk('vda').target_dev)
+        self.assertEqual(['vda'], [disk.target_dev for disk in
+                                   self.guest.get_all_disks()])
+        self.assertEqual('fake', self.guest.get_config().name)
+        self.domain.XMLDesc.assert_called_once_with(0)
+
+    def test_guest_get_config_copy(self):
+        config = self.guest.get_config()
+        config.name = 'modified'
+        self.assertEqual('fake', self.guest.get_config().name)
+
+    def test_guest_get_xml_desc_flags(self):
+        self.guest.get_xml_desc(dump_inactive=True)
+        self.guest.get_xml_desc(dump_inactive=True)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+        self.assertNotIn('fake-uuid', self.cache._entries)
+
+    def _test_guest_invalidates(self, func, *args, **kwargs):
+        self.guest.get_xml_desc()
+        func(*args, **kwargs)
+        self.assertNotIn('fake-uuid', self.cache._entries)
+
+    def test_attach_device_invalidates(self):
+        conf = mock.Mock(spec=vconfig.LibvirtConfigGuestDevice)
+        conf.to_xml.return_value = "</xml>"
+        self._test_guest_invalidates(self.guest.attach_device, conf)
+
+    def test_detach_device_invalidates(self):
+        conf = mock.Mock(spec=vconfig.LibvirtConfigGuestDevice)
+        conf.to_xml.return_value = "</xml>"
+        self._test_guest_invalidates(self.guest.detach_device, conf)
+
+    def test_launch_invalidates(self):
+        self._test_guest_invalidates(self.guest.launch)
+
+    def test_poweroff_invalidates(self):
+        self._test_guest_invalidates(self.guest.poweroff)
+
+    def test_block_rebase_invalidates(self):
+        gblock = self.guest.get_block_device('vda')
+        self._test_guest_invalidates(gblock.rebase, 'foo')
+
+
 class GuestBlockTestCase(test.NoDBTestCase):
 
     def setUp(self):
@@ -734,6 +834,59 @@ class GuestBlockTestCase(test.NoDBTestCase):
                           self.gblock.is_job_complete)
 
 
+class DomainStatsTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(DomainStatsTestCase, self).setUp()
+
+        self.useFixture(fakelibvirt.FakeLibvirtFixture())
+        self.guest = libvirt_guest.Guest(
+            mock.Mock(spec=fakelibvirt.virDomain))
+        self.stats = libvirt_guest.DomainStats(self.guest, {
+            'state.state': fakelibvirt.VIR_DOMAIN_RUNNING,
+            'vcpu.current': 2,
+            'balloon.current': 524288,
+            'block.count': 2,
+            'block.0.name': 'vda',
+            'block.0.rd.reqs': 1, 'block.0.rd.bytes': 2,
+            'block.0.wr.reqs': 3, 'block.0.wr.bytes': 4,
+            'block.0.errors': 0,
+            'block.1.name': 'vdb',
+            'block.1.rd.reqs': 5, 'block.1.rd.bytes': 6,
+            'block.1.wr.reqs': 7, 'block.1.wr.bytes': 8,
+            'net.count': 1,
+            'net.0.name': 'tap0',
+            'net.0.rx.bytes': 1, 'net.0.rx.pkts': 2,
+            'net.0.rx.errs': 3, 'net.0.rx.drop': 4,
+            'net.0.tx.bytes': 5, 'net.0.tx.pkts': 6,
+            'net.0.tx.errs': 7, 'net.0.tx.drop': 8,
+        })
+
+    def test_attributes(self):
+        self.assertEqual(self.guest, self.stats.guest)
+        self.assertEqual(power_state.RUNNING, self.stats.power_state)
+        self.assertEqual(2, self.stats.vcpus)
+        self.assertEqual(524288, self.stats.memory_kb)
+
+    def test_get_block_stats(self):
+        # The errors entry is missing when the hypervisor does not
+        # report it, which virDomainBlockStats reports as -1.
+        self.assertEqual({'vda': (1, 2, 3, 4, 0), 'vdb': (5, 6, 7, 8, -1)},
+                         self.stats.get_block_stats())
+
+    def test_get_interface_stats(self):
+        self.assertEqual({'tap0': (1, 2, 3, 4, 5, 6, 7, 8)},
+                         self.stats.get_interface_stats())
+
+    def test_missing_stats(self):
+        stats = libvirt_guest.DomainStats(self.guest, {})
+        self.assertEqual(power_state.NOSTATE, stats.power_state)
+        self.assertIsNone(stats.vcpus)
+        self.assertIsNone(stats.memory_kb)
+        self.assertEqual({}, stats.get_block_stats())
+        self.assertEqual({}, stats.get_interface_stats())
+
+
 class JobInfoTestCase(test.NoDBTestCase):
 
     def setUp(self):
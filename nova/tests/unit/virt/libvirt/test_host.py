@@ -21,6 +21,7 @@ from oslo_utils import uuidutils
 import six
 import testtools
 
+from nova.compute import power_state
 from nova.compute import vm_states
 from nova import exception
 from nova import objects
@@ -265,8 +266,9 @@ class HostTestCase(test.NoDBTestCase):
             return fakelibvirt.openAuth("qemu:///system",
                                         [[], lambda: 1, None], 0)
 
-        def fake_register(*a, **k):
-            self.register_calls += 1
+        def fake_register(dom, eventid, callback, opaque):
+            if eventid == fakelibvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE:
+                self.register_calls += 1
 
         self.connect_calls = 0
         self.register_calls = 0
@@ -293,8 +295,9 @@ class HostTestCase(test.NoDBTestCase):
             return fakelibvirt.openAuth("qemu:///system",
                                         [[], lambda: 1, None], 0)
 
-        def fake_register(*a, **k):
-            self.register_calls += 1
+        def fake_register(dom, eventid, callback, opaque):
+            if eventid == fakelibvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE:
+                self.register_calls += 1
 
         self.connect_calls = 0
         self.register_calls = 0
@@ -460,6 +463,80 @@ class HostTestCase(test.NoDBTestCase):
 
         fake_lookup.assert_called_once_with("instance-0000007c")
 
+    def test_guest_config_cache(self):
+        conn = self.host.get_connection()
+        self.assertIn(fakelibvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED,
+                      conn._event_callbacks)
+        cache = self.host._guest_config_cache
+        self.assertIsInstance(cache, libvirt_guest.GuestConfigCache)
+
+        dom = FakeVirtDomain(id=3, name="instance00000001")
+        guest = self.host.get_guest_for_domain(dom)
+        self.assertEqual(dom, guest._domain)
+        self.assertEqual(cache, guest._config_cache)
+
+    def test_guest_config_cache_events_not_supported(self):
+        def fake_register(dom, eventid, callback, opaque):
+            if eventid != fakelibvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE:
+                raise fakelibvirt.libvirtError('not supported')
+
+        with mock.patch.object(fakelibvirt.Connection,
+                               'domainEventRegisterAny',
+                               side_effect=fake_register):
+            self.host.get_connection()
+
+        self.assertIsNone(self.host._guest_config_cache)
+        guest = self.host.get_guest_for_domain(FakeVirtDomain())
+        self.assertIsNone(guest._config_cache)
+
+    def test_guest_config_cache_lifecycle_events_not_supported(self):
+        with mock.patch.object(fakelibvirt.Connection,
+                               'domainEventRegisterAny',
+                               side_effect=fakelibvirt.libvirtError('nope')):
+            self.host.get_connection()
+
+        self.assertIsNone(self.host._guest_config_cache)
+
+    def _cache_guest_config(self, dom):
+        cache = self.host._guest_config_cache
+        cache.get_xml(dom)
+        self.assertIn(dom.UUIDString(), cache._entries)
+        return cache
+
+    def test_event_guest_config_callback(self):
+        conn = self.host.get_connection()
+        dom = mock.Mock(spec=fakelibvirt.virDomain)
+        dom.UUIDString.return_value = uuids.instance
+        cache = self._cache_guest_config(dom)
+
+        self.host._event_guest_config_callback(
+            conn, dom, 'virtio-disk1', self.host)
+
+        self.assertNotIn(uuids.instance, cache._entries)
+
+    def test_event_lifecycle_invalidates_guest_config(self):
+        conn = self.host.get_connection()
+        dom = mock.Mock(spec=fakelibvirt.virDomain)
+        dom.UUIDString.return_value = uuids.instance
+        cache = self._cache_guest_config(dom)
+
+        self.host._event_lifecycle_callback(
+            conn, dom, fakelibvirt.VIR_DOMAIN_EVENT_DEFINED, 0, self.host)
+
+        self.assertNotIn(uuids.instance, cache._entries)
+
+    def test_new_connection_drops_guest_config_cache(self):
+        self.host.get_connection()
+        dom = mock.Mock(spec=fakelibvirt.virDomain)
+        dom.UUIDString.return_value = uuids.instance
+        cache = self._cache_guest_config(dom)
+
+        self.host._wrapped_conn = None
+        self.host.get_connection()
+
+        self.assertNotIn(uuids.instance, cache._entries)
+        self.assertIsNot(cache, self.host._guest_config_cache)
+
     @mock.patch.object(fakelibvirt.Connection, "listAllDomains")
     def test_list_instance_domains(self, mock_list_all):
         vm0 = FakeVirtDomain(id=0, name="Domain-0")  # Xen dom-0
@@ -524,6 +601,72 @@ class HostTestCase(test.NoDBTestCase):
         self.assertEqual(dom0, result[0]._domain)
         self.assertEqual(dom1, result[1]._domain)
 
+    def _test_get_all_domain_stats(self, only_running, flags):
+        vm0 = FakeVirtDomain(id=0, name="Domain-0")  # Xen dom-0
+        vm1 = FakeVirtDomain(id=3, name="instance00000001")
+        vm1_stats = {'state.state': fakelibvirt.VIR_DOMAIN_RUNNING}
+        conn = self.host.get_connection()
+        with mock.patch.object(conn, 'getAllDomainStats', create=True,
+                               return_value=[(vm0, {}), (vm1, vm1_stats)]
+                               ) as mock_stats:
+            all_stats = self.host.get_all_domain_stats(
+                only_running=only_running)
+
+        mock_stats.assert_called_once_with(
+            fakelibvirt.VIR_DOMAIN_STATS_STATE |
+            fakelibvirt.VIR_DOMAIN_STATS_VCPU |
+            fakelibvirt.VIR_DOMAIN_STATS_BALLOON |
+            fakelibvirt.VIR_DOMAIN_STATS_BLOCK |
+            fakelibvirt.VIR_DOMAIN_STATS_INTERFACE, flags)
+        self.assertEqual([vm1.UUIDString()], list(all_stats))
+        stats = all_stats[vm1.UUIDString()]
+        self.assertIsInstance(stats, libvirt_guest.DomainStats)
+        self.assertEqual(vm1, stats.guest._domain)
+        self.assertEqual(power_state.RUNNING, stats.power_state)
+
+    def test_get_all_domain_stats(self):
+        self._test_get_all_domain_stats(
+            True, fakelibvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+
+    def test_get_all_domain_stats_not_only_running(self):
+        self._test_get_all_domain_stats(
+            False, fakelibvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE |
+            fakelibvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_INACTIVE)
+
+    def test_get_all_domain_stats_mask(self):
+        conn = self.host.get_connection()
+        with mock.patch.object(conn, 'getAllDomainStats', create=True,
+                               return_value=[]) as mock_stats:
+            self.assertEqual({}, self.host.get_all_domain_stats(
+                stats=fakelibvirt.VIR_DOMAIN_STATS_BLOCK))
+        mock_stats.assert_called_once_with(
+            fakelibvirt.VIR_DOMAIN_STATS_BLOCK,
+            fakelibvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+
+    def test_get_all_domain_stats_not_supported(self):
+        conn = self.host.get_connection()
+        error = fakelibvirt.make_libvirtError(
+            fakelibvirt.libvirtError, 'this function is not supported',
+            error_code=fakelibvirt.VIR_ERR_NO_SUPPORT)
+        with mock.patch.object(conn, 'getAllDomainStats', create=True,
+                               side_effect=error):
+            self.assertIsNone(self.host.get_all_domain_stats())
+
+    def test_get_all_domain_stats_old_bindings(self):
+        # fakelibvirt, like bindings older than libvirt 1.2.8, does not
+        # have getAllDomainStats.
+        self.assertIsNone(self.host.get_all_domain_stats())
+
+    def test_get_all_domain_stats_error(self):
+        conn = self.host.get_connection()
+        error = fakelibvirt.make_libvirtError(
+            fakelibvirt.libvirtError, 'internal error',
+            error_code=fakelibvirt.VIR_ERR_INTERNAL_ERROR)
+        with mock.patch.object(conn, 'getAllDomainStats', create=True,
+                               side_effect=error):
+            self.assertRaises(fakelibvirt.libvirtError,
+                              self.host.get_all_domain_stats)
+
     def test_cpu_features_bug_1217630(self):
         self.host.get_connection()
 
@@ -790,9 +933,13 @@ Active:          8381604 kB
                                  fake_dom_xml,
                                  False)
         mock_defineXML.return_value = dom
+        cache = self.host._guest_config_cache
+        cache._entries[dom.UUIDString()] = {'xml': fake_dom_xml,
+                                            'config': None}
         guest = self.host.write_instance_config(fake_dom_xml)
         mock_defineXML.assert_called_once_with(fake_dom_xml)
         self.assertIsInstance(guest, libvirt_guest.Guest)
+        self.assertNotIn(dom.UUIDString(), cache._entries)
 
     @mock.patch.object(fakelibvirt.virConnect, "nodeDeviceLookupByName")
     def test_device_lookup_by_name(self, mock_nodeDeviceLookupByName):
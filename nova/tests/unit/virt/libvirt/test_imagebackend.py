@@ -39,6 +39,7 @@ from nova.virt.image import model as imgmodel
 from nova.virt import images
 from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import imagebackend
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt.storage import rbd_utils
 
 CONF = nova.conf.CONF
@@ -272,6 +273,31 @@ class FlatTestCase(_ImageTestCase, test.NoDBTestCase):
 
         mock_exists.assert_has_calls(exist_calls)
 
+    @mock.patch.object(imagecache, 'STATS',
+                       new_callable=imagecache.ImageCacheStats)
+    def test_cache_accounts_image_lookups(self, mock_stats):
+        def fake_fetch(target, *args, **kwargs):
+            with open(target, 'w') as f:
+                f.write('data')
+
+        image = self.image_class(self.INSTANCE, self.NAME)
+        self.mock_create_image(image)
+        image.cache(fake_fetch, self.TEMPLATE, image_id='fake-image')
+
+        # The second disk is created from the cached image.
+        image = self.image_class(self.INSTANCE, 'other.vm')
+        self.mock_create_image(image)
+        image.cache(fake_fetch, self.TEMPLATE, image_id='fake-image')
+
+        # Ephemeral disk templates are not accounted.
+        image = self.image_class(self.INSTANCE, 'disk.local')
+        self.mock_create_image(image)
+        image.cache(fake_fetch, 'ephemeral_1_0706d66')
+
+        self.assertEqual(1, mock_stats.hits)
+        self.assertEqual(1, mock_stats.misses)
+        self.assertEqual(4, mock_stats.bytes_downloaded)
+
     @mock.patch('os.path.exists')
     def test_cache_generating_resize(self, mock_path_exists):
         # Test for bug 1608934
@@ -347,11 +373,25 @@ class FlatTestCase(_ImageTestCase, test.NoDBTestCase):
         image = self.image_class(self.INSTANCE, self.NAME)
         image.create_image(fn, self.TEMPLATE_PATH, None, image_id=None)
 
-        mock_copy.assert_called_once_with(self.TEMPLATE_PATH, self.PATH)
+        mock_copy.assert_called_once_with(self.TEMPLATE_PATH, self.PATH,
+                                          reflink=False)
         fn.assert_called_once_with(target=self.TEMPLATE_PATH, image_id=None)
         self.assertTrue(mock_sync.called)
         self.assertFalse(mock_extend.called)
 
+    @mock.patch.object(imagebackend.disk, 'extend')
+    @mock.patch.object(fake_libvirt_utils, 'copy_image')
+    @mock.patch.object(imagebackend.utils, 'synchronized')
+    def test_create_image_reflink(self, mock_sync, mock_copy, mock_extend):
+        self.flags(images_reflink=True, group='libvirt')
+        mock_sync.side_effect = lambda *a, **kw: self._fake_deco
+        fn = mock.MagicMock()
+        image = self.image_class(self.INSTANCE, self.NAME)
+        image.create_image(fn, self.TEMPLATE_PATH, None, image_id=None)
+
+        mock_copy.assert_called_once_with(self.TEMPLATE_PATH, self.PATH,
+                                          reflink=True)
+
     @mock.patch.object(imagebackend.disk, 'extend')
     @mock.patch.object(fake_libvirt_utils, 'copy_image')
     @mock.patch.object(imagebackend.utils, 'synchronized')
@@ -383,7 +423,8 @@ class FlatTestCase(_ImageTestCase, test.NoDBTestCase):
         image.create_image(fn, self.TEMPLATE_PATH,
                            self.SIZE, image_id=None)
 
-        mock_copy.assert_called_once_with(self.TEMPLATE_PATH, self.PATH)
+        mock_copy.assert_called_once_with(self.TEMPLATE_PATH, self.PATH,
+                                          reflink=False)
         self.assertTrue(mock_sync.called)
         mock_extend.assert_called_once_with(
             imgmodel.LocalFileImage(self.PATH, imgmodel.FORMAT_RAW),
@@ -421,6 +462,15 @@ class FlatTestCase(_ImageTestCase, test.NoDBTestCase):
                                                  imgmodel.FORMAT_RAW),
                          model)
 
+    def test_snapshot_source(self):
+        image = self.image_class(self.INSTANCE, self.NAME)
+        image.driver_format = 'raw'
+        self.assertEqual(self.PATH, image.snapshot_source('raw'))
+        self.assertIsNone(image.snapshot_source('qcow2'))
+
+        image.driver_format = 'qcow2'
+        self.assertIsNone(image.snapshot_source('qcow2'))
+
 
 class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
     SIZE = units.Gi
@@ -589,7 +639,7 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
         mock_get.assert_called_once_with(self.PATH)
         mock_verify.assert_called_once_with(self.TEMPLATE_PATH, self.SIZE)
         mock_copy.assert_called_once_with(self.TEMPLATE_PATH,
-                                          self.QCOW2_BASE)
+                                          self.QCOW2_BASE, reflink=False)
         mock_extend.assert_called_once_with(
             imgmodel.LocalFileImage(self.QCOW2_BASE,
                                     imgmodel.FORMAT_QCOW2), self.SIZE)
@@ -641,6 +691,12 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
                                                  imgmodel.FORMAT_QCOW2),
                         model)
 
+    def test_snapshot_source(self):
+        # The backing file has to be merged into the snapshot.
+        image = self.image_class(self.INSTANCE, self.NAME)
+        self.assertIsNone(image.snapshot_source('qcow2'))
+        self.assertIsNone(image.snapshot_source('raw'))
+
 
 class LvmTestCase(_ImageTestCase, test.NoDBTestCase):
     VG = 'FakeVG'
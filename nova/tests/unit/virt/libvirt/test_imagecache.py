@@ -23,6 +23,7 @@ from oslo_concurrency import lockutils
 from oslo_concurrency import processutils
 from oslo_log import formatters
 from oslo_log import log as logging
+from oslo_utils import units
 from six.moves import cStringIO
 
 from nova.compute import manager as compute_manager
@@ -238,6 +239,106 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
         self.assertRaises(processutils.ProcessExecutionError,
                           image_cache_manager._list_backing_images)
 
+    def _make_instance_disks(self, tmpdir, names):
+        for name in names:
+            os.mkdir(os.path.join(tmpdir, name))
+            open(os.path.join(tmpdir, name, 'disk'), 'w').close()
+        os.mkdir(os.path.join(tmpdir, CONF.image_cache_subdirectory_name))
+
+    @mock.patch.object(libvirt_utils, 'get_disk_backing_file',
+                       return_value='e97222e91fc4241f49a7f520d1dcf446751129b3')
+    def test_list_backing_images_usage_index(self, mock_backing):
+        self.flags(image_cache_usage_index=True, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self._make_instance_disks(tmpdir, ['instance-00000001',
+                                               'instance-00000002'])
+            found = os.path.join(tmpdir, CONF.image_cache_subdirectory_name,
+                                 'e97222e91fc4241f49a7f520d1dcf446751129b3')
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = self.stock_instance_names
+            self.assertEqual([found],
+                             image_cache_manager._list_backing_images())
+            self.assertEqual(2, mock_backing.call_count)
+
+            # The second pass finds the backing files in the index.
+            mock_backing.reset_mock()
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = self.stock_instance_names
+            self.assertEqual([found],
+                             image_cache_manager._list_backing_images())
+            mock_backing.assert_not_called()
+
+            # A replaced disk is probed again.
+            disk_path = os.path.join(tmpdir, 'instance-00000002', 'disk')
+            os.rename(disk_path, disk_path + '.old')
+            open(disk_path, 'w').close()
+            image_cache_manager._list_backing_images()
+            mock_backing.assert_called_once_with(disk_path)
+
+            # The entries of the instances which are gone are dropped.
+            image_cache_manager.instance_names = set(['instance-00000001'])
+            image_cache_manager._list_backing_images()
+            index = imagecache.ImageCacheUsageIndex(
+                os.path.join(tmpdir, CONF.image_cache_subdirectory_name),
+                CONF.host)
+            self.assertEqual(['instance-00000001'], list(index.load()))
+
+    @mock.patch.object(libvirt_utils, 'get_disk_backing_file')
+    def test_list_backing_images_usage_index_other_host(self, mock_backing):
+        self.flags(image_cache_usage_index=True, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self._make_instance_disks(tmpdir, ['instance-00000001'])
+            base_dir = os.path.join(tmpdir, CONF.image_cache_subdirectory_name)
+            disk_path = os.path.join(tmpdir, 'instance-00000001', 'disk')
+            other = imagecache.ImageCacheUsageIndex(base_dir, 'other-host')
+            other.update({'instance-00000001': (os.stat(disk_path).st_ino,
+                                                'e97222e91fc4241f49a7f520d1d'
+                                                'cf446751129b3')})
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = self.stock_instance_names
+            inuse_images = image_cache_manager._list_backing_images()
+
+            self.assertEqual([os.path.join(
+                base_dir, 'e97222e91fc4241f49a7f520d1dcf446751129b3')],
+                inuse_images)
+            mock_backing.assert_not_called()
+
+    @mock.patch.object(libvirt_utils, 'get_disk_backing_file',
+                       return_value='e97222e91fc4241f49a7f520d1dcf446751129b3')
+    def test_record_and_forget_instance(self, mock_backing):
+        self.flags(image_cache_usage_index=True, group='libvirt')
+        instance = fake_instance.fake_instance_obj(None, uuid=uuids.instance)
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self._make_instance_disks(tmpdir, [uuids.instance])
+            disk_path = os.path.join(tmpdir, uuids.instance, 'disk')
+            base_dir = os.path.join(tmpdir, CONF.image_cache_subdirectory_name)
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.record_instance(instance)
+            mock_backing.assert_called_once_with(disk_path)
+            self.assertEqual(
+                {uuids.instance: {
+                    'inode': os.stat(disk_path).st_ino,
+                    'backing_file':
+                        'e97222e91fc4241f49a7f520d1dcf446751129b3'}},
+                imagecache.ImageCacheUsageIndex(base_dir, CONF.host).load())
+
+            image_cache_manager.forget_instance(instance)
+            self.assertEqual(
+                {},
+                imagecache.ImageCacheUsageIndex(base_dir, CONF.host).load())
+
+    @mock.patch.object(libvirt_utils, 'get_disk_backing_file')
+    def test_record_instance_disabled(self, mock_backing):
+        instance = fake_instance.fake_instance_obj(None, uuid=uuids.instance)
+        imagecache.ImageCacheManager().record_instance(instance)
+        mock_backing.assert_not_called()
+
     def test_find_base_file_nothing(self):
         self.stub_out('os.path.exists', lambda x: False)
 
@@ -304,6 +405,120 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
                                (base_file2, True, False),
                                (base_file3, False, True)])
 
+    def _make_cache_files(self, base_dir, sizes):
+        # Oldest first
+        now = time.time()
+        paths = []
+        for i, size in enumerate(sizes):
+            path = os.path.join(base_dir, '%040d' % i)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            os.utime(path, (now - 100 + i, now - 100 + i))
+            paths.append(path)
+        return paths
+
+    def test_evict_base_files_max_size(self):
+        self.flags(image_cache_max_size=2, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            used, oldest, older, newer = self._make_cache_files(
+                tmpdir, [units.Mi, 2 * units.Mi, units.Mi, units.Mi])
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.active_base_files = [used]
+            image_cache_manager.removable_base_files = [newer, older, oldest]
+
+            usage = image_cache_manager._get_cache_usage(tmpdir)
+            self.assertGreaterEqual(usage, 5 * units.Mi)
+            image_cache_manager._evict_base_files(tmpdir, usage)
+
+            # The least recently used files go first, even if they are
+            # younger than the minimum ages, but used files are kept.
+            self.assertTrue(os.path.exists(used))
+            self.assertFalse(os.path.exists(oldest))
+            self.assertFalse(os.path.exists(older))
+            self.assertTrue(os.path.exists(newer))
+
+    @mock.patch.object(os, 'statvfs')
+    def test_evict_base_files_min_free_space(self, mock_statvfs):
+        self.flags(image_cache_min_free_space=2, group='libvirt')
+        mock_statvfs.return_value = mock.Mock(f_bavail=units.Mi, f_frsize=1)
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            oldest, newer = self._make_cache_files(
+                tmpdir, [2 * units.Mi, units.Mi])
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.removable_base_files = [oldest, newer]
+
+            image_cache_manager._evict_base_files(tmpdir, 3 * units.Mi)
+
+            self.assertFalse(os.path.exists(oldest))
+            self.assertTrue(os.path.exists(newer))
+            mock_statvfs.assert_called_once_with(tmpdir)
+
+    def test_evict_base_files_used_meanwhile(self):
+        self.flags(image_cache_max_size=1, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            base_file, = self._make_cache_files(tmpdir, [2 * units.Mi])
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.removable_base_files = [base_file]
+
+            # The file is used after it was chosen for eviction.
+            real_stat = os.stat
+
+            def fake_stat(path):
+                st = real_stat(path)
+                os.utime(path, None)
+                return st
+
+            with mock.patch.object(os, 'stat', side_effect=fake_stat):
+                image_cache_manager._evict_base_files(tmpdir, 2 * units.Mi)
+
+            self.assertTrue(os.path.exists(base_file))
+
+    def test_evict_base_files_used_since_pass_started(self):
+        self.flags(image_cache_max_size=1, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            oldest, newer = self._make_cache_files(
+                tmpdir, [2 * units.Mi, 2 * units.Mi])
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.removable_base_files = [oldest, newer]
+
+            # The oldest file becomes the backing file of a new disk after
+            # the images in use were listed.
+            used = image_cache_manager.pass_started + 1
+            os.utime(oldest, (used, used))
+            image_cache_manager._evict_base_files(tmpdir, 4 * units.Mi)
+
+            self.assertTrue(os.path.exists(oldest))
+            self.assertFalse(os.path.exists(newer))
+
+    def test_evict_base_files_no_limit(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            base_file, = self._make_cache_files(tmpdir, [units.Mi])
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.removable_base_files = [base_file]
+
+            image_cache_manager._evict_base_files(tmpdir, units.Ti)
+
+            self.assertTrue(os.path.exists(base_file))
+
+    def test_stats(self):
+        stats = imagecache.ImageCacheStats()
+        self.assertEqual(0.0, stats.hit_rate)
+        stats.hit()
+        stats.hit()
+        stats.hit()
+        stats.miss()
+        stats.downloaded(100)
+        stats.evicted(50)
+        self.assertEqual(0.75, stats.hit_rate)
+        self.assertEqual('3 hits, 1 misses (75.0% hit rate), 100 bytes '
+                         'downloaded, 1 evictions (50 bytes), 0 bytes used',
+                         repr(stats))
+
     @contextlib.contextmanager
     def _make_base_file(self, lock=True, info=False):
         """Make a base file for testing."""
@@ -48,6 +48,12 @@ class LibvirtUtilsTestCase(test.NoDBTestCase):
         libvirt_utils.copy_image('src', 'dest')
         mock_execute.assert_called_once_with('cp', '-r', 'src', 'dest')
 
+    @mock.patch('nova.utils.execute')
+    def test_copy_image_local_reflink(self, mock_execute):
+        libvirt_utils.copy_image('src', 'dest', reflink=True)
+        mock_execute.assert_called_once_with('cp', '-r', '--reflink=auto',
+                                             'src', 'dest')
+
     @mock.patch('nova.virt.libvirt.volume.remotefs.SshDriver.copy_file')
     def test_copy_image_remote_ssh(self, mock_rem_fs_remove):
         self.flags(remote_filesystem_transport='ssh', group='libvirt')
@@ -128,6 +128,7 @@ class ComputeDriver(object):
         "supports_migrate_to_same_host": False,
         "supports_attach_interface": False,
         "supports_device_tagging": False,
+        "emits_lifecycle_events": False,
     }
 
     def __init__(self, virtapi):
@@ -157,6 +158,16 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self, instance_uuids):
+        """Get the current power state of several instances at once.
+
+        :param instance_uuids: The UUIDs of the instances.
+        :returns: A dict of power states, keyed by instance UUID. The power
+                  state of the instances unknown to the hypervisor is
+                  power_state.NOSTATE.
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
@@ -1318,6 +1329,20 @@ class ComputeDriver(object):
         """
         pass
 
+    def cache_image(self, context, image_id):
+        """Download an image into the driver's local image cache.
+
+        Spawning an instance from an image which is in the cache does not
+        download the image again. An image which is already in the cache is
+        kept in it as if it had just been downloaded.
+
+        :param context: security context
+        :param image_id: The ID of the image to download.
+        :returns: True if the image was downloaded, False if it was already
+                  in the cache.
+        """
+        raise NotImplementedError()
+
     def add_to_aggregate(self, context, aggregate, host, **kwargs):
         """Add a compute host to an aggregate.
 
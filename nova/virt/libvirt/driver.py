@@ -315,6 +315,7 @@ class LibvirtDriver(driver.ComputeDriver):
         "supports_migrate_to_same_host": False,
         "supports_attach_interface": True,
         "supports_device_tagging": True,
+        "emits_lifecycle_events": True,
     }
 
     def __init__(self, virtapi, read_only=False):
@@ -389,6 +390,10 @@ class LibvirtDriver(driver.ComputeDriver):
         self._live_migration_flags = self._block_migration_flags = 0
         self.active_migrations = {}
 
+        # The virtual sizes and backing files of the qcow2 disks of the
+        # guests by path, see _get_qcow2_disk_info().
+        self._qcow2_disk_info = {}
+
         # Compute reserved hugepages from conf file at the very
         # beginning to ensure any syntax error will be reported and
         # avoid any re-calculation when computing resources.
@@ -1508,6 +1513,7 @@ class LibvirtDriver(driver.ComputeDriver):
             raise exception.InstanceNotRunning(instance_id=instance.uuid)
 
         snapshot = self._image_api.get(context, image_id)
+        self._invalidate_qcow2_disk_info(instance)
 
         # source_format is an on-disk format
         # source_type is a backend type
@@ -1619,33 +1625,45 @@ class LibvirtDriver(driver.ComputeDriver):
                 self._prepare_domain_for_snapshot(context, live_snapshot,
                                                   state, instance)
 
-            snapshot_directory = CONF.libvirt.snapshots_directory
-            fileutils.ensure_tree(snapshot_directory)
-            with utils.tempdir(dir=snapshot_directory) as tmpdir:
-                try:
-                    out_path = os.path.join(tmpdir, snapshot_name)
-                    if live_snapshot:
-                        # NOTE(xqueralt): libvirt needs o+x in the tempdir
-                        os.chmod(tmpdir, 0o701)
-                        self._live_snapshot(context, instance, guest,
-                                            disk_path, out_path, source_format,
-                                            image_format, instance.image_meta)
-                    else:
-                        root_disk.snapshot_extract(out_path, image_format)
-                finally:
-                    self._snapshot_domain(context, live_snapshot, virt_dom,
-                                          state, instance)
-                    LOG.info(_LI("Snapshot extracted, beginning image upload"),
-                             instance=instance)
-
-                # Upload that image to the image service
+            # The disk of a stopped instance does not change while the
+            # snapshot is uploaded, so it is uploaded as is when it needs no
+            # conversion, rather than first extracted to a file.
+            source_path = None
+            if state == power_state.SHUTDOWN:
+                source_path = root_disk.snapshot_source(image_format)
+            if source_path:
+                LOG.info(_LI("Uploading snapshot from the instance disk"),
+                         instance=instance)
                 update_task_state(task_state=task_states.IMAGE_UPLOADING,
                         expected_state=task_states.IMAGE_PENDING_UPLOAD)
-                with libvirt_utils.file_open(out_path, 'rb') as image_file:
-                    self._image_api.update(context,
-                                           image_id,
-                                           metadata,
-                                           image_file)
+                self._upload_snapshot(context, image_id, metadata,
+                                      source_path)
+            else:
+                snapshot_directory = CONF.libvirt.snapshots_directory
+                fileutils.ensure_tree(snapshot_directory)
+                with utils.tempdir(dir=snapshot_directory) as tmpdir:
+                    try:
+                        out_path = os.path.join(tmpdir, snapshot_name)
+                        if live_snapshot:
+                            # NOTE(xqueralt): libvirt needs o+x in the tempdir
+                            os.chmod(tmpdir, 0o701)
+                            self._live_snapshot(context, instance, guest,
+                                                disk_path, out_path,
+                                                source_format, image_format,
+                                                instance.image_meta)
+                        else:
+                            root_disk.snapshot_extract(out_path, image_format)
+                    finally:
+                        self._snapshot_domain(context, live_snapshot,
+                                              virt_dom, state, instance)
+                        LOG.info(_LI("Snapshot extracted, beginning image "
+                                     "upload"), instance=instance)
+
+                    # Upload that image to the image service
+                    update_task_state(task_state=task_states.IMAGE_UPLOADING,
+                            expected_state=task_states.IMAGE_PENDING_UPLOAD)
+                    self._upload_snapshot(context, image_id, metadata,
+                                          out_path)
         except Exception:
             with excutils.save_and_reraise_exception():
                 LOG.exception(_LE("Failed to snapshot image"))
@@ -1658,6 +1676,13 @@ class LibvirtDriver(driver.ComputeDriver):
 
         LOG.info(_LI("Snapshot image upload complete"), instance=instance)
 
+    def _upload_snapshot(self, context, image_id, metadata, path):
+        with libvirt_utils.file_open(path, 'rb') as image_file:
+            self._image_api.update(context,
+                                   image_id,
+                                   metadata,
+                                   image_file)
+
     def _prepare_domain_for_snapshot(self, context, live_snapshot, state,
                                      instance):
         # NOTE(dkang): managedSave does not work for LXC
@@ -2686,9 +2711,12 @@ class LibvirtDriver(driver.ComputeDriver):
         gen_confdrive = functools.partial(self._create_configdrive,
                                           context, instance,
                                           injection_info)
-        self._create_image(context, instance, disk_info['mapping'],
-                           injection_info=injection_info,
-                           block_device_info=block_device_info)
+        with compute_utils.timeline_event(context, 'libvirt_create_image',
+                                          instance):
+            self._create_image(context, instance, disk_info['mapping'],
+                               injection_info=injection_info,
+                               block_device_info=block_device_info)
+        self.image_cache_manager.record_instance(instance)
 
         # Required by Quobyte CI
         self._ensure_console_log_for_instance(instance)
@@ -2696,11 +2724,13 @@ class LibvirtDriver(driver.ComputeDriver):
         xml = self._get_guest_xml(context, instance, network_info,
                                   disk_info, image_meta,
                                   block_device_info=block_device_info)
-        self._create_domain_and_network(
-            context, xml, instance, network_info,
-            block_device_info=block_device_info,
-            post_xml_callback=gen_confdrive,
-            destroy_disks_on_failure=True)
+        with compute_utils.timeline_event(context, 'libvirt_create_domain',
+                                          instance):
+            self._create_domain_and_network(
+                context, xml, instance, network_info,
+                block_device_info=block_device_info,
+                post_xml_callback=gen_confdrive,
+                destroy_disks_on_failure=True)
         LOG.debug("Instance is running", instance=instance)
 
         def _wait_for_boot():
@@ -2712,8 +2742,10 @@ class LibvirtDriver(driver.ComputeDriver):
                          instance=instance)
                 raise loopingcall.LoopingCallDone()
 
-        timer = loopingcall.FixedIntervalLoopingCall(_wait_for_boot)
-        timer.start(interval=0.5).wait()
+        with compute_utils.timeline_event(context, 'libvirt_wait_for_boot',
+                                          instance):
+            timer = loopingcall.FixedIntervalLoopingCall(_wait_for_boot)
+            timer.start(interval=0.5).wait()
 
     def _flush_libvirt_console(self, pty):
         out, err = utils.execute('dd',
@@ -4896,6 +4928,28 @@ class LibvirtDriver(driver.ComputeDriver):
         # workaround, see libvirt/compat.py
         return guest.get_info(self._host)
 
+    def get_power_states(self, instance_uuids):
+        states = dict.fromkeys(instance_uuids, power_state.NOSTATE)
+        # The stopped instances are listed too, as the fallback does, so
+        # that they are reported as shut down rather than as missing.
+        all_stats = self._host.get_all_domain_stats(
+            only_running=False, stats=libvirt.VIR_DOMAIN_STATS_STATE)
+        if all_stats is not None:
+            for instance_uuid, stats in all_stats.items():
+                if instance_uuid in states:
+                    states[instance_uuid] = stats.power_state
+            return states
+
+        for guest in self._host.list_guests(only_running=False):
+            if guest.uuid not in states:
+                continue
+            try:
+                states[guest.uuid] = guest.get_power_state(self._host)
+            except exception.InstanceNotFound:
+                # The domain was undefined since it was listed.
+                pass
+        return states
+
     def _create_domain_setup_lxc(self, instance, image_meta,
                                  block_device_info):
         inst_path = libvirt_utils.get_instance_path(instance)
@@ -4990,7 +5044,7 @@ class LibvirtDriver(driver.ComputeDriver):
             if post_xml_callback is not None:
                 post_xml_callback()
         else:
-            guest = libvirt_guest.Guest(domain)
+            guest = self._host.get_guest_for_domain(domain)
 
         if power_on or pause:
             guest.launch(pause=pause)
@@ -5207,6 +5261,14 @@ class LibvirtDriver(driver.ComputeDriver):
         #
         # Thus when getting an exception we always report 1 as the
         # vCPU count, as the least worst value.
+        all_stats = self._host.get_all_domain_stats(
+            stats=libvirt.VIR_DOMAIN_STATS_VCPU)
+        if all_stats is not None:
+            # The bulk statistics leave out the vcpu entries when the
+            # hypervisor cannot report them, in which case the guest
+            # counts as 1 vCPU as explained above.
+            return sum(stats.vcpus or 1 for stats in all_stats.values())
+
         for guest in self._host.list_guests():
             try:
                 vcpus = guest.get_vcpus_info()
@@ -5477,9 +5539,17 @@ class LibvirtDriver(driver.ComputeDriver):
            a given host.
         """
         vol_usage = []
+        # Collect the block statistics of all the guests with a single
+        # libvirt call rather than with one call per volume, falling back
+        # to block_stats() when that is not possible.
+        all_stats = self._host.get_all_domain_stats(
+            stats=libvirt.VIR_DOMAIN_STATS_BLOCK) or {}
 
         for instance_bdms in compute_host_bdms:
             instance = instance_bdms['instance']
+            domain_stats = all_stats.get(instance.uuid)
+            block_stats = (domain_stats.get_block_stats()
+                           if domain_stats else {})
 
             for bdm in instance_bdms['instance_bdms']:
                 mountpoint = bdm['device_name']
@@ -5489,7 +5559,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
                 LOG.debug("Trying to get stats for the volume %s",
                           volume_id, instance=instance)
-                vol_stats = self.block_stats(instance, mountpoint)
+                vol_stats = block_stats.get(mountpoint)
+                if vol_stats is None:
+                    vol_stats = self.block_stats(instance, mountpoint)
 
                 if vol_stats:
                     stats = dict(volume=volume_id,
@@ -6907,6 +6979,7 @@ class LibvirtDriver(driver.ComputeDriver):
         :param network_info: instance network information
         :param block_migration: if true, post operation of block_migration.
         """
+        self._invalidate_qcow2_disk_info(instance)
         guest = self._host.get_guest(instance)
 
         # TODO(sahid): In Ocata we have added the migration flag
@@ -6922,12 +6995,14 @@ class LibvirtDriver(driver.ComputeDriver):
         self._host.write_instance_config(xml)
 
     def _get_instance_disk_info_from_xml(self, instance_name, xml,
-                                         block_device_info):
+                                         block_device_info, use_cache=False):
         """Get the non-volume disk information from the domain xml
 
         :param str instance_name: the name of the instance (domain)
         :param str xml: the libvirt domain xml for the instance
         :param dict block_device_info: block device info for BDMs
+        :param bool use_cache: whether to use the cached virtual sizes and
+                               backing files of the qcow2 disks
         :returns disk_info: list of dicts with keys:
 
           * 'type': the disk type (str)
@@ -7006,7 +7081,10 @@ class LibvirtDriver(driver.ComputeDriver):
 
             disk_type = driver_nodes[cnt].get('type')
 
-            if disk_type in ("qcow2", "ploop"):
+            if disk_type == "qcow2" and use_cache:
+                virt_size, backing_file = self._get_qcow2_disk_info(path)
+                over_commit_size = int(virt_size) - dk_size
+            elif disk_type in ("qcow2", "ploop"):
                 backing_file = libvirt_utils.get_disk_backing_file(path)
                 virt_size = disk_api.get_disk_size(path)
                 over_commit_size = int(virt_size) - dk_size
@@ -7023,6 +7101,29 @@ class LibvirtDriver(driver.ComputeDriver):
                               'over_committed_disk_size': over_commit_size})
         return disk_info
 
+    def _get_qcow2_disk_info(self, path):
+        """Return the virtual size and backing file of a qcow2 disk.
+
+        They are cached by the path, modification time and size of the disk,
+        so that qemu-img is only run for the disks which changed since they
+        were last inspected.
+        """
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        cached = self._qcow2_disk_info.get(path)
+        if cached is None or cached[0] != key:
+            cached = (key, disk_api.get_disk_size(path),
+                      libvirt_utils.get_disk_backing_file(path))
+            self._qcow2_disk_info[path] = cached
+        return cached[1], cached[2]
+
+    def _invalidate_qcow2_disk_info(self, instance):
+        """Forget the cached information of the disks of an instance."""
+        inst_path = libvirt_utils.get_instance_path(instance) + os.sep
+        for path in list(self._qcow2_disk_info):
+            if path.startswith(inst_path):
+                self._qcow2_disk_info.pop(path, None)
+
     def _get_instance_disk_info(self, instance, block_device_info):
         try:
             guest = self._host.get_guest(instance)
@@ -7052,6 +7153,7 @@ class LibvirtDriver(driver.ComputeDriver):
         disk_over_committed_size = 0
         instance_domains = self._host.list_instance_domains()
         if not instance_domains:
+            self._qcow2_disk_info.clear()
             return disk_over_committed_size
 
         # Get all instance uuids
@@ -7076,9 +7178,10 @@ class LibvirtDriver(driver.ComputeDriver):
         bdms = objects.BlockDeviceMappingList.bdms_by_instance_uuid(
             ctx, instance_uuids)
 
+        disk_paths = set()
         for dom in instance_domains:
             try:
-                guest = libvirt_guest.Guest(dom)
+                guest = self._host.get_guest_for_domain(dom)
                 xml = guest.get_xml_desc()
 
                 block_device_info = None
@@ -7089,11 +7192,12 @@ class LibvirtDriver(driver.ComputeDriver):
                         local_instances[guest.uuid], bdms[guest.uuid])
 
                 disk_infos = self._get_instance_disk_info_from_xml(
-                    guest.name, xml, block_device_info)
+                    guest.name, xml, block_device_info, use_cache=True)
                 if not disk_infos:
                     continue
 
                 for info in disk_infos:
+                    disk_paths.add(info['path'])
                     disk_over_committed_size += int(
                         info['over_committed_disk_size'])
             except libvirt.libvirtError as ex:
@@ -7130,6 +7234,10 @@ class LibvirtDriver(driver.ComputeDriver):
                           'error': e})
             # NOTE(gtt116): give other tasks a chance.
             greenthread.sleep(0)
+
+        # Forget the disks which are gone since the previous audit.
+        for path in set(self._qcow2_disk_info) - disk_paths:
+            self._qcow2_disk_info.pop(path, None)
         return disk_over_committed_size
 
     def unfilter_instance(self, instance, network_info):
@@ -7153,6 +7261,36 @@ class LibvirtDriver(driver.ComputeDriver):
         """Manage the local cache of images."""
         self.image_cache_manager.update(context, all_instances)
 
+    def cache_image(self, context, image_id):
+        """Download an image into the image cache of the host."""
+        if self.image_backend.backend().SUPPORTS_CLONE:
+            # The disks are cloned from the image service when possible,
+            # without going through the image cache.
+            raise NotImplementedError()
+
+        filename = imagecache.get_cache_fname(image_id)
+        base_dir = os.path.join(CONF.instances_path,
+                                CONF.image_cache_subdirectory_name)
+        base = os.path.join(base_dir, filename)
+        fileutils.ensure_tree(base_dir)
+
+        # Same lock as the image backends hold while fetching into the cache.
+        @utils.synchronized(filename, external=True,
+                            lock_path=os.path.join(CONF.instances_path,
+                                                   'locks'))
+        def fetch_image():
+            if os.path.exists(base):
+                # Restart the aging of the image by the image cache manager,
+                # which would otherwise remove an image cached long ago
+                # before the instances it is cached for use it.
+                libvirt_utils.update_mtime(base)
+                return False
+            libvirt_utils.fetch_image(context, base, image_id)
+            imagecache.STATS.downloaded(os.path.getsize(base))
+            return True
+
+        return fetch_image()
+
     def _cleanup_remote_migration(self, dest, inst_base, inst_base_resize,
                                   shared_storage=False):
         """Used only for cleanup in case migrate_disk_and_power_off fails."""
@@ -7196,6 +7334,7 @@ class LibvirtDriver(driver.ComputeDriver):
                                    timeout=0, retry_interval=0):
         LOG.debug("Starting migrate_disk_and_power_off",
                    instance=instance)
+        self._invalidate_qcow2_disk_info(instance)
 
         ephemerals = driver.block_device_info_get_ephemerals(block_device_info)
 
@@ -7330,6 +7469,7 @@ class LibvirtDriver(driver.ComputeDriver):
                          network_info, image_meta, resize_instance,
                          block_device_info=None, power_on=True):
         LOG.debug("Starting finish_migration", instance=instance)
+        self._invalidate_qcow2_disk_info(instance)
 
         block_disk_info = blockinfo.get_disk_info(CONF.libvirt.virt_type,
                                                   instance,
@@ -7436,6 +7576,7 @@ class LibvirtDriver(driver.ComputeDriver):
                                 block_device_info=None, power_on=True):
         LOG.debug("Starting finish_revert_migration",
                   instance=instance)
+        self._invalidate_qcow2_disk_info(instance)
 
         inst_base = libvirt_utils.get_instance_path(instance)
         inst_base_resize = inst_base + "_resize"
@@ -7797,6 +7938,7 @@ class LibvirtDriver(driver.ComputeDriver):
                      instance=instance)
             return False
 
+        self.image_cache_manager.forget_instance(instance)
         LOG.info(_LI('Deletion of %s complete'), target_del, instance=instance)
         return True
 
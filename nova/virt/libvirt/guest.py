@@ -27,6 +27,7 @@ higher level APIs around the raw libvirt API. These APIs are
 then used by all the other libvirt related classes
 """
 
+import copy
 import time
 
 from lxml import etree
@@ -79,15 +80,80 @@ LIBVIRT_POWER_STATE = {
 }
 
 
+class GuestConfigCache(object):
+    """Caches the live XML description of guests and its parsed config.
+
+    The entries are keyed by the uuid of the domains. They must be
+    invalidated whenever the live definition of a domain may have changed,
+    which host.Host does when libvirt emits an event for the domain, and
+    Guest does when it modifies the domain itself.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        # Invalidations come from the native libvirt event thread, and may
+        # race with a green thread fetching the XML of the same domain. The
+        # generation is bumped on every invalidation so that an XML fetched
+        # while the domain was changing is not stored.
+        self._generation = 0
+
+    def _get_entry(self, domain):
+        uuid = domain.UUIDString()
+        entry = self._entries.get(uuid)
+        if entry is None:
+            generation = self._generation
+            entry = {'xml': domain.XMLDesc(0), 'config': None}
+            if generation == self._generation:
+                self._entries[uuid] = entry
+        return entry
+
+    def get_xml(self, domain):
+        """Returns the live XML description of a domain."""
+        return self._get_entry(domain)['xml']
+
+    def get_config(self, domain):
+        """Returns the LibvirtConfigGuest parsed from the live XML
+        description of a domain.
+
+        The returned object is shared by the callers and must not be
+        modified.
+        """
+        entry = self._get_entry(domain)
+        if entry['config'] is None:
+            config = vconfig.LibvirtConfigGuest()
+            config.parse_str(entry['xml'])
+            entry['config'] = config
+        return entry['config']
+
+    def invalidate(self, uuid=None):
+        """Forgets the cached XML of a domain, or of all of them.
+
+        :param uuid: The uuid of the domain, or None for all the domains
+        """
+        self._generation += 1
+        if uuid is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(uuid, None)
+
+
 class Guest(object):
 
-    def __init__(self, domain):
+    def __init__(self, domain, config_cache=None):
+        """Wraps a libvirt domain.
+
+        :param domain: The libvirt virDomain
+        :param config_cache: The GuestConfigCache used to look up the live
+                             XML of the domain, or None to fetch it from
+                             libvirt on every lookup
+        """
 
         global libvirt
         if libvirt is None:
             libvirt = importutils.import_module('libvirt')
 
         self._domain = domain
+        self._config_cache = config_cache
 
     def __repr__(self):
         return "<Guest %(id)d %(name)s %(uuid)s>" % {
@@ -110,7 +176,24 @@ class Guest(object):
 
     @property
     def _encoded_xml(self):
-        return encodeutils.safe_decode(self._domain.XMLDesc(0))
+        return encodeutils.safe_decode(self._get_live_xml())
+
+    def _get_live_xml(self):
+        if self._config_cache is None:
+            return self._domain.XMLDesc(0)
+        return self._config_cache.get_xml(self._domain)
+
+    def _get_live_config(self):
+        if self._config_cache is None:
+            config = vconfig.LibvirtConfigGuest()
+            config.parse_str(self._domain.XMLDesc(0))
+            return config
+        return self._config_cache.get_config(self._domain)
+
+    def _invalidate_config(self):
+        """Forgets the cached XML of the guest after it was modified."""
+        if self._config_cache is not None:
+            self._config_cache.invalidate(self.uuid)
 
     @classmethod
     def create(cls, xml, host):
@@ -138,16 +221,19 @@ class Guest(object):
         """
         flags = pause and libvirt.VIR_DOMAIN_START_PAUSED or 0
         try:
-            return self._domain.createWithFlags(flags)
+            ret = self._domain.createWithFlags(flags)
         except Exception:
             with excutils.save_and_reraise_exception():
                 LOG.error(_LE('Error launching a defined domain '
                               'with XML: %s'),
                           self._encoded_xml, errors='ignore')
+        self._invalidate_config()
+        return ret
 
     def poweroff(self):
         """Stops a running guest."""
         self._domain.destroy()
+        self._invalidate_config()
 
     def sync_guest_time(self):
         """Try to set VM time to the current value.  This is typically useful
@@ -196,6 +282,7 @@ class Guest(object):
     def resume(self):
         """Resumes a paused guest."""
         self._domain.resume()
+        self._invalidate_config()
 
     def enable_hairpin(self):
         """Enables hairpin mode for this guest."""
@@ -285,6 +372,7 @@ class Guest(object):
             except AttributeError:
                 pass
             self._domain.undefine()
+        self._invalidate_config()
 
     def has_persistent_configuration(self):
         """Whether domain config is persistently stored on the host."""
@@ -308,14 +396,17 @@ class Guest(object):
 
         LOG.debug("attach device xml: %s", device_xml)
         self._domain.attachDeviceFlags(device_xml, flags=flags)
+        self._invalidate_config()
 
     def get_config(self):
         """Returns the config instance for a guest
 
         :returns: LibvirtConfigGuest instance
         """
-        config = vconfig.LibvirtConfigGuest()
-        config.parse_str(self._domain.XMLDesc(0))
+        config = self._get_live_config()
+        if self._config_cache is not None:
+            # The cached config is shared, the caller gets its own copy.
+            config = copy.deepcopy(config)
         return config
 
     def get_disk(self, device):
@@ -324,7 +415,7 @@ class Guest(object):
         :returns LivirtConfigGuestDisk: mounted at device or None
         """
         try:
-            doc = etree.fromstring(self._domain.XMLDesc(0))
+            doc = etree.fromstring(self._get_live_xml())
         except Exception:
             return None
 
@@ -354,13 +445,12 @@ class Guest(object):
 
         :param devtype: a LibvirtConfigGuestDevice subclass class
 
-        :returns: a list of LibvirtConfigGuestDevice instances
+        :returns: a list of LibvirtConfigGuestDevice instances, which must
+                  not be modified
         """
 
         try:
-            config = vconfig.LibvirtConfigGuest()
-            config.parse_str(
-                self._domain.XMLDesc(0))
+            config = self._get_live_config()
         except Exception:
             return []
 
@@ -462,6 +552,7 @@ class Guest(object):
 
         LOG.debug("detach device xml: %s", device_xml)
         self._domain.detachDeviceFlags(device_xml, flags=flags)
+        self._invalidate_config()
 
     def get_xml_desc(self, dump_inactive=False, dump_sensitive=False,
                      dump_migratable=False):
@@ -476,6 +567,8 @@ class Guest(object):
         flags = dump_inactive and libvirt.VIR_DOMAIN_XML_INACTIVE or 0
         flags |= dump_sensitive and libvirt.VIR_DOMAIN_XML_SECURE or 0
         flags |= dump_migratable and libvirt.VIR_DOMAIN_XML_MIGRATABLE or 0
+        if flags == 0 and self._config_cache is not None:
+            return self._config_cache.get_xml(self._domain)
         return self._domain.XMLDesc(flags=flags)
 
     def save_memory_state(self):
@@ -484,6 +577,7 @@ class Guest(object):
         raises: raises libvirtError on error
         """
         self._domain.managedSave(0)
+        self._invalidate_config()
 
     def get_block_device(self, disk):
         """Returns a block device wrapper for disk."""
@@ -573,10 +667,12 @@ class Guest(object):
             device_xml = device_xml.decode('utf-8')
 
         self._domain.snapshotCreateXML(device_xml, flags=flags)
+        self._invalidate_config()
 
     def shutdown(self):
         """Shutdown guest"""
         self._domain.shutdown()
+        self._invalidate_config()
 
     def pause(self):
         """Suspends an active guest
@@ -588,6 +684,7 @@ class Guest(object):
         See method "resume()" to reactive guest.
         """
         self._domain.suspend()
+        self._invalidate_config()
 
     def migrate(self, destination, migrate_uri=None, params=None, flags=0,
                 domain_xml=None, bandwidth=0):
@@ -717,6 +814,7 @@ class BlockDevice(object):
         flags = async and libvirt.VIR_DOMAIN_BLOCK_JOB_ABORT_ASYNC or 0
         flags |= pivot and libvirt.VIR_DOMAIN_BLOCK_JOB_ABORT_PIVOT or 0
         self._guest._domain.blockJobAbort(self._disk, flags=flags)
+        self._guest._invalidate_config()
 
     def get_job_info(self):
         """Returns information about job currently running
@@ -759,8 +857,10 @@ class BlockDevice(object):
         flags |= reuse_ext and libvirt.VIR_DOMAIN_BLOCK_REBASE_REUSE_EXT or 0
         flags |= copy and libvirt.VIR_DOMAIN_BLOCK_REBASE_COPY or 0
         flags |= relative and libvirt.VIR_DOMAIN_BLOCK_REBASE_RELATIVE or 0
-        return self._guest._domain.blockRebase(
+        ret = self._guest._domain.blockRebase(
             self._disk, base, self.REBASE_DEFAULT_BANDWIDTH, flags=flags)
+        self._guest._invalidate_config()
+        return ret
 
     def commit(self, base, top, relative=False):
         """Merge data from overlays into backing file
@@ -771,12 +871,15 @@ class BlockDevice(object):
         :param relative: Keep backing chain referenced using relative names
         """
         flags = relative and libvirt.VIR_DOMAIN_BLOCK_COMMIT_RELATIVE or 0
-        return self._guest._domain.blockCommit(
+        ret = self._guest._domain.blockCommit(
             self._disk, base, top, self.COMMIT_DEFAULT_BANDWIDTH, flags=flags)
+        self._guest._invalidate_config()
+        return ret
 
     def resize(self, size_kb):
         """Resize block device to KiB size"""
         self._guest._domain.blockResize(self._disk, size_kb)
+        self._guest._invalidate_config()
 
     def is_job_complete(self):
         """Return True if the job is complete, False otherwise
@@ -802,6 +905,7 @@ class BlockDevice(object):
         # If the job no longer exists, it is because it has completed
         # NOTE(mdbooth): See comment above: it may not have succeeded.
         if status is None:
+            self._guest._invalidate_config()
             return True
 
         # NOTE(slaweq): because of bug in libvirt, which is described in
@@ -815,6 +919,9 @@ class BlockDevice(object):
         # NOTE(lyarwood): Use the mirror element to determine if we can pivot
         # to the new disk once blockjobinfo reports progress as complete.
         if status.end != 0 and status.cur == status.end:
+            # The readiness of the mirror is polled, so do not trust an XML
+            # cached before the job progressed.
+            self._guest._invalidate_config()
             disk = self._guest.get_disk(self._disk)
             if disk and disk.mirror:
                 return disk.mirror.ready == 'yes'
@@ -838,6 +945,67 @@ class VCPUInfo(object):
         self.time = time
 
 
+class DomainStats(object):
+    def __init__(self, guest, stats):
+        """Statistics of a guest collected by Host.get_all_domain_stats().
+
+        :param guest: The Guest the statistics are about
+        :param stats: The dict of the statistics of the guest returned by
+                      virConnectGetAllDomainStats
+        """
+        self.guest = guest
+        self._stats = stats
+
+    @property
+    def power_state(self):
+        """The power state of the guest."""
+        return LIBVIRT_POWER_STATE.get(self._stats.get('state.state'),
+                                       power_state.NOSTATE)
+
+    @property
+    def vcpus(self):
+        """The number of online vcpus of the guest, or None if unknown."""
+        return self._stats.get('vcpu.current')
+
+    @property
+    def memory_kb(self):
+        """The current balloon size of the guest in KiB, or None."""
+        return self._stats.get('balloon.current')
+
+    def get_block_stats(self):
+        """Returns the I/O statistics of the disks of the guest.
+
+        :returns: A dict of (rd_req, rd_bytes, wr_req, wr_bytes, errs)
+                  tuples by target device, ordered as virDomainBlockStats
+                  returns them.
+        """
+        block_stats = {}
+        for i in range(self._stats.get('block.count', 0)):
+            prefix = 'block.%d.' % i
+            block_stats[self._stats.get(prefix + 'name')] = tuple(
+                self._stats.get(prefix + key, default) for key, default in
+                (('rd.reqs', 0), ('rd.bytes', 0), ('wr.reqs', 0),
+                 ('wr.bytes', 0), ('errors', -1)))
+        return block_stats
+
+    def get_interface_stats(self):
+        """Returns the traffic statistics of the interfaces of the guest.
+
+        :returns: A dict of (rx_bytes, rx_packets, rx_errs, rx_drop,
+                  tx_bytes, tx_packets, tx_errs, tx_drop) tuples by
+                  interface name, ordered as virDomainInterfaceStats
+                  returns them.
+        """
+        interface_stats = {}
+        for i in range(self._stats.get('net.count', 0)):
+            prefix = 'net.%d.' % i
+            interface_stats[self._stats.get(prefix + 'name')] = tuple(
+                self._stats.get(prefix + key, 0) for key in
+                ('rx.bytes', 'rx.pkts', 'rx.errs', 'rx.drop',
+                 'tx.bytes', 'tx.pkts', 'tx.errs', 'tx.drop'))
+        return interface_stats
+
+
 class BlockDeviceJobInfo(object):
     def __init__(self, job, bandwidth, cur, end):
         """Structure for information about running job.
@@ -68,6 +68,20 @@ native_Queue = patcher.original("Queue" if six.PY2 else "queue")
 CONF = nova.conf.CONF
 
 
+# The domain events, besides the lifecycle ones, which libvirt emits when the
+# live XML description of a guest changes. The ones which the python bindings
+# do not know about are skipped.
+GUEST_CONFIG_EVENT_IDS = (
+    'VIR_DOMAIN_EVENT_ID_DEVICE_ADDED',
+    'VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED',
+    'VIR_DOMAIN_EVENT_ID_BLOCK_JOB',
+    'VIR_DOMAIN_EVENT_ID_BLOCK_JOB_2',
+    'VIR_DOMAIN_EVENT_ID_DISK_CHANGE',
+    'VIR_DOMAIN_EVENT_ID_TRAY_CHANGE',
+    'VIR_DOMAIN_EVENT_ID_BALLOON_CHANGE',
+    'VIR_DOMAIN_EVENT_ID_TUNABLE',
+)
+
 # This list is for libvirt hypervisor drivers that need special handling.
 # This is *not* the complete list of supported hypervisor drivers.
 HV_DRIVER_QEMU = "QEMU"
@@ -104,6 +118,10 @@ class Host(object):
         #                STOPPED lifecycle event some seconds.
         self._lifecycle_delay = 15
 
+        # The cache of the live XML of the guests, which is only used while
+        # the connection delivers the events invalidating it.
+        self._guest_config_cache = None
+
         self._initialized = False
 
     def _native_thread(self):
@@ -166,6 +184,7 @@ class Host(object):
         self = opaque
 
         uuid = dom.UUIDString()
+        self._invalidate_guest_config(uuid)
         transition = None
         if event == libvirt.VIR_DOMAIN_EVENT_STOPPED:
             transition = virtevent.EVENT_LIFECYCLE_STOPPED
@@ -179,6 +198,25 @@ class Host(object):
         if transition is not None:
             self._queue_event(virtevent.LifecycleEvent(uuid, transition))
 
+    @staticmethod
+    def _event_guest_config_callback(conn, dom, *args):
+        """Receives the events which change the live XML of a guest.
+
+        NB: this method is executing in a native thread, not
+        an eventlet coroutine. It can only invoke other libvirt
+        APIs, or use self._queue_event(). Any use of logging APIs
+        in particular is forbidden.
+        """
+
+        # The arguments depend on the event, the opaque is always last.
+        self = args[-1]
+        self._invalidate_guest_config(dom.UUIDString())
+
+    def _invalidate_guest_config(self, uuid=None):
+        cache = self._guest_config_cache
+        if cache is not None:
+            cache.invalidate(uuid)
+
     def _close_callback(self, conn, reason, opaque):
         close_info = {'conn': conn, 'reason': reason}
         self._queue_event(close_info)
@@ -284,6 +322,8 @@ class Host(object):
                 reason = str(last_close_event['reason'])
                 msg = _("Connection to libvirt lost: %s") % reason
                 self._wrapped_conn = None
+                self._invalidate_guest_config()
+                self._guest_config_cache = None
                 self._queue_conn_event_handler(False, msg)
 
     def _event_emit_delayed(self, event):
@@ -370,6 +410,9 @@ class Host(object):
         # This will raise an exception on failure
         wrapped_conn = self._connect(self._uri, self._read_only)
 
+        # Whatever was cached may have changed while disconnected.
+        self._invalidate_guest_config()
+        self._guest_config_cache = None
         try:
             LOG.debug("Registering for lifecycle events %s", self)
             wrapped_conn.domainEventRegisterAny(
@@ -380,6 +423,8 @@ class Host(object):
         except Exception as e:
             LOG.warning(_LW("URI %(uri)s does not support events: %(error)s"),
                      {'uri': self._uri, 'error': e})
+        else:
+            self._init_guest_config_cache(wrapped_conn)
 
         try:
             LOG.debug("Registering for connection events: %s", str(self))
@@ -400,6 +445,26 @@ class Host(object):
 
         return wrapped_conn
 
+    def _init_guest_config_cache(self, wrapped_conn):
+        """Caches the live XML of the guests if the connection delivers all
+        the events which invalidate it.
+        """
+        try:
+            for event_id in GUEST_CONFIG_EVENT_IDS:
+                if not hasattr(libvirt, event_id):
+                    continue
+                wrapped_conn.domainEventRegisterAny(
+                    None,
+                    getattr(libvirt, event_id),
+                    self._event_guest_config_callback,
+                    self)
+        except Exception as e:
+            LOG.debug("Not caching the XML of the guests, URI %(uri)s does "
+                      "not support domain events: %(error)s",
+                      {'uri': self._uri, 'error': e})
+        else:
+            self._guest_config_cache = libvirt_guest.GuestConfigCache()
+
     def _queue_conn_event_handler(self, *args, **kwargs):
         if self._conn_event_handler is None:
             return
@@ -534,7 +599,18 @@ class Host(object):
         :raises exception.InstanceNotFound: The domain was not found
         :raises exception.InternalError: A libvirt error occurred
         """
-        return libvirt_guest.Guest(self.get_domain(instance))
+        return self.get_guest_for_domain(self.get_domain(instance))
+
+    def get_guest_for_domain(self, domain):
+        """Wrap a libvirt domain of this host into a Guest.
+
+        :param domain: a libvirt.Domain object
+
+        :returns: a nova.virt.libvirt.Guest object sharing the cache of
+                  the live XML of the guests of the host
+        """
+        return libvirt_guest.Guest(domain,
+                                   config_cache=self._guest_config_cache)
 
     # TODO(sahid): needs to be private
     def get_domain(self, instance):
@@ -574,8 +650,9 @@ class Host(object):
 
         :returns: list of Guest objects
         """
-        return [libvirt_guest.Guest(dom) for dom in self.list_instance_domains(
-            only_running=only_running, only_guests=only_guests)]
+        domains = self.list_instance_domains(
+            only_running=only_running, only_guests=only_guests)
+        return [self.get_guest_for_domain(dom) for dom in domains]
 
     def list_instance_domains(self, only_running=True, only_guests=True):
         """Get a list of libvirt.Domain objects for nova instances
@@ -605,6 +682,51 @@ class Host(object):
 
         return doms
 
+    def get_all_domain_stats(self, only_running=True, only_guests=True,
+                             stats=None):
+        """Get the statistics of the guests in a single libvirt call
+
+        :param only_running: True to only return running instances
+        :param only_guests: True to filter out any host domain (eg Dom-0)
+        :param stats: mask of the VIR_DOMAIN_STATS_* groups of statistics
+                      to collect, all of the state, vcpu, balloon, block
+                      and interface statistics by default
+
+        Query libvirt for the statistics of all of the guests at once,
+        rather than with a call per guest and statistic.
+
+        :returns: dict of guest.DomainStats by guest uuid, or None if the
+                  hypervisor cannot collect the statistics in bulk
+        """
+        flags = libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE
+        if not only_running:
+            flags = flags | libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_INACTIVE
+        if stats is None:
+            stats = (libvirt.VIR_DOMAIN_STATS_STATE |
+                     libvirt.VIR_DOMAIN_STATS_VCPU |
+                     libvirt.VIR_DOMAIN_STATS_BALLOON |
+                     libvirt.VIR_DOMAIN_STATS_BLOCK |
+                     libvirt.VIR_DOMAIN_STATS_INTERFACE)
+        try:
+            records = self.get_connection().getAllDomainStats(stats, flags)
+        except AttributeError:
+            # The python bindings predate virConnectGetAllDomainStats.
+            return None
+        except libvirt.libvirtError as ex:
+            if ex.get_error_code() == libvirt.VIR_ERR_NO_SUPPORT:
+                # Only some hypervisor drivers, such as QEMU, implement it.
+                return None
+            raise
+
+        all_stats = {}
+        for dom, dom_stats in records:
+            guest = self.get_guest_for_domain(dom)
+            if only_guests and guest.id == 0:
+                continue
+            all_stats[guest.uuid] = libvirt_guest.DomainStats(guest,
+                                                              dom_stats)
+        return all_stats
+
     def get_online_cpus(self):
         """Get the set of CPUs that are online on the host
 
@@ -838,7 +960,8 @@ class Host(object):
         :returns: an instance of Guest
         """
         domain = self.get_connection().defineXML(xml)
-        return libvirt_guest.Guest(domain)
+        self._invalidate_guest_config(domain.UUIDString())
+        return self.get_guest_for_domain(domain)
 
     def device_lookup_by_name(self, name):
         """Lookup a node device by its name.
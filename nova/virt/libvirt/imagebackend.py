@@ -39,6 +39,7 @@ from nova.virt.disk import api as disk
 from nova.virt.image import model as imgmodel
 from nova.virt import images
 from nova.virt.libvirt import config as vconfig
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt.storage import dmcrypt
 from nova.virt.libvirt.storage import lvm
 from nova.virt.libvirt.storage import rbd_utils
@@ -205,6 +206,7 @@ class Image(object):
         if not os.path.exists(base_dir):
             fileutils.ensure_tree(base_dir)
         base = os.path.join(base_dir, filename)
+        fetched = []
 
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
         def fetch_func_sync(target, *args, **kwargs):
@@ -221,10 +223,15 @@ class Image(object):
             # that case, but it will not result in incorrect behaviour.
             if target != base or not os.path.exists(target):
                 fetch_func(target=target, *args, **kwargs)
+                fetched.append(target)
 
         if not self.exists() or not os.path.exists(base):
             self.create_image(fetch_func_sync, base, size,
                               *args, **kwargs)
+            # Only images of the image service are accounted, not the
+            # ephemeral and swap disk templates.
+            if kwargs.get('image_id') is not None:
+                self._account_cache_lookup(base, fetched)
 
         if size:
             # create_image() only creates the base image if needed, so
@@ -236,6 +243,19 @@ class Image(object):
                     os.access(self.path, os.W_OK)):
                 utils.execute('fallocate', '-n', '-l', size, self.path)
 
+    @staticmethod
+    def _account_cache_lookup(base, fetched):
+        if not fetched:
+            imagecache.STATS.hit()
+            return
+        imagecache.STATS.miss()
+        if fetched[0] == base:
+            try:
+                imagecache.STATS.downloaded(os.path.getsize(base))
+            except OSError:
+                # Removed in the meantime
+                pass
+
     def _can_fallocate(self):
         """Check once per class, whether fallocate(1) is available,
            and that the instances directory supports fallocate(2).
@@ -288,6 +308,14 @@ class Image(object):
     def snapshot_extract(self, target, out_format):
         raise NotImplementedError()
 
+    def snapshot_source(self, out_format):
+        """Return the path of a file holding the snapshot of the image in
+        out_format as is, or None if it has to be extracted.
+
+        The file is only uploaded as is while the image is not in use.
+        """
+        return None
+
     def _get_driver_format(self):
         return self.driver_format
 
@@ -497,7 +525,8 @@ class Flat(Image):
 
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
         def copy_raw_image(base, target, size):
-            libvirt_utils.copy_image(base, target)
+            libvirt_utils.copy_image(base, target,
+                                     reflink=CONF.libvirt.images_reflink)
             if size:
                 image = imgmodel.LocalFileImage(target,
                                                 self.driver_format)
@@ -529,6 +558,12 @@ class Flat(Image):
     def snapshot_extract(self, target, out_format):
         images.convert_image(self.path, target, self.driver_format, out_format)
 
+    def snapshot_source(self, out_format):
+        # Converting a raw file to raw is a plain copy.
+        if self.driver_format == 'raw' and out_format == 'raw':
+            return self.path
+        return None
+
     @staticmethod
     def is_file_in_instance_path():
         return True
@@ -594,7 +629,9 @@ class Qcow2(Image):
         if legacy_backing_size:
             if not os.path.exists(legacy_base):
                 with fileutils.remove_path_on_error(legacy_base):
-                    libvirt_utils.copy_image(base, legacy_base)
+                    libvirt_utils.copy_image(
+                        base, legacy_base,
+                        reflink=CONF.libvirt.images_reflink)
                     image = imgmodel.LocalFileImage(legacy_base,
                                                     imgmodel.FORMAT_QCOW2)
                     disk.extend(image, legacy_backing_size)
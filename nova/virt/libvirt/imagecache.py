@@ -20,6 +20,7 @@ http://wiki.openstack.org/nova-image-cache-management.
 
 """
 
+import errno
 import hashlib
 import os
 import re
@@ -28,7 +29,10 @@ import time
 from oslo_concurrency import lockutils
 from oslo_concurrency import processutils
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import encodeutils
+from oslo_utils import fileutils
+from oslo_utils import units
 import six
 
 import nova.conf
@@ -43,6 +47,52 @@ LOG = logging.getLogger(__name__)
 
 CONF = nova.conf.CONF
 
+# Directory of the image cache holding the usage index files of the hosts.
+USAGE_INDEX_DIR = '.usage'
+
+
+class ImageCacheStats(object):
+    """Use of the image cache of this host since the service started."""
+
+    __slots__ = ('hits', 'misses', 'bytes_downloaded', 'evictions',
+                 'bytes_evicted', 'usage')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+        self.evictions = 0
+        self.bytes_evicted = 0
+        self.usage = 0
+
+    def hit(self):
+        self.hits += 1
+
+    def miss(self):
+        self.misses += 1
+
+    def downloaded(self, size):
+        self.bytes_downloaded += size
+
+    def evicted(self, size):
+        self.evictions += 1
+        self.bytes_evicted += size
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return ('%d hits, %d misses (%.1f%% hit rate), %d bytes downloaded, '
+                '%d evictions (%d bytes), %d bytes used' %
+                (self.hits, self.misses, self.hit_rate * 100,
+                 self.bytes_downloaded, self.evictions, self.bytes_evicted,
+                 self.usage))
+
+
+STATS = ImageCacheStats()
+
 
 def get_cache_fname(image_id):
     """Return a filename based on the SHA1 hash of a given image ID.
@@ -85,15 +135,149 @@ def is_valid_info_file(path):
     return False
 
 
+class ImageCacheUsageIndex(object):
+    """Persistent index of the backing files of the instance disks.
+
+    The index maps the name of an instance directory to the backing file of
+    its disk, along with the inode of the disk when it was recorded. An entry
+    is only trusted while the disk still has the same inode, so disks which
+    were replaced behind the back of the index are probed again.
+
+    Each host writes its own file in the usage directory of the image cache,
+    so hosts sharing the instances directory read the entries of each other
+    without writing to the same file.
+    """
+
+    def __init__(self, base_dir, host):
+        self.directory = os.path.join(base_dir, USAGE_INDEX_DIR)
+        self.path = os.path.join(self.directory, '%s.json' % host)
+        self._entries = None
+
+    @staticmethod
+    def _load_file(path):
+        try:
+            with open(path) as f:
+                entries = jsonutils.loads(f.read())
+        except (IOError, OSError, ValueError) as e:
+            if getattr(e, 'errno', None) != errno.ENOENT:
+                LOG.warning(_LW('Ignoring unreadable image cache usage '
+                                'index %(path)s: %(error)s'),
+                            {'path': path, 'error': e})
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    @property
+    def entries(self):
+        """The entries recorded by this host."""
+        if self._entries is None:
+            self._entries = self._load_file(self.path)
+        return self._entries
+
+    def load(self):
+        """Return the entries recorded by all the hosts."""
+        entries = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith('.json') and path != self.path:
+                entries.update(self._load_file(path))
+        entries.update(self.entries)
+        return entries
+
+    def _save(self):
+        fileutils.ensure_tree(self.directory)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(jsonutils.dumps(self.entries))
+        os.rename(tmp_path, self.path)
+
+    def update(self, entries, keep=None):
+        """Record the given entries and save the index.
+
+        :param entries: dict of instance directory names to (inode,
+                        backing_file) tuples
+        :param keep: if not None, drop the entries of the instance directories
+                     not in this set
+        """
+        current = self.entries
+        changed = False
+        if keep is not None:
+            for name in set(current) - set(keep):
+                del current[name]
+                changed = True
+        for name, (inode, backing_file) in entries.items():
+            entry = {'inode': inode, 'backing_file': backing_file}
+            if current.get(name) != entry:
+                current[name] = entry
+                changed = True
+        if changed:
+            self._save()
+
+    def forget(self, name):
+        """Drop the entry of an instance directory and save the index."""
+        if self.entries.pop(name, None) is not None:
+            self._save()
+
+
 class ImageCacheManager(imagecache.ImageCacheManager):
     def __init__(self):
         super(ImageCacheManager, self).__init__()
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        self._usage_index = None
         self._reset_state()
 
+    def _get_usage_index(self):
+        """Return the usage index, or None if it is disabled."""
+        if not CONF.libvirt.image_cache_usage_index:
+            return None
+        base_dir = os.path.join(CONF.instances_path,
+                                CONF.image_cache_subdirectory_name)
+        if (self._usage_index is None or
+                self._usage_index.directory !=
+                os.path.join(base_dir, USAGE_INDEX_DIR)):
+            self._usage_index = ImageCacheUsageIndex(base_dir, CONF.host)
+        return self._usage_index
+
+    def record_instance(self, instance):
+        """Record the backing file of the disk of a new instance.
+
+        This saves the image cache manager passes from probing the disk.
+        """
+        index = self._get_usage_index()
+        if index is None:
+            return
+        instance_dir = libvirt_utils.get_instance_path(instance)
+        disk_path = os.path.join(instance_dir, 'disk')
+        try:
+            inode = os.stat(disk_path).st_ino
+            backing_file = libvirt_utils.get_disk_backing_file(disk_path)
+            index.update({os.path.basename(instance_dir):
+                          (inode, backing_file)})
+        except (OSError, IOError, processutils.ProcessExecutionError) as e:
+            # Not fatal, the next pass probes the disk instead.
+            LOG.debug('Not recording the backing file of %(path)s in the '
+                      'image cache usage index: %(error)s',
+                      {'path': disk_path, 'error': e}, instance=instance)
+
+    def forget_instance(self, instance):
+        """Drop the entry of a deleted instance from the usage index."""
+        index = self._get_usage_index()
+        if index is None:
+            return
+        instance_dir = libvirt_utils.get_instance_path(instance)
+        try:
+            index.forget(os.path.basename(instance_dir))
+        except (OSError, IOError) as e:
+            LOG.debug('Failed to update the image cache usage index: '
+                      '%(error)s', {'error': e}, instance=instance)
+
     def _reset_state(self):
         """Reset state variables used for each pass."""
 
+        self.pass_started = time.time()
         self.used_images = {}
         self.instance_names = set()
 
@@ -163,9 +347,30 @@ class ImageCacheManager(imagecache.ImageCacheManager):
             else:
                 self._store_swap_image(ent)
 
+    def _get_disk_backing_file(self, ent, disk_path, indexed, probed):
+        """Return the backing file of a disk, from the usage index if the
+        disk has not changed since it was recorded.
+        """
+        if indexed is None:
+            return libvirt_utils.get_disk_backing_file(disk_path)
+        try:
+            inode = os.stat(disk_path).st_ino
+        except OSError:
+            # The disk vanished, let qemu-img report it as usual.
+            return libvirt_utils.get_disk_backing_file(disk_path)
+        entry = indexed.get(ent)
+        if entry and entry.get('inode') == inode:
+            return entry.get('backing_file')
+        backing_file = libvirt_utils.get_disk_backing_file(disk_path)
+        probed[ent] = (inode, backing_file)
+        return backing_file
+
     def _list_backing_images(self):
         """List the backing images currently in use."""
         inuse_images = []
+        index = self._get_usage_index()
+        indexed = index.load() if index else None
+        probed = {}
         for ent in os.listdir(CONF.instances_path):
             if ent in self.instance_names:
                 LOG.debug('%s is a valid instance name', ent)
@@ -173,8 +378,8 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                 if os.path.exists(disk_path):
                     LOG.debug('%s has a disk file', ent)
                     try:
-                        backing_file = libvirt_utils.get_disk_backing_file(
-                            disk_path)
+                        backing_file = self._get_disk_backing_file(
+                            ent, disk_path, indexed, probed)
                     except processutils.ProcessExecutionError:
                         # (for bug 1261442)
                         if not os.path.exists(disk_path):
@@ -204,6 +409,16 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                                         {'instance': ent,
                                          'backing': backing_file})
                             self.unexplained_images.remove(backing_path)
+        if index:
+            if probed:
+                LOG.debug('Probed %(probed)d disks missing from the image '
+                          'cache usage index', {'probed': len(probed)})
+            try:
+                index.update(probed, keep=self.instance_names)
+            except (OSError, IOError) as e:
+                LOG.warning(_LW('Failed to save the image cache usage index '
+                                '%(path)s: %(error)s'),
+                            {'path': index.path, 'error': e})
         return inuse_images
 
     def _find_base_file(self, base_dir, fingerprint):
@@ -244,11 +459,16 @@ class ImageCacheManager(imagecache.ImageCacheManager):
 
         return (True, age)
 
-    def _remove_old_enough_file(self, base_file, maxage, remove_lock=True):
-        """Remove a single swap or base file if it is old enough."""
+    def _remove_old_enough_file(self, base_file, maxage, remove_lock=True,
+                                last_used=None):
+        """Remove a single swap or base file if it is old enough.
+
+        If last_used is given, the file is also kept if it was used since
+        then. Returns whether the file was removed.
+        """
         exists, age = self._get_age_of_file(base_file)
         if not exists:
-            return
+            return False
 
         lock_file = os.path.split(base_file)[-1]
 
@@ -260,7 +480,10 @@ class ImageCacheManager(imagecache.ImageCacheManager):
             # for the lock
             exists, age = self._get_age_of_file(base_file)
             if not exists or age < maxage:
-                return
+                return False
+            if (last_used is not None and
+                    os.path.getmtime(base_file) > last_used):
+                return False
 
             LOG.info(_LI('Removing base or swap file: %s'), base_file)
             try:
@@ -284,12 +507,15 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                               'error was %(error)s'),
                           {'base_file': base_file,
                            'error': e})
+                return False
+            return True
 
+        removed = False
         if age < maxage:
             LOG.info(_LI('Base or swap file too young to remove: %s'),
                          base_file)
         else:
-            _inner_remove_old_enough_file()
+            removed = _inner_remove_old_enough_file()
             if remove_lock:
                 try:
                     # NOTE(jichenjc) The lock file will be constructed first
@@ -304,6 +530,7 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                               'error was %(error)s',
                               {'lock_file': lock_file,
                                'error': e})
+        return removed
 
     def _remove_swap_file(self, base_file):
         """Remove a single swap base file if it is old enough."""
@@ -429,6 +656,77 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         # That's it
         LOG.debug('Verification complete')
 
+    @staticmethod
+    def _get_disk_usage(path):
+        return os.stat(path).st_blocks * 512
+
+    def _get_cache_usage(self, base_dir):
+        """Return the space used by the files of the image cache in bytes."""
+        usage = 0
+        for ent in os.listdir(base_dir):
+            path = os.path.join(base_dir, ent)
+            try:
+                if os.path.isfile(path):
+                    usage += self._get_disk_usage(path)
+            except OSError:
+                # Removed in the meantime
+                pass
+        return usage
+
+    def _evict_base_files(self, base_dir, usage):
+        """Remove unused base and swap files, least recently used first,
+        until the image cache fits in its capacity limits.
+
+        The files are removed whatever their age, but the files in use by
+        instances, or used since the start of the pass, are never removed.
+        """
+        max_size = CONF.libvirt.image_cache_max_size * units.Mi
+        min_free = CONF.libvirt.image_cache_min_free_space * units.Mi
+        excess = 0
+        if max_size:
+            excess = usage - max_size
+        if min_free:
+            st = os.statvfs(base_dir)
+            excess = max(excess, min_free - st.f_bavail * st.f_frsize)
+        if excess <= 0:
+            return
+
+        unused = dict.fromkeys(self.removable_base_files, True)
+        for ent in self.back_swap_images - self.used_swap_images:
+            unused[os.path.join(base_dir, ent)] = False
+        candidates = []
+        for base_file, is_base in unused.items():
+            try:
+                st = os.stat(base_file)
+            except OSError:
+                # Already removed because it was old enough
+                continue
+            if st.st_mtime >= self.pass_started:
+                # Used since the pass listed the images in use, possibly as
+                # the backing file of a disk being created.
+                continue
+            candidates.append((st.st_mtime, base_file, is_base,
+                               st.st_blocks * 512))
+        # The mtime of the files in use is updated on each pass, so it is
+        # the time of their last use.
+        candidates.sort()
+
+        LOG.info(_LI('The image cache exceeds its capacity by %d bytes, '
+                     'evicting unused base files'), excess)
+        for last_used, base_file, is_base, size in candidates:
+            if excess <= 0:
+                break
+            if self._remove_old_enough_file(base_file, 0,
+                                            remove_lock=is_base,
+                                            last_used=last_used):
+                excess -= size
+                STATS.evicted(size)
+                STATS.usage -= size
+        if excess > 0:
+            LOG.warning(_LW('The image cache still exceeds its capacity by '
+                            '%d bytes, the remaining base files are in '
+                            'use'), excess)
+
     def _get_base(self):
 
         # NOTE(mikal): The new scheme for base images is as follows -- an
@@ -465,3 +763,8 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         # perform the aging and image verification
         self._age_and_verify_cached_images(context, all_instances, base_dir)
         self._age_and_verify_swap_images(context, base_dir)
+        # enforce the capacity limits
+        STATS.usage = self._get_cache_usage(base_dir)
+        if self.remove_unused_base_images:
+            self._evict_base_files(base_dir, STATS.usage)
+        LOG.info(_LI('Image cache: %s'), STATS)
@@ -209,7 +209,7 @@ def get_disk_backing_file(path, basename=True, format=None):
 
 def copy_image(src, dest, host=None, receive=False,
                on_execute=None, on_completion=None,
-               compression=True):
+               compression=True, reflink=False):
     """Copy a disk image to an existing directory
 
     :param src: Source image
@@ -220,6 +220,9 @@ def copy_image(src, dest, host=None, receive=False,
     :param on_completion: Callback method to remove pid of process from cache
     :param compression: Allows to use rsync operation with or without
                         compression
+    :param reflink: Clone a local image with a reflink sharing its data
+                    blocks when the filesystem supports it, falling back to
+                    a full copy otherwise
     """
 
     if not host:
@@ -228,7 +231,13 @@ def copy_image(src, dest, host=None, receive=False,
         # rather recreated efficiently.  In addition, since
         # coreutils 8.11, holes can be read efficiently too.
         # we add '-r' argument because ploop disks are directories
-        execute('cp', '-r', src, dest)
+        if reflink:
+            # NOTE: --reflink=auto makes cp do a regular copy when the
+            # filesystem cannot clone the file, such as ext4 or when the
+            # source and destination are on different filesystems.
+            execute('cp', '-r', '--reflink=auto', src, dest)
+        else:
+            execute('cp', '-r', src, dest)
     else:
         if receive:
             src = "%s:%s" % (utils.safe_ip_format(host), src)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Summarize the timeline of instance builds into histograms.
+
+Reads the events of the create instance actions started in the last hours
+from the cell database in [database]/connection of the given configuration
+file, and prints the count, the percentiles and a histogram of the duration
+of each event. The stages of the builds are recorded as events when
+[DEFAULT]/build_timeline is set on the conductor and compute services.
+
+Usage::
+
+    python tools/boot_timeline.py --config-file /etc/nova/nova.conf \\
+        --hours 24
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import datetime
+import sys
+
+from oslo_utils import timeutils
+from sqlalchemy import sql
+
+from nova.compute import instance_actions
+from nova import config
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+
+# Upper bounds of the histogram buckets, in seconds.
+_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+_BAR_WIDTH = 40
+
+
+def _get_durations(since):
+    events = models.InstanceActionEvent.__table__
+    actions = models.InstanceAction.__table__
+    query = sql.select(
+        [events.c.event, events.c.start_time, events.c.finish_time]
+    ).select_from(
+        events.join(actions, events.c.action_id == actions.c.id)
+    ).where(sql.and_(actions.c.action == instance_actions.CREATE,
+                     actions.c.start_time >= since,
+                     events.c.start_time.isnot(None),
+                     events.c.finish_time.isnot(None)))
+    durations = collections.defaultdict(list)
+    for event, start_time, finish_time in (
+            sqlalchemy_api.get_engine().execute(query)):
+        durations[event].append(
+            timeutils.delta_seconds(start_time, finish_time))
+    return durations
+
+
+def _percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def _histogram(values):
+    counts = [0] * (len(_BUCKETS) + 1)
+    for value in values:
+        for i, bound in enumerate(_BUCKETS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = ['<= %ss' % bound for bound in _BUCKETS]
+    labels.append('> %ss' % _BUCKETS[-1])
+    top = max(counts)
+    for label, count in zip(labels, counts):
+        if count:
+            print('  %-9s %6d %s' % (label, count,
+                                      '#' * max(1, count * _BAR_WIDTH // top)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hours', type=float, default=24,
+                        help='Summarize the builds started in the last this '
+                             'many hours.')
+    args, remaining = parser.parse_known_args()
+    config.parse_args(sys.argv[:1] + remaining, init_rpc=False)
+
+    since = timeutils.utcnow() - datetime.timedelta(hours=args.hours)
+    durations = _get_durations(since)
+    if not durations:
+        print('No build events recorded since %s' % since)
+        return
+
+    # List the most frequent events first.
+    for event, values in sorted(durations.items(),
+                                key=lambda item: -len(item[1])):
+        values.sort()
+        print('%s: %d events, p50 %.2fs, p95 %.2fs, max %.2fs' % (
+            event, len(values), _percentile(values, 50),
+            _percentile(values, 95), values[-1]))
+        _histogram(values)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the creation of instance disks from cached base images.
+
+Writes a base image of the given size in the image cache of a scratch
+instances directory, then creates root disks from it with the flat image
+backend of the libvirt driver, as a boot does, with [libvirt]/images_reflink
+disabled and enabled. It reports the time taken to create each disk and the
+space it used on the filesystem.
+
+The directory should be on the filesystem of the instances directory of the
+compute hosts. Reflinks only make a difference on filesystems which support
+them, such as XFS (mkfs.xfs -m reflink=1) and btrfs. qemu-img must be
+installed.
+
+Usage::
+
+    python tools/image_clone_bench.py --directory /var/lib/nova/bench \\
+        --size-gb 20 --runs 3
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from oslo_utils import units
+
+import nova.conf
+from nova import config
+from nova.virt.libvirt import imagebackend
+
+CONF = nova.conf.CONF
+
+
+def _write_base(path, size_gb):
+    # Write actual data, as cp recreates the holes of sparse files without
+    # copying them, which would hide the cost of a full copy.
+    chunk = os.urandom(units.Mi)
+    with open(path, 'wb') as f:
+        for _i in range(size_gb * units.Ki):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _used_bytes(directory):
+    st = os.statvfs(directory)
+    return (st.f_blocks - st.f_bfree) * st.f_frsize
+
+
+def _create_disk(base, target):
+    used = _used_bytes(os.path.dirname(target))
+    start = time.time()
+    image = imagebackend.Flat(path=target)
+    image.create_image(lambda *a, **kw: None, base, None,
+                       image_id='bench')
+    # Include the writeback of the copied data in the measure.
+    with open(target, 'rb') as f:
+        os.fsync(f.fileno())
+    elapsed = time.time() - start
+    return elapsed, _used_bytes(os.path.dirname(target)) - used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--directory', required=True,
+                        help='Scratch directory, on the filesystem of the '
+                             'instances directory.')
+    parser.add_argument('--size-gb', type=int, default=20,
+                        help='Size of the base image in GiB.')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of disks created for each mode.')
+    args, remaining = parser.parse_known_args()
+    config.parse_args(sys.argv[:1] + remaining, init_rpc=False)
+
+    workdir = tempfile.mkdtemp(dir=args.directory)
+    try:
+        CONF.set_override('instances_path', workdir)
+        base_dir = os.path.join(workdir, CONF.image_cache_subdirectory_name)
+        os.makedirs(base_dir)
+        base = os.path.join(base_dir, 'base')
+        print('Writing a %d GiB base image...' % args.size_gb)
+        _write_base(base, args.size_gb)
+
+        print('%-8s %4s %12s %14s' % ('reflink', 'run', 'time (s)',
+                                      'used (MiB)'))
+        for reflink in (False, True):
+            CONF.set_override('images_reflink', reflink, group='libvirt')
+            for run in range(args.runs):
+                disk_dir = os.path.join(workdir, 'instance-%s-%d' % (reflink,
+                                                                    run))
+                os.makedirs(disk_dir)
+                elapsed, used = _create_disk(base,
+                                             os.path.join(disk_dir, 'disk'))
+                print('%-8s %4d %12.2f %14.1f' % (reflink, run, elapsed,
+                                                  float(used) / units.Mi))
+                shutil.rmtree(disk_dir)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Memory and attribute access benchmark for slotted NovaObject storage.
+
+Materializes a large list of objects with the Instance fields, once with the
+default dict-backed storage and once with base.obj_storage_slots(), and
+reports the memory held by the list and the cost of attribute access.
+
+Requires python 3 (tracemalloc).
+
+Usage::
+
+    python tools/object_memory_bench.py --instances 100000
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import timeit
+import tracemalloc
+
+from nova import context
+from nova import objects
+from nova.objects import base
+from nova.tests.unit import fake_instance
+
+
+def _make_classes():
+    instance_fields = dict(objects.Instance.fields)
+
+    @base.NovaObjectRegistry.register_if(False)
+    class DictInstance(base.NovaObject):
+        fields = instance_fields
+
+    @base.NovaObjectRegistry.register_if(False)
+    class SlottedInstance(base.NovaObject):
+        fields = instance_fields
+        __slots__ = base.obj_storage_slots(fields)
+
+    return DictInstance, SlottedInstance
+
+
+def _scalar_values(ctxt):
+    inst = fake_instance.fake_instance_obj(ctxt)
+    return {name: getattr(inst, name) for name in inst.fields
+            if inst.obj_attr_is_set(name) and
+            not isinstance(getattr(inst, name), base.NovaObject)}
+
+
+def _measure(cls, values, count):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [cls(**values) for _i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    obj = objs[0]
+    get_time = min(timeit.repeat(lambda: obj.vm_state, number=100000))
+    set_time = min(timeit.repeat(lambda: setattr(obj, 'vm_state', 'active'),
+                                 number=100000))
+    return after - before, get_time * 10, set_time * 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--instances', type=int, default=100000,
+                        help='Number of objects to materialize.')
+    args = parser.parse_args()
+
+    objects.register_all()
+    values = _scalar_values(context.get_admin_context())
+
+    print('%-16s %14s %14s %14s' % ('storage', 'memory (MiB)',
+                                    'getattr (us)', 'setattr (us)'))
+    for label, cls in zip(('dict', 'slots'), _make_classes()):
+        memory, get_time, set_time = _measure(cls, values, args.instances)
+        print('%-16s %14.1f %14.3f %14.3f' % (
+            label, memory / 1024.0 / 1024.0, get_time, set_time))
+
+
+if __name__ == '__main__':
+    main()
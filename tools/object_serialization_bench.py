@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Microbenchmark for NovaObject RPC (de)serialization.
+
+Compares the NovaObject obj_to_primitive/obj_from_primitive fast paths with
+the generic oslo.versionedobjects implementation for an Instance, an
+InstanceList and a ComputeNode, as they would be sent through
+NovaObjectSerializer.
+
+Usage::
+
+    python tools/object_serialization_bench.py --instances 1000 --repeat 5
+"""
+
+from __future__ import print_function
+
+import argparse
+import contextlib
+import timeit
+
+import mock
+from oslo_versionedobjects import base as ovo_base
+
+from nova import context
+from nova import objects
+from nova.tests.unit import fake_instance
+from nova.tests.unit.objects import test_compute_node
+from nova.tests import uuidsentinel
+
+
+@contextlib.contextmanager
+def _generic_paths():
+    """Route all (de)serialization through oslo.versionedobjects."""
+    generic = ovo_base.VersionedObject.__dict__
+    with mock.patch.object(objects.base.NovaObject, 'obj_to_primitive',
+                           generic['obj_to_primitive']), \
+            mock.patch.object(objects.base.NovaObject, '_obj_from_primitive',
+                              generic['_obj_from_primitive']):
+        yield
+
+
+def _make_objects(ctxt, count):
+    instance = fake_instance.fake_instance_obj(
+        ctxt, expected_attrs=['metadata', 'system_metadata', 'info_cache',
+                              'security_groups'])
+    instances = objects.InstanceList(ctxt, objects=[
+        fake_instance.fake_instance_obj(
+            ctxt, uuid=getattr(uuidsentinel, 'inst%d' % i),
+            expected_attrs=['metadata', 'system_metadata'])
+        for i in range(count)])
+    compute_node = objects.ComputeNode._from_db_object(
+        ctxt, objects.ComputeNode(), test_compute_node.fake_compute_node)
+    return [('Instance', instance),
+            ('InstanceList[%d]' % count, instances),
+            ('ComputeNode', compute_node)]
+
+
+def _time(fn, repeat, number):
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--instances', type=int, default=500,
+                        help='Number of instances in the InstanceList.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timing runs; the best is reported.')
+    parser.add_argument('--number', type=int, default=10,
+                        help='Number of calls per timing run.')
+    args = parser.parse_args()
+
+    objects.register_all()
+    ctxt = context.get_admin_context()
+
+    print('%-22s %-6s %12s %12s %8s' % ('object', 'op', 'base (ms)',
+                                        'nova (ms)', 'speedup'))
+    for name, obj in _make_objects(ctxt, args.instances):
+        primitive = obj.obj_to_primitive()
+        cls = obj.__class__
+        runs = [('to', lambda: obj.obj_to_primitive()),
+                ('from', lambda: cls.obj_from_primitive(primitive))]
+        for op, fn in runs:
+            with _generic_paths():
+                base_time = _time(fn, args.repeat, args.number)
+            nova_time = _time(fn, args.repeat, args.number)
+            print('%-22s %-6s %12.3f %12.3f %7.2fx' % (
+                name, op, base_time * 1000, nova_time * 1000,
+                base_time / nova_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Concurrency benchmark for QuotaEngine.reserve.
+
+Runs a number of threads which all reserve instances, cores and ram in the
+same project through nova.quota.QUOTAS and roll the reservations back, like a
+burst of boot requests would, and reports the throughput and reserve latency
+for each [quota]/usage_shards value.
+
+The database in [database]/connection of the given configuration file is
+used. It should be MySQL or PostgreSQL, as SQLite serializes all writers.
+
+Usage::
+
+    python tools/quota_reserve_bench.py --config-file /etc/nova/nova.conf \\
+        --workers 32 --requests 50 --shards 1 8
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+import threading
+import time
+
+from oslo_utils import uuidutils
+
+import nova.conf
+from nova import config
+from nova import context
+from nova import exception
+from nova import quota
+
+CONF = nova.conf.CONF
+
+
+def _worker(ctxt, requests, latencies, failures):
+    for _i in range(requests):
+        start = time.time()
+        try:
+            reservations = quota.QUOTAS.reserve(ctxt, instances=1, cores=1,
+                                                ram=512)
+        except exception.OverQuota:
+            failures.append(1)
+            continue
+        latencies.append(time.time() - start)
+        quota.QUOTAS.rollback(ctxt, reservations)
+
+
+def _run(workers, requests):
+    ctxt = context.RequestContext(user_id=uuidutils.generate_uuid(),
+                                  project_id=uuidutils.generate_uuid())
+    # Create the usage records up front so they are not part of the run.
+    quota.QUOTAS.rollback(ctxt, quota.QUOTAS.reserve(ctxt, instances=1,
+                                                     cores=1, ram=512))
+    latencies = []
+    failures = []
+    threads = [threading.Thread(target=_worker,
+                                args=(ctxt, requests, latencies, failures))
+               for _i in range(workers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, sorted(latencies), len(failures)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=16,
+                        help='Number of concurrent threads.')
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Number of reservations per thread.')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 8],
+                        help='The [quota]/usage_shards values to compare.')
+    args, remaining = parser.parse_known_args()
+    config.parse_args(sys.argv[:1] + remaining, init_rpc=False)
+    for resource in ('instances', 'cores', 'ram'):
+        CONF.set_override(resource, -1, group='quota')
+
+    print('%-8s %10s %12s %12s %12s %10s' % ('shards', 'req/s', 'p50 (ms)',
+                                             'p95 (ms)', 'p99 (ms)',
+                                             'overquota'))
+    for shards in args.shards:
+        CONF.set_override('usage_shards', shards, group='quota')
+        elapsed, latencies, failures = _run(args.workers, args.requests)
+        print('%-8d %10.1f %12.2f %12.2f %12.2f %10d' % (
+            shards, len(latencies) / elapsed,
+            _percentile(latencies, 50) * 1000,
+            _percentile(latencies, 95) * 1000,
+            _percentile(latencies, 99) * 1000, failures))
+
+
+if __name__ == '__main__':
+    main()